@@ -1,311 +1,403 @@
 
 import argparse
+from copy import deepcopy
+import json
 from lxml import etree as ET
 import ncclient.operations
 import ncclient.transport
 from ncclient import manager
-import socket
-import struct
+import os
+import re
 import sys
+import time
 
+import addressing
+import artifacts # the template cache
+import drivers
+from model import BgpNeighbor, Interface, RouterParams, StaticRoute, VpnParams
+import netconf_pool # borrowing sessions from a running pool
+import orchestrator
+import sessions # inventory and connecting, shared with the pool and the checks
+import test_vpn
+import tracing
+import xpaths
 
-# PE-routers in network
-inventory = {
-    'lund': {
-        'ip': '192.168.1.128',
-        'user': 'cisco',
-        'pass': 'cisco',
-        'type': 'xr',
-        'id': 1
-    },
-    'malmo': {
-        'ip': '192.168.1.133',
-        'user': 'junos',
-        'pass': 'junos123',
-        'type': 'junos',
-        'id': 2
-    },
-    'oslo': {
-        'ip': '192.168.1.127',
-        'user': 'admin',
-        'pass': 'admin',
-        'type': 'ios',
-        'id': 3
-    },
-    'stockholm': {
-        'ip': '192.168.1.132',
-        'user': 'cisco',
-        'pass': 'cisco',
-        'type': 'xr',
-        'id': 4
-    },
-    'sundsvall': {
-        'ip': '192.168.1.131',
-        'user': 'cisco',
-        'pass': 'cisco',
-        'type': 'xr',
-        'id': 5
-    }
+
+# namespace of the layer3vpn yang module, in lxml's {uri}tag notation.
+VPN_NS = '{http://lundnet.com/ns/yang/layer3vpn}'
+
+# PE-routers in network and their drivers, shared with sessions.py
+inventory = sessions.inventory
+driver = sessions.driver
+
+# What provision and delete_vpn.py do at the points where they used to ask. 'ask'
+# still asks on the terminal. See policy_arguments for the command line options.
+POLICY = {
+    'unreachable': 'ask', # or 'skip' the unreachable routers, or 'abort'
+    'commit': 'ask', # or 'yes', 'no' stops before anything is committed
+    # or 'yes', 'no' leaves the confirmed commit to be rolled back. Asked after
+    # the checks have passed.
+    'confirm': 'ask',
+    'confirm_timeout': 600, # seconds before a confirmed commit is rolled back
+    # Check the routers before confirming and roll back if a check fails. Warnings,
+    # e.g. an interface that is down, are only printed. 'strict' rolls back on
+    # warnings too, 'no' doesn't check.
+    'verify': 'yes'
+}
+# The answers that every setting but confirm_timeout can have.
+POLICY_CHOICES = {
+    'unreachable': ['ask', 'skip', 'abort'],
+    'commit': ['ask', 'yes', 'no'],
+    'confirm': ['ask', 'yes', 'no'],
+    'verify': ['yes', 'strict', 'no']
 }
 
-def cidr_to_netmask(cidr):
-    """ Converts from cidr slash notation to address and subnet mask. From
-    http://stackoverflow.com/questions/33750233/convert-cidr-to-subnet-mask-in-python
-    """
-    network, net_bits = cidr.split('/')
-    host_bits = 32 - int(net_bits)
-    netmask = socket.inet_ntoa(struct.pack('!I', (1 << 32) - (1 << host_bits)))
-    return network, netmask
+def layer3vpn_variables(layer3vpn):
+    """Walks one vpn:layer3vpn element a single time and creates router specific
+    configuration parameters for every router in it. Returns a dictionary of
+    model.RouterParams keyed on router name. Routers that are not in inventory are
+    left out."""
+
+    # general parameters
+    general = layer3vpn.find(VPN_NS + 'general')
+    vpn_id = general.findtext(VPN_NS + 'vpn-id')
+    vrf_name = 'VRF_{0}'.format(vpn_id)
+    management_rt = general.findtext(VPN_NS + 'management-rt')
+    management_ip = general.findtext(VPN_NS + 'management-ip')
+    customer_subnet = addressing.customer_net(vpn_id)
+    customer_rt = '100:{0}'.format(vpn_id)
+    vpn = VpnParams(vpn_id, vrf_name, management_rt, management_ip, customer_subnet,
+        customer_rt)
+
+    parameters = {}
+    for router_element in layer3vpn.iterfind('{0}routers/{0}router'.format(VPN_NS)):
+        router = router_element.findtext(VPN_NS + 'router-name')
+        if router not in inventory:
+            continue
+        loopback_address = addressing.loopback(vpn_id, inventory[router]['id'])
+
+        # interface parameters
+        interfaces = []
+        for interface in router_element.iterfind('{0}interfaces/{0}interface'.format(VPN_NS)):
+            interfaces.append(Interface(interface.findtext(VPN_NS + 'int-name'),
+                interface.findtext(VPN_NS + 'address'),
+                interface.findtext(VPN_NS + 'bandwidth')))
+
+        # static routes
+        static_routes = []
+        for route in router_element.iterfind('{0}routing/{0}static/{0}route'.format(VPN_NS)):
+            static_routes.append(StaticRoute(route[0].text, route[1].text))
+
+        # bgp parameters
+        bgp_neighbors = []
+        for neighbor in router_element.iterfind('{0}routing/{0}bgp/{0}neighbor'.format(VPN_NS)):
+            bgp_neighbors.append(BgpNeighbor(neighbor[0].text, neighbor[1].text))
+
+        parameters[router] = RouterParams(vpn, tuple(interfaces), loopback_address,
+            tuple(static_routes), tuple(bgp_neighbors))
+
+    return parameters
+
+def vpn_variables(vpn_parameters):
+    """Creates router specific configuration parameters for every router in
+    vpn_parameters in one pass over the document, instead of searching the whole
+    document once per router like config_variables does. A router has the
+    parameters of one VPN, a document that has a router in more than one
+    vpn:layer3vpn is refused, see batch_routers for adding many VPNs."""
+
+    parameters = {}
+    for layer3vpn in vpn_parameters.iter(VPN_NS + 'layer3vpn'):
+        vpn = layer3vpn_variables(layer3vpn)
+        for router in vpn:
+            if router in parameters:
+                raise ValueError('Router "{0}" is in both VPN {1} and VPN {2}, add them '
+                    'as a batch'.format(router, parameters[router].vpn_id,
+                    vpn[router].vpn_id))
+        parameters.update(vpn)
+    return parameters
+
+def iter_vpn_parameters(source):
+    """Reads the vpn parameters in source, a file name or file object, one
+    vpn:layer3vpn element at a time and yields layer3vpn_variables for it. Every
+    element is cleared when it is done, so memory use doesn't grow with the size
+    of the document."""
+
+    for event, layer3vpn in ET.iterparse(source, tag=VPN_NS + 'layer3vpn'):
+        names = [router.text for router in
+            layer3vpn.iterfind('{0}routers/{0}router/{0}router-name'.format(VPN_NS))]
+        found = inventory.resolve(names)
+        for router in names:
+            if router not in found:
+                print('Warning: Router "{0}" is not in inventory.'.format(router))
+                print('No action taken on router "{0}"'.format(router))
+        yield layer3vpn_variables(layer3vpn)
+        # Removing the element and the ones before it from the tree.
+        layer3vpn.clear()
+        while layer3vpn.getprevious() is not None:
+            del layer3vpn.getparent()[0]
 
 def config_variables(vpn_parameters, router):
     """This function takes the user defined VPN parameters and
     creates router specific configuration parameters."""
 
-    # namespace prefixes used in vpn_parameters
-    nsmap = {
-        'nc': 'urn:ietf:params:xml:ns:netconf:base:1.0',
-        'vpn': 'http://lundnet.com/ns/yang/layer3vpn'
-        }
+    return vpn_variables(vpn_parameters)[router]
 
-    # general parameters
-    vpn_id = vpn_parameters.xpath('//vpn:vpn-id', namespaces=nsmap)[0].text
-    vrf_name = 'VRF_{0}'.format(vpn_id)
-    management_rt = vpn_parameters.xpath('//vpn:management-rt', namespaces=nsmap)[0].text
-    management_ip = vpn_parameters.xpath('//vpn:management-ip', namespaces=nsmap)[0].text
-    loopback_address = '10.0.{0}.{1}/32'.format(vpn_id, str(256-inventory[router]['id']))
-    customer_subnet = '10.0.{0}.0/24'.format(vpn_id)
-    customer_rt = '100:{0}'.format(vpn_id)
+class Template:
+    """A precompiled part of a config template. The invariant XML tree is built
+    once, with {placeholders} in the text of the per-VPN leaves. Rendering copies
+    the tree and fills in the placeholders, which is a lot cheaper than building
+    the tree again with SubElement."""
 
-    # interface parameters
-    interfaces = {}
-    interface_names = vpn_parameters.xpath('''//vpn:router-name[text()='{0}']/../
-        vpn:interfaces/vpn:interface/vpn:int-name'''.format(router), namespaces=nsmap)
-    for interface in interface_names:
-        address = vpn_parameters.xpath('''//vpn:router-name[text()='{0}']/../
-            vpn:interfaces/vpn:interface/vpn:int-name[text()='{1}']/../vpn:address'''.
-                format(router, interface.text), namespaces=nsmap)
-        bandwidth = vpn_parameters.xpath('''//vpn:router-name[text()='{0}']/../
-            vpn:interfaces/vpn:interface/vpn:int-name[text()='{1}']/../vpn:bandwidth'''.
-                format(router, interface.text), namespaces=nsmap)
-        interfaces[interface.text] = {}
-        interfaces[interface.text]['address'] = address[0].text
-        interfaces[interface.text]['bandwidth'] = bandwidth[0].text
+    def __init__(self, element):
+        self.element = element
+        # (path from the root as child indexes, placeholder name if the text is
+        # nothing but one placeholder, text with placeholders)
+        self.slots = []
+        for node in element.iter():
+            if node.text is not None and '{' in node.text:
+                path = []
+                child = node
+                while child is not element:
+                    parent = child.getparent()
+                    path.insert(0, parent.index(child))
+                    child = parent
+                key = re.fullmatch(r'\{(\w+)\}', node.text)
+                if key is not None:
+                    key = key.group(1)
+                self.slots.append((path, key, node.text))
 
-    # static routes
-    static_routes = []
-    routes = vpn_parameters.xpath('''//vpn:router-name[text()='{0}']/../
-        vpn:routing/vpn:static/vpn:route'''.format(router), namespaces=nsmap)
-    for route in routes:
-        static_routes.append((route[0].text, route[1].text))
-
-    # bgp parameters
-    bgp_neighbors = []
-    neighbors = vpn_parameters.xpath('''//vpn:router-name[text()='{0}']/../
-        vpn:routing/vpn:bgp/vpn:neighbor'''.format(router), namespaces=nsmap)
-    for neighbor in neighbors:
-        bgp_neighbors.append((neighbor[0].text, neighbor[1].text))
-
-    config_parameters = {}
-    config_parameters['vpn_id'] = vpn_id
-    config_parameters['vrf_name'] = vrf_name
-    config_parameters['interfaces'] = interfaces 
-    config_parameters['loopback'] = loopback_address
-    config_parameters['management_rt'] = management_rt
-    config_parameters['management_ip'] = management_ip
-    config_parameters['customer_net'] = customer_subnet
-    config_parameters['customer_rt'] = customer_rt
-    config_parameters['static_routes'] = static_routes
-    config_parameters['bgp_neighbors'] = bgp_neighbors
-
-    return config_parameters
+    def render(self, values):
+        """Returns a new tree with the placeholders replaced by the values in the
+        dictionary values, e.g. RouterParams.fields()."""
 
-def junos_template(cfg_param):
-    """This function uses the lxml ElementTree API to create the XML template for
-    Junos. This template is populated with parameters from the dictionary cfg_param."""
+        element = deepcopy(self.element)
+        for path, key, text in self.slots:
+            node = element
+            for index in path:
+                node = node[index]
+            if key is not None:
+                node.text = values[key]
+            else:
+                node.text = text.format_map(values)
+        return element
+
+# Junos template parts
 
+def junos_skeleton():
     NSMAP = {'xc': 'urn:ietf:params:xml:ns:netconf:base:1.0'}
     config = ET.Element('config', nsmap=NSMAP)
     configuration = ET.SubElement(config, 'configuration')
 
-    # interfaces
-    interfaces = ET.SubElement(configuration, 'interfaces')
-    for interface_name in cfg_param['interfaces']:
-        interface = ET.SubElement(interfaces, 'interface')
-        name = ET.SubElement(interface, 'name').text = interface_name
-        unit = ET.SubElement(interface, 'unit')
-        unit_name = ET.SubElement(unit, 'name').text = '0'
-        family = ET.SubElement(unit, 'family')
-        inet = ET.SubElement(family, 'inet')
-        policer = ET.SubElement(inet, 'policer')
-        policer_in = ET.SubElement(policer, 'input').text = 'POLICE_{0}M'.format(
-            cfg_param['interfaces'][interface_name]['bandwidth'])
-        policer_out = ET.SubElement(policer, 'output').text = 'POLICE_{0}M'.format(
-            cfg_param['interfaces'][interface_name]['bandwidth'])
-        address = ET.SubElement(inet, 'address')
-        address_name = ET.SubElement(address, 'name').text = cfg_param['interfaces'][interface_name]['address']
-    
-    # loopback interface
-    loop_interface = ET.SubElement(interfaces, 'interface')
-    loop_name = ET.SubElement(loop_interface, 'name').text = 'lo0'
-    loop_unit = ET.SubElement(loop_interface, 'unit')
-    loop_unit_name = ET.SubElement(loop_unit, 'name').text = cfg_param['vpn_id']
-    loop_family = ET.SubElement(loop_unit, 'family')
-    loop_inet = ET.SubElement(loop_family, 'inet')
-    loop_address = ET.SubElement(loop_inet, 'address')
-    loop_address_name = ET.SubElement(loop_address, 'name').text = cfg_param['loopback']
+    # interfaces, filled in by junos_template
+    ET.SubElement(configuration, 'interfaces')
 
     # creates the policy options part of the config
     policy_options = ET.SubElement(configuration, 'policy-options')
     # prefix list for management ip.
     prefix_list = ET.SubElement(policy_options, 'prefix-list')
-    prefix_list_name = ET.SubElement(prefix_list, 'name').text = 'MANAGEMENT_IP'
+    ET.SubElement(prefix_list, 'name').text = 'MANAGEMENT_IP'
     prefix_list_item = ET.SubElement(prefix_list, 'prefix-list-item')
-    prefix_list_name = ET.SubElement(prefix_list_item, 'name').text = cfg_param['management_ip']
+    ET.SubElement(prefix_list_item, 'name').text = '{management_ip}'
     # prefix list for customer subnet.
     prefix_list = ET.SubElement(policy_options, 'prefix-list')
-    prefix_list_name = ET.SubElement(prefix_list, 'name').text = cfg_param['vrf_name']
+    ET.SubElement(prefix_list, 'name').text = '{vrf_name}'
     prefix_list_item = ET.SubElement(prefix_list, 'prefix-list-item')
-    prefix_list_name = ET.SubElement(prefix_list_item, 'name').text = cfg_param['customer_net']
+    ET.SubElement(prefix_list_item, 'name').text = '{customer_net}'
     # community list for management rt
     community = ET.SubElement(policy_options, 'community')
     ET.SubElement(community, 'name').text = 'MANAGEMENT_RT'
-    ET.SubElement(community, 'members').text = 'target:{0}'.format(cfg_param['management_rt'])
+    ET.SubElement(community, 'members').text = 'target:{management_rt}'
     # community list for customer vrf
     community = ET.SubElement(policy_options, 'community')
-    ET.SubElement(community, 'name').text = cfg_param['vrf_name']
-    ET.SubElement(community, 'members').text = 'target:{0}'.format(cfg_param['customer_rt'])
+    ET.SubElement(community, 'name').text = '{vrf_name}'
+    ET.SubElement(community, 'members').text = 'target:{customer_rt}'
 
     # export policy
-    policy_statement = ET.SubElement(policy_options, 'policy-statement')    
-    policy_name = ET.SubElement(policy_statement, 'name').text = '{0}_EXPORT'.format(
-        cfg_param['vrf_name'])
+    policy_statement = ET.SubElement(policy_options, 'policy-statement')
+    ET.SubElement(policy_statement, 'name').text = '{vrf_name}_EXPORT'
     term_a = ET.SubElement(policy_statement, 'term')
-    term_a_name = ET.SubElement(term_a, 'name').text = 'a'
+    ET.SubElement(term_a, 'name').text = 'a'
     term_a_from = ET.SubElement(term_a, 'from')
     term_a_from_prefix = ET.SubElement(term_a_from, 'prefix-list-filter')
-    term_a_from_prefix_name = ET.SubElement(term_a_from_prefix, 'list_name').text = cfg_param['vrf_name']
-    term_a_from_orlonger = ET.SubElement(term_a_from_prefix, 'orlonger')
+    ET.SubElement(term_a_from_prefix, 'list_name').text = '{vrf_name}'
+    ET.SubElement(term_a_from_prefix, 'orlonger')
     term_a_then = ET.SubElement(term_a, 'then')
     term_a_then_comm = ET.SubElement(term_a_then, 'community')
-    term_a_then_comm_add = ET.SubElement(term_a_then_comm, 'add')
-    term_a_then_comm_name = ET.SubElement(term_a_then_comm, 'community-name').text = 'MANAGEMENT_RT'
-    term_a_then_accept = ET.SubElement(term_a_then, 'accept')
+    ET.SubElement(term_a_then_comm, 'add')
+    ET.SubElement(term_a_then_comm, 'community-name').text = 'MANAGEMENT_RT'
+    ET.SubElement(term_a_then, 'accept')
     term_b = ET.SubElement(policy_statement, 'term')
-    term_b_name = ET.SubElement(term_b, 'name').text = 'b'
+    ET.SubElement(term_b, 'name').text = 'b'
     term_b_then = ET.SubElement(term_b, 'then')
     term_b_then_comm = ET.SubElement(term_b_then, 'community')
-    term_b_then_comm_add = ET.SubElement(term_b_then_comm, 'add')
-    term_b_then_comm_name = ET.SubElement(term_b_then_comm, 'community-name').text = cfg_param['vrf_name']
-    term_b_then_accept = ET.SubElement(term_b_then, 'accept')
+    ET.SubElement(term_b_then_comm, 'add')
+    ET.SubElement(term_b_then_comm, 'community-name').text = '{vrf_name}'
+    ET.SubElement(term_b_then, 'accept')
 
     # import policy
-    policy_statement = ET.SubElement(policy_options, 'policy-statement')    
-    policy_name = ET.SubElement(policy_statement, 'name').text = '{0}_IMPORT'.format(cfg_param['vrf_name'])
+    policy_statement = ET.SubElement(policy_options, 'policy-statement')
+    ET.SubElement(policy_statement, 'name').text = '{vrf_name}_IMPORT'
     term_a = ET.SubElement(policy_statement, 'term')
-    term_a_name = ET.SubElement(term_a, 'name').text = 'a'
+    ET.SubElement(term_a, 'name').text = 'a'
     term_a_from = ET.SubElement(term_a, 'from')
-    term_a_from_protocol = ET.SubElement(term_a_from, 'protocol').text = 'bgp'
-    term_a_from_comm = ET.SubElement(term_a_from, 'community').text = cfg_param['vrf_name']
+    ET.SubElement(term_a_from, 'protocol').text = 'bgp'
+    ET.SubElement(term_a_from, 'community').text = '{vrf_name}'
     term_a_then = ET.SubElement(term_a, 'then')
-    term_a_then_accept = ET.SubElement(term_a_then, 'accept')    
+    ET.SubElement(term_a_then, 'accept')
     term_b = ET.SubElement(policy_statement, 'term')
-    term_b_name = ET.SubElement(term_b, 'name').text = 'b'
+    ET.SubElement(term_b, 'name').text = 'b'
     term_b_from = ET.SubElement(term_b, 'from')
-    term_b_from_protocol = ET.SubElement(term_b_from, 'protocol').text = 'bgp'
-    term_b_from_comm = ET.SubElement(term_b_from, 'community').text = 'MANAGEMENT_RT'
+    ET.SubElement(term_b_from, 'protocol').text = 'bgp'
+    ET.SubElement(term_b_from, 'community').text = 'MANAGEMENT_RT'
     term_b_from_prefix = ET.SubElement(term_b_from, 'prefix-list-filter')
-    term_b_from_prefix_name = ET.SubElement(term_b_from_prefix, 'list_name').text = 'MANAGEMENT_IP'
-    term_b_from_prefix_exact = ET.SubElement(term_b_from_prefix, 'exact')
+    ET.SubElement(term_b_from_prefix, 'list_name').text = 'MANAGEMENT_IP'
+    ET.SubElement(term_b_from_prefix, 'exact')
     term_b_then = ET.SubElement(term_b, 'then')
-    term_b_then_accept = ET.SubElement(term_b_then, 'accept')
+    ET.SubElement(term_b_then, 'accept')
     term_c = ET.SubElement(policy_statement, 'term')
-    term_c_name = ET.SubElement(term_c, 'name').text = 'c'
+    ET.SubElement(term_c, 'name').text = 'c'
     term_c_then = ET.SubElement(term_c, 'then')
-    term_c_then_reject = ET.SubElement(term_c_then, 'reject')
+    ET.SubElement(term_c_then, 'reject')
 
-    # routing instance
+    # routing instance, interfaces and the rest filled in by junos_template
     routing_instances = ET.SubElement(configuration, 'routing-instances')
     instance = ET.SubElement(routing_instances, 'instance')
-    instance_name = ET.SubElement(instance, 'name').text = cfg_param['vrf_name']
-    instance_type = ET.SubElement(instance, 'instance-type').text = 'vrf'
-    for interface_name in cfg_param['interfaces']:
-        interface = ET.SubElement(instance, 'interface')
-        interface_name = ET.SubElement(interface, 'name').text = interface_name
-    interface = ET.SubElement(instance, 'interface')
-    interface_name = ET.SubElement(interface, 'name').text = 'lo0.{0}'.format(cfg_param['vpn_id'])
-    route_distinguisher = ET.SubElement(instance, 'route-distinguisher')
-    rd_type = ET.SubElement(route_distinguisher, 'rd-type').text = '100:{0}'.format(cfg_param['vpn_id'])
-    vrf_import = ET.SubElement(instance, 'vrf-import').text = '{0}_IMPORT'.format(cfg_param['vrf_name'])
-    vrf_export = ET.SubElement(instance, 'vrf-export').text = '{0}_EXPORT'.format(cfg_param['vrf_name'])
+    ET.SubElement(instance, 'name').text = '{vrf_name}'
+    ET.SubElement(instance, 'instance-type').text = 'vrf'
+    return config
+
+def junos_interface_skeleton():
+    interface = ET.Element('interface')
+    ET.SubElement(interface, 'name').text = '{name}'
+    unit = ET.SubElement(interface, 'unit')
+    ET.SubElement(unit, 'name').text = '0'
+    family = ET.SubElement(unit, 'family')
+    inet = ET.SubElement(family, 'inet')
+    policer = ET.SubElement(inet, 'policer')
+    ET.SubElement(policer, 'input').text = 'POLICE_{bandwidth}M'
+    ET.SubElement(policer, 'output').text = 'POLICE_{bandwidth}M'
+    address = ET.SubElement(inet, 'address')
+    ET.SubElement(address, 'name').text = '{address}'
+    return interface
+
+def junos_loopback_skeleton():
+    loop_interface = ET.Element('interface')
+    ET.SubElement(loop_interface, 'name').text = 'lo0'
+    loop_unit = ET.SubElement(loop_interface, 'unit')
+    ET.SubElement(loop_unit, 'name').text = '{vpn_id}'
+    loop_family = ET.SubElement(loop_unit, 'family')
+    loop_inet = ET.SubElement(loop_family, 'inet')
+    loop_address = ET.SubElement(loop_inet, 'address')
+    ET.SubElement(loop_address, 'name').text = '{loopback}'
+    return loop_interface
+
+def junos_instance_interface_skeleton():
+    interface = ET.Element('interface')
+    ET.SubElement(interface, 'name').text = '{name}'
+    return interface
+
+def junos_instance_tail_skeleton():
+    # wrapper element for the siblings that follow the interfaces in the instance
+    tail = ET.Element('tail')
+    interface = ET.SubElement(tail, 'interface')
+    ET.SubElement(interface, 'name').text = 'lo0.{vpn_id}'
+    route_distinguisher = ET.SubElement(tail, 'route-distinguisher')
+    ET.SubElement(route_distinguisher, 'rd-type').text = '100:{vpn_id}'
+    ET.SubElement(tail, 'vrf-import').text = '{vrf_name}_IMPORT'
+    ET.SubElement(tail, 'vrf-export').text = '{vrf_name}_EXPORT'
+    return tail
+
+def junos_route_skeleton():
+    route = ET.Element('route')
+    ET.SubElement(route, 'name').text = '{network}'
+    ET.SubElement(route, 'next-hop').text = '{next_hop}'
+    return route
+
+def junos_bgp_group_skeleton():
+    group = ET.Element('group')
+    ET.SubElement(group, 'name').text = '{vrf_name}_{address}'
+    ET.SubElement(group, 'peer-as').text = '{remote_as}'
+    neighbor = ET.SubElement(group, 'neighbor')
+    ET.SubElement(neighbor, 'name').text = '{address}'
+    return group
+
+JUNOS_CONFIG = Template(junos_skeleton())
+JUNOS_INTERFACE = Template(junos_interface_skeleton())
+JUNOS_LOOPBACK = Template(junos_loopback_skeleton())
+JUNOS_INSTANCE_INTERFACE = Template(junos_instance_interface_skeleton())
+JUNOS_INSTANCE_TAIL = Template(junos_instance_tail_skeleton())
+JUNOS_ROUTE = Template(junos_route_skeleton())
+JUNOS_BGP_GROUP = Template(junos_bgp_group_skeleton())
+
+def junos_template(cfg_param):
+    """This function creates the XML template for Junos from the precompiled
+    template parts. This template is populated with parameters from the
+    model.RouterParams cfg_param."""
+
+    values = cfg_param.fields()
+    config = JUNOS_CONFIG.render(values)
+    configuration = config[0]
+
+    # interfaces
+    interfaces = configuration.find('interfaces')
+    for interface in cfg_param.interfaces:
+        interfaces.append(JUNOS_INTERFACE.render(interface._asdict()))
+    # loopback interface
+    interfaces.append(JUNOS_LOOPBACK.render(values))
+
+    # routing instance
+    instance = configuration.find('routing-instances/instance')
+    for interface in cfg_param.interfaces:
+        instance.append(JUNOS_INSTANCE_INTERFACE.render({'name': interface.name}))
+    instance.extend(list(JUNOS_INSTANCE_TAIL.render(values)))
     # static routes
-    if len(cfg_param['static_routes']) > 0: # zero if no static routes
+    if len(cfg_param.static_routes) > 0: # zero if no static routes
         routing_options = ET.SubElement(instance, 'routing-options')
         static = ET.SubElement(routing_options, 'static')
-        for static_route in cfg_param['static_routes']:
-            route = ET.SubElement(static, 'route')
-            ET.SubElement(route, 'name').text = static_route[0]
-            ET.SubElement(route, 'next-hop').text = static_route[1]
+        for static_route in cfg_param.static_routes:
+            static.append(JUNOS_ROUTE.render(static_route._asdict()))
     # bgp neighbors
-    if len(cfg_param['bgp_neighbors']) > 0: # zero if no bgp neighbors
+    if len(cfg_param.bgp_neighbors) > 0: # zero if no bgp neighbors
         protocols = ET.SubElement(instance, 'protocols')
         bgp = ET.SubElement(protocols, 'bgp')
-        for bgp_neighbor in cfg_param['bgp_neighbors']:
-            group = ET.SubElement(bgp, 'group')
-            ET.SubElement(group, 'name').text = '{0}_{1}'.format(cfg_param['vrf_name'], bgp_neighbor[0])
-            ET.SubElement(group, 'peer-as').text = bgp_neighbor[1]
-            neighbor = ET.SubElement(group, 'neighbor')
-            ET.SubElement(neighbor, 'name').text = bgp_neighbor[0]
-    
-    return config
-
-def xr_template(cfg_param):
-    """This function uses the lxml ElementTree API to create the XML template for
-    XR. This template is populated with parameters from the dictionary cfg_param."""
-
-    # defining namespaces    
-    nsmap_netconf = {'xc': 'urn:ietf:params:xml:ns:netconf:base:1.0'}
-    Cisco_IOS_XR_ifmgr_cfg = {None:'http://cisco.com/ns/yang/Cisco-IOS-XR-ifmgr-cfg'}
-    Cisco_IOS_XR_infra_rsi_cfg = {None:'http://cisco.com/ns/yang/Cisco-IOS-XR-infra-rsi-cfg'}
-    Cisco_IOS_XR_ipv4_io_cfg = {None:'http://cisco.com/ns/yang/Cisco-IOS-XR-ipv4-io-cfg'}
-    Cisco_IOS_XR_ipv4_bgp_cfg = {None:'http://cisco.com/ns/yang/Cisco-IOS-XR-ipv4-bgp-cfg'}
-    Cisco_IOS_XR_ip_static_cfg = {None:'http://cisco.com/ns/yang/Cisco-IOS-XR-ip-static-cfg'}
-    Cisco_IOS_XR_policy_repository_cfg = {None:'http://cisco.com/ns/yang/Cisco-IOS-XR-policy-repository-cfg'}
-
-    config = ET.Element('config', nsmap=nsmap_netconf)
+        for bgp_neighbor in cfg_param.bgp_neighbors:
+            bgp.append(JUNOS_BGP_GROUP.render({'vrf_name': cfg_param.vrf_name,
+                'address': bgp_neighbor.address, 'remote_as': bgp_neighbor.remote_as}))
 
+    return config
 
-    loopback_name = 'Loopback{0}'.format(cfg_param['vpn_id'])
-    cfg_param['interfaces'][loopback_name] = {}
-    cfg_param['interfaces'][loopback_name]['address'] = cfg_param['loopback']
+# XR template parts
 
-    interface_configurations = ET.SubElement(config, 'interface-configurations',
-        nsmap=Cisco_IOS_XR_ifmgr_cfg)
+# defining namespaces
+nsmap_netconf = {'xc': 'urn:ietf:params:xml:ns:netconf:base:1.0'}
+Cisco_IOS_XR_ifmgr_cfg = {None:'http://cisco.com/ns/yang/Cisco-IOS-XR-ifmgr-cfg'}
+Cisco_IOS_XR_infra_rsi_cfg = {None:'http://cisco.com/ns/yang/Cisco-IOS-XR-infra-rsi-cfg'}
+Cisco_IOS_XR_ipv4_io_cfg = {None:'http://cisco.com/ns/yang/Cisco-IOS-XR-ipv4-io-cfg'}
+Cisco_IOS_XR_ipv4_bgp_cfg = {None:'http://cisco.com/ns/yang/Cisco-IOS-XR-ipv4-bgp-cfg'}
+Cisco_IOS_XR_ip_static_cfg = {None:'http://cisco.com/ns/yang/Cisco-IOS-XR-ip-static-cfg'}
+Cisco_IOS_XR_policy_repository_cfg = {None:'http://cisco.com/ns/yang/Cisco-IOS-XR-policy-repository-cfg'}
 
-    # interface config.
+def xr_interface_skeleton(virtual):
     # contains no QoS configuration since XRv 6.1.2 doesn't support it.
-    for interface_name in cfg_param['interfaces']:
-        # convert address from slash notation to separate address and mask:
-        network, netmask = cidr_to_netmask(cfg_param['interfaces'][interface_name]['address'])
-        interface_configuration = ET.SubElement(interface_configurations,
-            'interface-configuration')
-        ET.SubElement(interface_configuration, 'active').text = 'act'
-        ET.SubElement(interface_configuration, 'interface-name').text = interface_name
-        if 'Loopback' in interface_name:
-            ET.SubElement(interface_configuration, 'interface-virtual')
-        ET.SubElement(interface_configuration, 'vrf', nsmap=Cisco_IOS_XR_infra_rsi_cfg
-            ).text = cfg_param['vrf_name']
-        ipv4_network = ET.SubElement(interface_configuration, 'ipv4-network', nsmap=
-            Cisco_IOS_XR_ipv4_io_cfg)
-        addresses = ET.SubElement(ipv4_network, 'addresses')
-        primary = ET.SubElement(addresses, 'primary')
-        ET.SubElement(primary, 'address').text = network
-        ET.SubElement(primary, 'netmask').text = netmask
-
-    rts = [cfg_param['management_rt'],cfg_param['customer_rt']]
-    # vrf configuration
-    vrfs = ET.SubElement(config, 'vrfs', nsmap=Cisco_IOS_XR_infra_rsi_cfg)
+    interface_configuration = ET.Element('interface-configuration')
+    ET.SubElement(interface_configuration, 'active').text = 'act'
+    ET.SubElement(interface_configuration, 'interface-name').text = '{name}'
+    if virtual:
+        ET.SubElement(interface_configuration, 'interface-virtual')
+    ET.SubElement(interface_configuration, 'vrf', nsmap=Cisco_IOS_XR_infra_rsi_cfg
+        ).text = '{vrf_name}'
+    ipv4_network = ET.SubElement(interface_configuration, 'ipv4-network', nsmap=
+        Cisco_IOS_XR_ipv4_io_cfg)
+    addresses = ET.SubElement(ipv4_network, 'addresses')
+    primary = ET.SubElement(addresses, 'primary')
+    ET.SubElement(primary, 'address').text = '{network}'
+    ET.SubElement(primary, 'netmask').text = '{netmask}'
+    return interface_configuration
+
+def xr_vrfs_skeleton():
+    vrfs = ET.Element('vrfs', nsmap=Cisco_IOS_XR_infra_rsi_cfg)
     vrf = ET.SubElement(vrfs, 'vrf')
-    ET.SubElement(vrf, 'vrf-name').text = cfg_param['vrf_name']
+    ET.SubElement(vrf, 'vrf-name').text = '{vrf_name}'
     ET.SubElement(vrf, 'create')
     afs = ET.SubElement(vrf, 'afs')
     af = ET.SubElement(afs, 'af')
@@ -314,45 +406,45 @@ def xr_template(cfg_param):
     ET.SubElement(af, 'topology-name').text = 'default'
     ET.SubElement(af, 'create')
     bgp = ET.SubElement(af, 'bgp', nsmap=Cisco_IOS_XR_ipv4_bgp_cfg)
-    ET.SubElement(bgp, 'import-route-policy').text = '{0}_IMPORT'.format(
-        cfg_param['vrf_name'])
+    ET.SubElement(bgp, 'import-route-policy').text = '{vrf_name}_IMPORT'
     import_route_targets = ET.SubElement(bgp, 'import-route-targets')
     route_targets = ET.SubElement(import_route_targets, 'route-targets')
     route_target = ET.SubElement(route_targets, 'route-target')
     ET.SubElement(route_target, 'type').text = 'as'
-    for rt in rts: 
-        asn, asn_index = rt.split(':')
+    for rt in ['management', 'customer']:
         as_or_four_byte_as = ET.SubElement(route_target, 'as-or-four-byte-as')
         ET.SubElement(as_or_four_byte_as, 'as-xx').text = '0'
-        ET.SubElement(as_or_four_byte_as, 'as').text = asn
-        ET.SubElement(as_or_four_byte_as, 'as-index').text = asn_index
+        ET.SubElement(as_or_four_byte_as, 'as').text = '{%s_asn}' % rt
+        ET.SubElement(as_or_four_byte_as, 'as-index').text = '{%s_asn_index}' % rt
         ET.SubElement(as_or_four_byte_as, 'stitching-rt').text = '0'
-    ET.SubElement(bgp, 'export-route-policy').text = '{0}_EXPORT'.format(
-        cfg_param['vrf_name'])
+    ET.SubElement(bgp, 'export-route-policy').text = '{vrf_name}_EXPORT'
+    return vrfs
 
-    # static routes
-    if len(cfg_param['static_routes']) > 0:
-        router_static = ET.SubElement(config, 'router-static', nsmap=Cisco_IOS_XR_ip_static_cfg)
-        vrfs = ET.SubElement(router_static, 'vrfs')
-        vrf = ET.SubElement(vrfs, 'vrf')
-        ET.SubElement(vrf, 'vrf-name').text = cfg_param['vrf_name']
-        address_family = ET.SubElement(vrf, 'address-family')
-        vrfipv4 = ET.SubElement(address_family, 'vrfipv4')
-        vrf_unicast = ET.SubElement(vrfipv4, 'vrf-unicast')
-        vrf_prefixes = ET.SubElement(vrf_unicast, 'vrf-prefixes')
-        for static_route in cfg_param['static_routes']:    
-            network, pf_length = static_route[0].split('/')
-            vrf_prefix = ET.SubElement(vrf_prefixes, 'vrf-prefix')
-            ET.SubElement(vrf_prefix, 'prefix').text = network
-            ET.SubElement(vrf_prefix, 'prefix-length').text = pf_length
-            vrf_route = ET.SubElement(vrf_prefix, 'vrf-route')
-            vrf_nh_table = ET.SubElement(vrf_route, 'vrf-next-hop-table')
-            vrf_nh_table_nh_address = ET.SubElement(vrf_nh_table,
-                'vrf-next-hop-next-hop-address')
-            ET.SubElement(vrf_nh_table_nh_address, 'next-hop-address').text = static_route[1]
+def xr_router_static_skeleton():
+    router_static = ET.Element('router-static', nsmap=Cisco_IOS_XR_ip_static_cfg)
+    vrfs = ET.SubElement(router_static, 'vrfs')
+    vrf = ET.SubElement(vrfs, 'vrf')
+    ET.SubElement(vrf, 'vrf-name').text = '{vrf_name}'
+    address_family = ET.SubElement(vrf, 'address-family')
+    vrfipv4 = ET.SubElement(address_family, 'vrfipv4')
+    vrf_unicast = ET.SubElement(vrfipv4, 'vrf-unicast')
+    # vrf-prefixes, filled in by xr_template
+    ET.SubElement(vrf_unicast, 'vrf-prefixes')
+    return router_static
 
-    # BGP Config
-    bgp = ET.SubElement(config, 'bgp', nsmap=Cisco_IOS_XR_ipv4_bgp_cfg)
+def xr_route_skeleton():
+    vrf_prefix = ET.Element('vrf-prefix')
+    ET.SubElement(vrf_prefix, 'prefix').text = '{network}'
+    ET.SubElement(vrf_prefix, 'prefix-length').text = '{prefix_length}'
+    vrf_route = ET.SubElement(vrf_prefix, 'vrf-route')
+    vrf_nh_table = ET.SubElement(vrf_route, 'vrf-next-hop-table')
+    vrf_nh_table_nh_address = ET.SubElement(vrf_nh_table,
+        'vrf-next-hop-next-hop-address')
+    ET.SubElement(vrf_nh_table_nh_address, 'next-hop-address').text = '{next_hop}'
+    return vrf_prefix
+
+def xr_bgp_skeleton():
+    bgp = ET.Element('bgp', nsmap=Cisco_IOS_XR_ipv4_bgp_cfg)
     instance = ET.SubElement(bgp, 'instance')
     ET.SubElement(instance, 'instance-name').text = 'default'
     instance_as = ET.SubElement(instance, 'instance-as')
@@ -362,253 +454,898 @@ def xr_template(cfg_param):
     ET.SubElement(four_byte_as, 'bgp-running')
     vrfs = ET.SubElement(four_byte_as, 'vrfs')
     vrf = ET.SubElement(vrfs, 'vrf')
-    ET.SubElement(vrf, 'vrf-name').text = cfg_param['vrf_name']
+    ET.SubElement(vrf, 'vrf-name').text = '{vrf_name}'
     vrf_global = ET.SubElement(vrf, 'vrf-global')
     ET.SubElement(vrf_global, 'exists')
     route_distinguisher = ET.SubElement(vrf_global, 'route-distinguisher')
     ET.SubElement(route_distinguisher, 'type').text = 'as'
     ET.SubElement(route_distinguisher, 'as-xx').text = '0'
     ET.SubElement(route_distinguisher, 'as').text = '100'
-    ET.SubElement(route_distinguisher, 'as-index').text = cfg_param['vpn_id']
+    ET.SubElement(route_distinguisher, 'as-index').text = '{vpn_id}'
     vrf_global_afs = ET.SubElement(vrf_global, 'vrf-global-afs')
     vrf_global_af = ET.SubElement(vrf_global_afs, 'vrf-global-af')
     ET.SubElement(vrf_global_af, 'af-name').text = 'ipv4-unicast'
     ET.SubElement(vrf_global_af, 'enable')
     ET.SubElement(vrf_global_af, 'connected-routes')
     ET.SubElement(vrf_global_af, 'static-routes')
-    vrf_neighbors = ET.SubElement(vrf, 'vrf-neighbors')
-    if len(cfg_param['bgp_neighbors']) > 0:
-        for bgp_neighbor in cfg_param['bgp_neighbors']:
-            vrf_neighbor = ET.SubElement(vrf_neighbors, 'vrf-neighbor')
-            ET.SubElement(vrf_neighbor, 'neighbor-address').text = bgp_neighbor[0]
-            remote_as = ET.SubElement(vrf_neighbor, 'remote-as')
-            ET.SubElement(remote_as, 'as-xx').text = '0'
-            ET.SubElement(remote_as, 'as-yy').text = bgp_neighbor[1]
-            vrf_neighbor_afs = ET.SubElement(vrf_neighbor, 'vrf-neighbor-afs')
-            vrf_neighbor_af = ET.SubElement(vrf_neighbor_afs, 'vrf-neighbor-af')
-            ET.SubElement(vrf_neighbor_af, 'af-name').text = 'ipv4-unicast'
-            ET.SubElement(vrf_neighbor_af, 'activate')
-            ET.SubElement(vrf_neighbor_af, 'route-policy-in').text = 'PASS_ALL'
-            ET.SubElement(vrf_neighbor_af, 'route-policy-out').text = 'PASS_ALL'
-    
+    # vrf-neighbors, filled in by xr_template
+    ET.SubElement(vrf, 'vrf-neighbors')
+    return bgp
+
+def xr_bgp_neighbor_skeleton():
+    vrf_neighbor = ET.Element('vrf-neighbor')
+    ET.SubElement(vrf_neighbor, 'neighbor-address').text = '{address}'
+    remote_as = ET.SubElement(vrf_neighbor, 'remote-as')
+    ET.SubElement(remote_as, 'as-xx').text = '0'
+    ET.SubElement(remote_as, 'as-yy').text = '{remote_as}'
+    vrf_neighbor_afs = ET.SubElement(vrf_neighbor, 'vrf-neighbor-afs')
+    vrf_neighbor_af = ET.SubElement(vrf_neighbor_afs, 'vrf-neighbor-af')
+    ET.SubElement(vrf_neighbor_af, 'af-name').text = 'ipv4-unicast'
+    ET.SubElement(vrf_neighbor_af, 'activate')
+    ET.SubElement(vrf_neighbor_af, 'route-policy-in').text = 'PASS_ALL'
+    ET.SubElement(vrf_neighbor_af, 'route-policy-out').text = 'PASS_ALL'
+    return vrf_neighbor
+
+def xr_routing_policy_skeleton():
     """ Routing policy. Note that sets and route policies are cli commands wrapped in
     xml tags and sensitive to newlines."""
-    routing_policy = ET.SubElement(config, 'routing-policy',
+    routing_policy = ET.Element('routing-policy',
         nsmap=Cisco_IOS_XR_policy_repository_cfg)
     sets = ET.SubElement(routing_policy, 'sets')
     # extcommunity rt sets
     ext_community_rt_sets = ET.SubElement(sets, 'extended-community-rt-sets')
     ext_community_rt_set = ET.SubElement(ext_community_rt_sets, 'extended-community-rt-set')
-    ET.SubElement(ext_community_rt_set, 'set-name').text = cfg_param['vrf_name']
+    ET.SubElement(ext_community_rt_set, 'set-name').text = '{vrf_name}'
     ET.SubElement(ext_community_rt_set, 'rpl-extended-community-rt-set').text = \
-        '''extcommunity-set rt {0}
-        {1}
-        end-set'''.format(cfg_param['vrf_name'],
-            cfg_param['customer_rt'])
+        '''extcommunity-set rt {vrf_name}
+        {customer_rt}
+        end-set'''
     ext_community_rt_set = ET.SubElement(ext_community_rt_sets, 'extended-community-rt-set')
     ET.SubElement(ext_community_rt_set, 'set-name').text = 'MANAGEMENT_RT'
     ET.SubElement(ext_community_rt_set, 'rpl-extended-community-rt-set').text = \
         '''extcommunity-set rt MANAGEMENT_RT
-        {0}
-        end-set'''.format(cfg_param['management_rt'])
+        {management_rt}
+        end-set'''
     # prefix sets
     prefix_sets = ET.SubElement(sets, 'prefix-sets')
     prefix_set = ET.SubElement(prefix_sets, 'prefix-set')
-    ET.SubElement(prefix_set, 'set-name').text = cfg_param['vrf_name']
+    ET.SubElement(prefix_set, 'set-name').text = '{vrf_name}'
     ET.SubElement(prefix_set, 'rpl-prefix-set').text = \
-        '''prefix-set {0}
-        {1} le 32
-        end-set'''.format(cfg_param['vrf_name'],cfg_param['customer_net'])
+        '''prefix-set {vrf_name}
+        {customer_net} le 32
+        end-set'''
     prefix_set = ET.SubElement(prefix_sets, 'prefix-set')
     ET.SubElement(prefix_set, 'set-name').text = 'MANAGEMENT_IP'
     ET.SubElement(prefix_set, 'rpl-prefix-set').text = \
         '''prefix-set MANAGEMENT_IP
-        {0}
-        end-set'''.format(cfg_param['management_ip'])
+        {management_ip}
+        end-set'''
 
     # route policies
     route_policies = ET.SubElement(routing_policy, 'route-policies')
     # vrf export policy
     route_policy = ET.SubElement(route_policies, 'route-policy')
-    ET.SubElement(route_policy, 'route-policy-name').text = '{0}_EXPORT'.format(
-        cfg_param['vrf_name'])
+    ET.SubElement(route_policy, 'route-policy-name').text = '{vrf_name}_EXPORT'
     ET.SubElement(route_policy, 'rpl-route-policy').text = '''
-    route-policy {0}_EXPORT
-        if destination in {1} then
+    route-policy {vrf_name}_EXPORT
+        if destination in {vrf_name} then
             set extcommunity rt MANAGEMENT_RT
         else
-            set extcommunity rt {1}
+            set extcommunity rt {vrf_name}
         endif
     end-policy
-    '''.format(cfg_param['vrf_name'], cfg_param['vrf_name'])
+    '''
     # vrf import policy
     route_policy = ET.SubElement(route_policies, 'route-policy')
-    ET.SubElement(route_policy, 'route-policy-name').text = '{0}_IMPORT'.format(
-        cfg_param['vrf_name'])
+    ET.SubElement(route_policy, 'route-policy-name').text = '{vrf_name}_IMPORT'
     ET.SubElement(route_policy, 'rpl-route-policy').text = '''
-    route-policy {0}_IMPORT
+    route-policy {vrf_name}_IMPORT
         if extcommunity rt matches-every MANAGEMENT_RT and destination in MANAGEMENT_IP then
             pass
         endif
-        if extcommunity rt matches-every {1} then
+        if extcommunity rt matches-every {vrf_name} then
             pass
         endif
     end-policy
-    '''.format(cfg_param['vrf_name'], cfg_param['vrf_name'])
+    '''
+    return routing_policy
+
+XR_INTERFACE = Template(xr_interface_skeleton(virtual=False))
+XR_VIRTUAL_INTERFACE = Template(xr_interface_skeleton(virtual=True))
+XR_VRFS = Template(xr_vrfs_skeleton())
+XR_ROUTER_STATIC = Template(xr_router_static_skeleton())
+XR_ROUTE = Template(xr_route_skeleton())
+XR_BGP = Template(xr_bgp_skeleton())
+XR_BGP_NEIGHBOR = Template(xr_bgp_neighbor_skeleton())
+XR_ROUTING_POLICY = Template(xr_routing_policy_skeleton())
+
+def xr_template(cfg_param):
+    """This function creates the XML template for XR from the precompiled
+    template parts. This template is populated with parameters from the
+    model.RouterParams cfg_param."""
+
+    values = cfg_param.fields()
+    config = ET.Element('config', nsmap=nsmap_netconf)
+
+    interface_configurations = ET.SubElement(config, 'interface-configurations',
+        nsmap=Cisco_IOS_XR_ifmgr_cfg)
+
+    # interface config, the loopback last.
+    loopback = Interface('Loopback{0}'.format(cfg_param.vpn_id), cfg_param.loopback, None)
+    for interface in cfg_param.interfaces + (loopback,):
+        # convert address from slash notation to separate address and mask:
+        network, netmask = addressing.netmask(interface.address)
+        if 'Loopback' in interface.name:
+            template = XR_VIRTUAL_INTERFACE
+        else:
+            template = XR_INTERFACE
+        interface_configurations.append(template.render({'name': interface.name,
+            'vrf_name': cfg_param.vrf_name, 'network': network, 'netmask': netmask}))
+
+    # vrf configuration
+    management_asn, management_asn_index = cfg_param.management_rt.split(':')
+    customer_asn, customer_asn_index = cfg_param.customer_rt.split(':')
+    config.append(XR_VRFS.render({'vrf_name': cfg_param.vrf_name,
+        'management_asn': management_asn, 'management_asn_index': management_asn_index,
+        'customer_asn': customer_asn, 'customer_asn_index': customer_asn_index}))
+
+    # static routes
+    if len(cfg_param.static_routes) > 0:
+        router_static = XR_ROUTER_STATIC.render(values)
+        vrf_prefixes = router_static.find('vrfs/vrf/address-family/vrfipv4/vrf-unicast/vrf-prefixes')
+        for static_route in cfg_param.static_routes:
+            network, pf_length = static_route.network.split('/')
+            vrf_prefixes.append(XR_ROUTE.render({'network': network,
+                'prefix_length': pf_length, 'next_hop': static_route.next_hop}))
+        config.append(router_static)
+
+    # BGP Config
+    bgp = XR_BGP.render(values)
+    vrf_neighbors = bgp.find('instance/instance-as/four-byte-as/vrfs/vrf/vrf-neighbors')
+    for bgp_neighbor in cfg_param.bgp_neighbors:
+        vrf_neighbors.append(XR_BGP_NEIGHBOR.render(bgp_neighbor._asdict()))
+    config.append(bgp)
+
+    # Routing policy
+    config.append(XR_ROUTING_POLICY.render(values))
+
+    return config
+
+# IOS-XE template parts, for the native yang models
+
+Cisco_IOS_XE_native = {None:'http://cisco.com/ns/yang/Cisco-IOS-XE-native'}
+Cisco_IOS_XE_policy = {None:'http://cisco.com/ns/yang/Cisco-IOS-XE-policy'}
+Cisco_IOS_XE_bgp = {None:'http://cisco.com/ns/yang/Cisco-IOS-XE-bgp'}
+
+def ios_skeleton():
+    """The VRF imports the management RT directly, there is no prefix policy like
+    on Junos and XR."""
+    config = ET.Element('config', nsmap=nsmap_netconf)
+    native = ET.SubElement(config, 'native', nsmap=Cisco_IOS_XE_native)
+    # vrf definition
+    vrf = ET.SubElement(native, 'vrf')
+    definition = ET.SubElement(vrf, 'definition')
+    ET.SubElement(definition, 'name').text = '{vrf_name}'
+    ET.SubElement(definition, 'rd').text = '100:{vpn_id}'
+    address_family = ET.SubElement(definition, 'address-family')
+    ipv4 = ET.SubElement(address_family, 'ipv4')
+    route_target = ET.SubElement(ipv4, 'route-target')
+    export = ET.SubElement(route_target, 'export')
+    ET.SubElement(export, 'asn-ip').text = '{customer_rt}'
+    for rt in ['customer_rt', 'management_rt']:
+        import_rt = ET.SubElement(route_target, 'import')
+        ET.SubElement(import_rt, 'asn-ip').text = '{%s}' % rt
+    # interfaces, filled in by ios_template
+    ET.SubElement(native, 'interface')
+    # static routes, filled in by ios_template
+    ip = ET.SubElement(native, 'ip')
+    route = ET.SubElement(ip, 'route')
+    route_vrf = ET.SubElement(route, 'vrf')
+    ET.SubElement(route_vrf, 'name').text = '{vrf_name}'
+    # bgp, neighbors filled in by ios_template
+    router = ET.SubElement(native, 'router')
+    bgp = ET.SubElement(router, 'bgp', nsmap=Cisco_IOS_XE_bgp)
+    ET.SubElement(bgp, 'id').text = '100'
+    bgp_address_family = ET.SubElement(bgp, 'address-family')
+    with_vrf = ET.SubElement(bgp_address_family, 'with-vrf')
+    bgp_ipv4 = ET.SubElement(with_vrf, 'ipv4')
+    ET.SubElement(bgp_ipv4, 'af-name').text = 'unicast'
+    bgp_vrf = ET.SubElement(bgp_ipv4, 'vrf')
+    ET.SubElement(bgp_vrf, 'name').text = '{vrf_name}'
+    ipv4_unicast = ET.SubElement(bgp_vrf, 'ipv4-unicast')
+    redistribute = ET.SubElement(ipv4_unicast, 'redistribute')
+    ET.SubElement(redistribute, 'connected')
+    ET.SubElement(redistribute, 'static')
+    return config
+
+def ios_interface_skeleton(interface_type, policy=True):
+    interface = ET.Element(interface_type)
+    ET.SubElement(interface, 'name').text = '{name}'
+    vrf = ET.SubElement(interface, 'vrf')
+    ET.SubElement(vrf, 'forwarding').text = '{vrf_name}'
+    ip = ET.SubElement(interface, 'ip')
+    address = ET.SubElement(ip, 'address')
+    primary = ET.SubElement(address, 'primary')
+    ET.SubElement(primary, 'address').text = '{network}'
+    ET.SubElement(primary, 'mask').text = '{netmask}'
+    if policy:
+        service_policy = ET.SubElement(interface, 'service-policy', nsmap=Cisco_IOS_XE_policy)
+        ET.SubElement(service_policy, 'input').text = 'POLICE_{bandwidth}M'
+        ET.SubElement(service_policy, 'output').text = 'POLICE_{bandwidth}M'
+    return interface
+
+def ios_route_skeleton():
+    forwarding_list = ET.Element('ip-route-interface-forwarding-list')
+    ET.SubElement(forwarding_list, 'prefix').text = '{network}'
+    ET.SubElement(forwarding_list, 'mask').text = '{netmask}'
+    fwd_list = ET.SubElement(forwarding_list, 'fwd-list')
+    ET.SubElement(fwd_list, 'fwd').text = '{next_hop}'
+    return forwarding_list
+
+def ios_bgp_neighbor_skeleton():
+    neighbor = ET.Element('neighbor')
+    ET.SubElement(neighbor, 'id').text = '{address}'
+    ET.SubElement(neighbor, 'remote-as').text = '{remote_as}'
+    ET.SubElement(neighbor, 'activate')
+    return neighbor
+
+IOS_CONFIG = Template(ios_skeleton())
+IOS_LOOPBACK = Template(ios_interface_skeleton('Loopback', policy=False))
+IOS_ROUTE = Template(ios_route_skeleton())
+IOS_BGP_NEIGHBOR = Template(ios_bgp_neighbor_skeleton())
+# interface templates by interface type, made the first time a type is used
+IOS_INTERFACES = {}
+
+def ios_template(cfg_param):
+    """This function creates the XML template for IOS-XE from the precompiled
+    template parts. This template is populated with parameters from the
+    model.RouterParams cfg_param."""
+
+    config = IOS_CONFIG.render(cfg_param.fields())
+    native = config[0]
+
+    # interfaces
+    interfaces = native.find('interface')
+    for interface in cfg_param.interfaces:
+        interface_type, number = drivers.ios_interface_name(interface.name)
+        if interface_type not in IOS_INTERFACES:
+            IOS_INTERFACES[interface_type] = Template(ios_interface_skeleton(interface_type))
+        network, netmask = addressing.netmask(interface.address)
+        interfaces.append(IOS_INTERFACES[interface_type].render({'name': number,
+            'vrf_name': cfg_param.vrf_name, 'network': network, 'netmask': netmask,
+            'bandwidth': interface.bandwidth}))
+    # loopback interface
+    network, netmask = addressing.netmask(cfg_param.loopback)
+    interfaces.append(IOS_LOOPBACK.render({'name': cfg_param.vpn_id,
+        'vrf_name': cfg_param.vrf_name, 'network': network, 'netmask': netmask}))
+
+    # static routes
+    ip = native.find('ip')
+    if len(cfg_param.static_routes) > 0:
+        route_vrf = ip.find('route/vrf')
+        for static_route in cfg_param.static_routes:
+            network, netmask = addressing.netmask(static_route.network)
+            route_vrf.append(IOS_ROUTE.render({'network': network, 'netmask': netmask,
+                'next_hop': static_route.next_hop}))
+    else:
+        native.remove(ip)
+
+    # bgp neighbors, before the redistribution
+    redistribute = native.find('router/bgp/address-family/with-vrf/ipv4/vrf/ipv4-unicast/'
+        'redistribute')
+    for bgp_neighbor in cfg_param.bgp_neighbors:
+        redistribute.addprevious(IOS_BGP_NEIGHBOR.render(bgp_neighbor._asdict()))
 
     return config
 
-def close_sessions(routers):
+def connect(router, timeout=sessions.CONNECT_TIMEOUT):
+    """Establishes a netconf session to a router in inventory, or borrows one from
+    the netconf pool if the script was told to use a pool."""
+
+    with tracing.span('connect', router):
+        if netconf_pool.address is not None:
+            session = netconf_pool.borrow(router, timeout)
+        else:
+            session = sessions.open_session(router, timeout)
+    if tracing.enabled():
+        session = tracing.TracedSession(session, router)
+    return session
+
+def connect_sessions(routers, timeout=sessions.CONNECT_TIMEOUT):
+    """Establishes netconf sessions to all routers at the same time, see
+    orchestrator.phase. Connecting then takes about as long as the slowest handshake
+    instead of the sum of all of them. The sessions are stored in routers and the
+    routers that could not be reached within timeout seconds are returned, along
+    with the routers of a type that has no driver and the routers that the netconf
+    pool couldn't lend a session for."""
+
+    unreachable = []
+    supported = []
+    for router in routers:
+        if driver(router) is None:
+            print('Router "{0}" is of type {1}, which there is no driver for'.format(
+                router, inventory[router]['type']))
+            unreachable.append(router)
+        else:
+            supported.append(router)
+    if len(supported) == 0:
+        return unreachable
+    # ncclient imports the device handler of a platform the first time a session
+    # uses it, which fails if two threads do it at the same time.
+    for router_type in set(inventory[router]['type'] for router in supported):
+        if drivers.DRIVERS[router_type].device_params is not None:
+            manager.make_device_handler(drivers.DRIVERS[router_type].device_params)
+    # A session that is opened after the router was given up on is closed again.
+    def close_late(router, session):
+        if not isinstance(session, Exception):
+            session.close_session()
+    # ncclient gives up after timeout, the extra second is for the thread to notice.
+    outcomes = orchestrator.run(orchestrator.phase(supported,
+        lambda router: connect(router, timeout), timeout + 1, close_late))
+    for router in supported:
+        if isinstance(outcomes[router], (ncclient.transport.errors.TransportError,
+                ncclient.transport.errors.SessionError, TimeoutError,
+                netconf_pool.PoolError)):
+            if isinstance(outcomes[router], netconf_pool.PoolError):
+                print(outcomes[router]) # e.g. that another client has the router
+            unreachable.append(router)
+        elif isinstance(outcomes[router], Exception):
+            raise outcomes[router]
+        else:
+            routers[router]['session'] = outcomes[router]
+    return unreachable
+
+def close_session(routers, router):
+    """Discards any uncommitted changes on a router and closes its session."""
+
+    try:
+        routers[router]['session'].discard_changes()
+        routers[router]['session'].unlock()
+        routers[router]['session'].close_session()
+        print('Closed session on router {0}'.format(router))
+    except Exception as error:
+        print(error)
+        print('Could not do clean exit on router {0}'.format(router))
+
+def close_sessions(routers, busy=()):
     """If something goes wrong during the configuration change this function
-    attempts to discard any uncommitted changes and close all sessions."""
+    attempts to discard any uncommitted changes and close all sessions. The
+    routers in busy timed out in a phase that is still using their sessions,
+    the phase closes them when it is done, see run_phase."""
 
     print('Closing all sessions')
     for router in routers:
+        if router in busy:
+            print('Router {0} is still busy, its session is closed when it is done'.
+                format(router))
+        else:
+            close_session(routers, router)
+    # The executor threads are waited for when the script exits, so the busy
+    # routers still get their sessions closed.
+    sys.exit('exit')
+
+def run_phase(routers, description, operation, timeout=None):
+    """Runs one phase of the configuration change, operation(router), on all routers
+    at the same time and waits for every router to finish before returning. A phase
+    then takes as long as the slowest router instead of the sum of all routers.
+    If the operation fails or takes longer than timeout seconds, by default
+    orchestrator.PHASE_TIMEOUT, on any router, all sessions are closed."""
+
+    if len(routers) == 0:
+        return
+    if timeout is None:
+        timeout = orchestrator.PHASE_TIMEOUT
+    # The netconf calls made by operation show up under the phase in the trace.
+    def traced(router):
+        with tracing.span(description, router):
+            return operation(router)
+    failed = False
+    outcomes = orchestrator.run(orchestrator.phase(list(routers), traced, timeout,
+        lambda router, outcome: close_session(routers, router)))
+    for router in outcomes:
+        if isinstance(outcomes[router], Exception):
+            print(outcomes[router])
+            print('Something went wrong during {0} on router {1}'.format(
+                description, router))
+            if len(routers[router].get('vpns', [])) > 1:
+                print('VPNs on router {0}: {1}'.format(
+                    router, ', '.join(routers[router]['vpns'])))
+            failed = True
+    if failed:
+        close_sessions(routers, [router for router in outcomes
+            if isinstance(outcomes[router], orchestrator.Timeout)])
+
+def leaves(element):
+    """Returns the tag and value of the leaves directly under element."""
+
+    return [(child.tag, child.text) for child in element if len(child) == 0]
+
+def merge_config(target, source):
+    """Merges the configuration in source into target. Elements with the same tag
+    and the same leaves, e.g. the interfaces container or the lo0 interface, are
+    merged into one. All other elements, e.g. the instance of another VRF, are
+    moved into target as they are."""
+
+    for child in source:
+        if len(child) == 0:
+            continue # leaves of merged elements are the same in both
+        for candidate in target.iterfind(child.tag):
+            if leaves(candidate) == leaves(child):
+                merge_config(candidate, child)
+                break
+        else:
+            target.append(child)
+
+def merge_conflicts(target, source):
+    """Returns the paths of the list entries in source that have the same keys as
+    an entry in target but other leaves, e.g. an XR interface that two VPNs put
+    in different vrfs. merge_config would add them as a second entry with the
+    same keys, which the router only rejects at validate."""
+
+    conflicts = []
+    for child in source:
+        if len(child) == 0:
+            continue
+        for candidate in target.iterfind(child.tag):
+            if leaves(candidate) == leaves(child):
+                conflicts.extend(localname(child) + '/' + path
+                    for path in merge_conflicts(candidate, child))
+                break
+            if identity(candidate) == identity(child):
+                conflicts.append('{0}[{1}]'.format(localname(child), ', '.join(
+                    '{0}={1}'.format(leaf, value) for leaf, value in identity(child))))
+                break
+    return conflicts
+
+def batch_conflicts(batched, cfg_param):
+    """Why the VPN in cfg_param can't be committed together with batched, the
+    cfg_params of the VPNs that a router already has in the batch. An interface
+    can only be in one VPN, and the management prefix and route target are shared
+    by all VPNs on a router, so they have to be the same."""
+
+    conflicts = []
+    for other in batched:
+        for name in cfg_param.interface_names():
+            if name in other.interface_names():
+                conflicts.append('interface {0} is already used by VPN {1}'.format(name,
+                    other.vpn_id))
+        if (cfg_param.management_ip, cfg_param.management_rt) != \
+                (other.management_ip, other.management_rt):
+            conflicts.append('management-ip {0} and management-rt {1} differ from {2} '
+                'and {3} of VPN {4}'.format(cfg_param.management_ip,
+                cfg_param.management_rt, other.management_ip, other.management_rt,
+                other.vpn_id))
+    return conflicts
+
+# Leaves that identify an entry in a list, in addition to the leaves that are
+# called name or end with -name, e.g. vrf-name.
+LIST_KEYS = {
+    'interface-configuration': ['active'],
+    'instance-as': ['as'],
+    'four-byte-as': ['as'],
+    'vrf-prefix': ['prefix', 'prefix-length'],
+    'vrf-route': ['prefix', 'prefix-length'],
+    'vrf-next-hop-next-hop-address': ['next-hop-address'],
+    'vrf-neighbor': ['neighbor-address'],
+    'ip-route-interface-forwarding-list': ['prefix', 'mask'],
+    'fwd-list': ['fwd'],
+    'neighbor': ['id'],
+    'export': ['asn-ip'],
+    'import': ['asn-ip'],
+    'bgp': ['id']
+}
+
+def localname(element):
+    # Junos replies have no namespaces and the templates only have them on the
+    # top XR elements, so tags are compared without namespace.
+    return ET.QName(element).localname
+
+def key_leaves(element):
+    """Returns the leaves that identify element among elements with the same tag.
+    An element without any of the known keys, e.g. a route target, is identified
+    by all of its leaves."""
+
+    keys = LIST_KEYS.get(localname(element), [])
+    leaf_children = [child for child in element if len(child) == 0]
+    identity = [leaf for leaf in leaf_children if localname(leaf) in keys or
+        localname(leaf) == 'name' or localname(leaf).endswith('-name')]
+    if len(identity) == 0:
+        return leaf_children
+    return identity
+
+def identity(element):
+    return [(localname(leaf), (leaf.text or '').strip()) for leaf in key_leaves(element)]
+
+def running_filter(config):
+    """Builds a subtree filter that gets the part of the running configuration
+    that config would change. Key leaves become content match nodes and the other
+    leaves selection nodes."""
+
+    subtree_filter = ET.Element('filter', type='subtree')
+    for element in config:
+        selection = deepcopy(element)
+        for parent in selection.iter():
+            keys = key_leaves(parent)
+            for child in parent:
+                if len(child) == 0 and child not in keys:
+                    child.text = None
+        subtree_filter.append(selection)
+    return subtree_filter
+
+def running_config(session, config):
+    """Gets the running configuration that config would change. Returns the data
+    element of the reply."""
+
+    reply = session.get_config(source='running', filter=running_filter(config))
+    root = ET.fromstring(netconf_pool.reply_to_xml(reply).encode())
+    for element in root.iter():
+        if localname(element) == 'data':
+            return element
+    return root
+
+def config_diff(config, running):
+    """Removes everything from config that is already in running, and entries and
+    containers that have nothing but their keys left. What remains are the changed
+    leaves and the keys on the way to them. Returns config, which has no children
+    if there is nothing to change."""
+
+    keys = key_leaves(config)
+    for child in list(config):
+        if child in keys:
+            continue
+        if len(child) == 0:
+            value = (child.text or '').strip()
+            for candidate in running:
+                if len(candidate) == 0 and localname(candidate) == localname(child) and \
+                        (candidate.text or '').strip() == value:
+                    config.remove(child)
+                    break
+            continue
+        for candidate in running:
+            if localname(candidate) == localname(child) and \
+                    identity(candidate) == identity(child):
+                config_diff(child, candidate)
+                child_keys = key_leaves(child)
+                if all(grandchild in child_keys for grandchild in child):
+                    config.remove(child)
+                break
+    return config
+
+def vpn_routers(vpn_parameters):
+    """Builds the configuration of every router in vpn_parameters. Returns the
+    dictionary that will hold the netconf sessions and config templates."""
+
+    # Getting router names from vpn_parameters and checking if they are in inventory.
+    names = [router.text for router in xpaths.ROUTER_NAMES(vpn_parameters)]
+    found = inventory.resolve(names)
+    for router in names:
+        if router not in found:
+            print('Warning: Router "{0}" is not in inventory.'.format(router))
+            print('No action taken on router "{0}"'.format(router))
+
+    parameters = vpn_variables(vpn_parameters)
+    addressing.check(parameters)
+    return parameter_routers(parameters)
+
+def parameter_routers(parameters):
+    """Builds the configuration from the parameters of every router."""
+
+    routers = {}
+    for router in parameters:
+        # For the checks after the commit.
+        routers[router] = {'parameters': [parameters[router]]}
+        if driver(router) is not None:
+            routers[router]['config'] = artifacts.template(driver(router).template,
+                parameters[router])
+        routers[router]['vpns'] = [parameters[router].vpn_id]
+    return routers
+
+def vpn_conflicts(routers, built):
+    """Why the VPN in built, see parameter_routers, can't join the batch in routers.
+    Has the batch_conflicts of every router that already has other VPNs in the
+    batch, and the merge_conflicts of its templates."""
+
+    conflicts = []
+    for router in built:
+        if router not in routers or \
+                set(built[router]['vpns']) & set(routers[router]['vpns']):
+            continue
+        conflicts.extend('router "{0}": {1}'.format(router, conflict) for conflict
+            in batch_conflicts(routers[router]['parameters'],
+            built[router]['parameters'][0]))
+        if built[router].get('config') is not None:
+            conflicts.extend('router "{0}": conflicting {1}'.format(router, path)
+                for path in merge_conflicts(routers[router]['config'],
+                built[router]['config']))
+    return conflicts
+
+def batch_routers(paths):
+    """Builds the configuration for many vpn parameter files and merges it into one
+    config template per router. The files are read one VPN at a time, so a file
+    can have any number of vpn:layer3vpn elements. A file that can't be built is
+    reported and left out of the batch, as is one with bad addresses, see
+    addressing.check. A VPN that conflicts with the batch on one of its routers,
+    see vpn_conflicts, is left out on all of them. shards.batch_parameters makes
+    its batches here too."""
+
+    routers = {}
+    for path in paths:
         try:
-            routers[router]['session'].discard_changes()
-            routers[router]['session'].unlock()
-            routers[router]['session'].close_session()
-            print('Closed session on router {0}'.format(router))
+            vpns = []
+            for parameters in iter_vpn_parameters(path):
+                addressing.check(parameters)
+                vpns.append(parameter_routers(parameters))
         except Exception as error:
             print(error)
-            print('Could not do clean exit on router {0}'.format(router))
-    sys.exit('exit')
+            print('Could not build VPN from {0}. No action taken for it.'.format(path))
+            continue
+        for built in vpns:
+            conflicts = vpn_conflicts(routers, built)
+            if len(conflicts) > 0:
+                vpn_id = list(built.values())[0]['vpns'][0]
+                for conflict in conflicts:
+                    print('Warning: VPN {0} from {1} conflicts with the batch on {2}'.
+                        format(vpn_id, path, conflict))
+                print('No action taken for VPN {0} from {1}'.format(vpn_id, path))
+                continue
+            for router in built:
+                if router not in routers:
+                    routers[router] = built[router]
+                    continue
+                if set(built[router]['vpns']) & set(routers[router]['vpns']):
+                    print('Warning: VPN {0} from {1} is already in the batch.'.format(
+                        built[router]['vpns'][0], path))
+                    print('No action taken on router "{0}" for it'.format(router))
+                    continue
+                if built[router].get('config') is not None: # None if there is no driver
+                    merge_config(routers[router]['config'], built[router]['config'])
+                routers[router]['vpns'].extend(built[router]['vpns'])
+                routers[router]['parameters'].extend(built[router]['parameters'])
+    return routers
 
-def layer3_vpn(vpn_parameters):
-    # Dictionary that will hold the netconf sessions and config templates.
-    routers = {}
+def parameter_files(paths):
+    """Expands directories in paths to the xml files in them."""
 
-    # namespaces used in vpn_parameters
-    nsmap = {
-        'nc': 'urn:ietf:params:xml:ns:netconf:base:1.0',
-        'vpn': 'http://lundnet.com/ns/yang/layer3vpn'
-        }
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                if name.endswith('.xml'):
+                    files.append(os.path.join(path, name))
+        else:
+            files.append(path)
+    return files
 
-    # Getting router names from vpn_parameters and checking if they are in inventory.
-    for router in vpn_parameters.xpath('//vpn:router-name', namespaces=nsmap):
-        if router.text not in inventory:
-            print('Warning: Router "{0}" is not in inventory.'.format(router.text))
-            print('No action taken on router "{0}"'.format(router.text))
+def verify_commit(routers, timeout=None, strict=False):
+    """Runs the test_vpn.verify checks on the open sessions of all routers at the
+    same time, while the confirmed commit can still be rolled back. Returns True if
+    no check failed on any router, see test_vpn.passed."""
+
+    if timeout is None:
+        timeout = orchestrator.PHASE_TIMEOUT
+    def verify(router):
+        with tracing.span('verify', router):
+            return test_vpn.verify(routers[router]['session'],
+                routers[router]['parameters'], router, time.monotonic() + timeout)
+    passed = True
+    outcomes = orchestrator.run(orchestrator.phase(list(routers), verify, timeout + 1))
+    for router in outcomes:
+        if isinstance(outcomes[router], Exception):
+            print(outcomes[router])
+            print('Could not verify the commit on router {0}'.format(router))
+            passed = False
             continue
-        routers[router.text] = {}
+        test_vpn.print_results(outcomes[router])
+        if not test_vpn.passed(outcomes[router], strict):
+            passed = False
+    return passed
 
-    # Building the configuration XML data.
-    for router in routers:
-        if inventory[router]['type'] == 'junos':
-            config_parameters = config_variables(vpn_parameters, router)
-            routers[router]['config'] = junos_template(config_parameters)
-        if inventory[router]['type'] == 'xr':
-            config_parameters = config_variables(vpn_parameters, router)
-            routers[router]['config'] = xr_template(config_parameters)
+def cancel_commit(routers, policy):
+    """Rolls back the confirmed commit on all routers. A router that can't cancel
+    rolls back by itself when the confirm timeout runs out."""
+
+    def cancel(router):
+        print('Rolling back the commit on router {0}'.format(router))
+        routers[router]['session'].cancel_commit()
+    outcomes = orchestrator.run(orchestrator.phase(list(routers), cancel))
+    for router in outcomes:
+        if isinstance(outcomes[router], Exception):
+            print(outcomes[router])
+            print('Could not roll back on router {0}, it rolls back by itself within {1} '
+                'seconds'.format(router, policy['confirm_timeout']))
+
+def decide(policy, setting, question):
+    """Answers a yes/no question from the policy, or asks it on the terminal if
+    the policy says 'ask'. Skipping unreachable routers counts as yes."""
+
+    if policy[setting] == 'ask':
+        return input(question + ' (yes/[no]): ') == 'yes'
+    print('{0} (yes/[no]): {1} ({2} from policy)'.format(question,
+        'yes' if policy[setting] in ('yes', 'skip') else 'no', policy[setting]))
+    return policy[setting] in ('yes', 'skip')
+
+def layer3_vpn(vpn_parameters, incremental=False, policy=None):
+    provision(vpn_routers(vpn_parameters), incremental, policy)
+
+def layer3_vpn_batch(paths, incremental=False, policy=None):
+    """Adds all VPNs in the parameter files at paths with one edit-config and one
+    commit per router."""
+
+    provision(batch_routers(parameter_files(paths)), incremental, policy)
+
+def provision(routers, incremental=False, policy=None):
+    """Pushes the config templates in routers and commits them. If incremental is
+    True, only the parts of the templates that are not already in the running
+    configuration are pushed. policy decides instead of asking, see POLICY."""
+
+    if policy is None:
+        policy = POLICY
 
     # Establishing netconf sessions
-    unreachable = []
-    for router in routers:
-        # Junos specific device_params argument means that we need this if:
-        if inventory[router]['type'] == 'junos':
-            try:
-                session = manager.connect(host=inventory[router]['ip'],
-                                    username=inventory[router]['user'],
-                                    password=inventory[router]['pass'],
-                                    device_params = {'name':'junos'},
-                                    hostkey_verify=False)
-                routers[router]['session'] = session
-            except ncclient.transport.errors.SSHError:
-                unreachable.append(router)
-        if inventory[router]['type'] == 'xr':
-            try:
-                session = manager.connect(host=inventory[router]['ip'],
-                                        username=inventory[router]['user'],
-                                        password=inventory[router]['pass'],
-                                        hostkey_verify=False)
-                routers[router]['session'] = session
-            except ncclient.transport.errors.SSHError:
-                unreachable.append(router)
+    unreachable = connect_sessions(routers)
 
     # Gives you the option of aborting the script if one or more routers are unreachable.
     if len(unreachable) > 0:
         for router in unreachable:
             print('Router "{0}" not reachable via Netconf'.format(router))
-        decision = input('Do you want to proceed without unreachable routers? (yes/[no]): ')
-        if decision == 'yes':
+        if decide(policy, 'unreachable', 'Do you want to proceed without unreachable routers?'):
             for router in unreachable:
                 print('Removing router "{0}" from sessions.'.format(router))
                 del routers[router]
         else:
             close_sessions(routers)
     
+    # Each phase below runs on all routers at the same time and every router has
+    # to finish a phase before the next phase starts.
+
     # Locking and discarding any pre-existing changes to candidate.
-    for router in routers:
-        try:
-            print('Locking candidate on router {0}'.format(router))
-            routers[router]['session'].lock('candidate')
-            routers[router]['session'].discard_changes()
-        except Exception as error:
-            print(error)
-            print('Something went wrong during locking on router {0}'.format(router))
-            close_sessions(routers)
+    def lock(router):
+        print('Locking candidate on router {0}'.format(router))
+        routers[router]['session'].lock('candidate')
+        routers[router]['session'].discard_changes()
+    run_phase(routers, 'locking', lock)
+
+    # Leaving out what the routers already have.
+    if incremental:
+        def diff(router):
+            running = running_config(routers[router]['session'], routers[router]['config'])
+            config_diff(routers[router]['config'], running)
+        run_phase(routers, 'diff against running', diff)
 
     # Pushing the change to candidate datastore.
-    for router in routers:    
-        try:
-            print('Pushing config to candidate on router {0}'.format(router))
-            routers[router]['session'].edit_config(target='candidate',
-                config=routers[router]['config'])
-        except Exception as error:
-            print(error)
-            print('Something went wrong during edit-config on router {0}'.format(router))
-            close_sessions(routers)
+    def edit_config(router):
+        if len(routers[router]['config']) == 0:
+            print('Router {0} already has the config'.format(router))
+            return
+        print('Pushing config to candidate on router {0}'.format(router))
+        routers[router]['session'].edit_config(target='candidate',
+            config=routers[router]['config'])
+    run_phase(routers, 'edit-config', edit_config)
 
     # Validating the change.
-    for router in routers:
-        try:
-            print('Validating candidate on router {0}'.format(router))
-            routers[router]['session'].validate(source='candidate')
-        except Exception as error:
-            print(error)
-            print('Something went wrong during validate on router {0}'.format(router))
-            close_sessions(routers)
+    def validate(router):
+        print('Validating candidate on router {0}'.format(router))
+        routers[router]['session'].validate(source='candidate')
+    run_phase(routers, 'validate', validate)
 
     # Doing confirmed commit.
-    decision = input('Do 10 minute confirm commit? (yes/[no]): ')
-    if decision == 'yes':
-        for router in routers:
-            try:
-                routers[router]['session'].commit(confirmed=True)
-            except Exception as error:
-                print(error)
-                print('Something went wrong during confirmed commit on router {0}'.format(router))
-                close_sessions(routers)
+    if decide(policy, 'commit', 'Do {0} second confirm commit?'.format(
+            policy['confirm_timeout'])):
+        def confirmed_commit(router):
+            routers[router]['session'].commit(confirmed=True,
+                timeout=str(policy['confirm_timeout']))
+        run_phase(routers, 'confirmed commit', confirmed_commit)
     else:
         close_sessions(routers)
 
-    # Confirming
-    decision = input('Confirm the commit? (yes/[no]): ')
-    if decision == 'yes':
-        for router in routers:
-            try:
-                routers[router]['session'].commit()
-                print('Commit on router {0} successful'.format(router))
-            except Exception as error:
-                print(error)
-                print('Something went wrong during final commit on router {0}'.format(router))
-                close_sessions(routers)
+    # Confirming if the checks pass on the sessions that are already open, or
+    # rolling back if they don't.
+    if policy['verify'] != 'no':
+        print('Verifying the commit')
+        if not verify_commit(routers, strict=policy['verify'] == 'strict'):
+            print('Verification failed')
+            cancel_commit(routers, policy)
+            close_sessions(routers)
+    if decide(policy, 'confirm', 'Confirm the commit?'):
+        def commit(router):
+            routers[router]['session'].commit()
+            print('Commit on router {0} successful'.format(router))
+        run_phase(routers, 'final commit', commit)
     else:
         close_sessions(routers)
 
     # Unlocking candidate and closing the sessions.
     close_sessions(routers)
     
+def policy_arguments(parser):
+    """Adds the options that make the scripts run without asking, see POLICY."""
+
+    parser.add_argument('--policy', dest='policy',
+        help='JSON file with the settings in add_vpn.POLICY')
+    parser.add_argument('-y', '--yes', dest='yes', action='store_true',
+        help='answer yes to every question, i.e. skip unreachable routers, commit and '
+        'confirm')
+    parser.add_argument('-u', '--unreachable', dest='unreachable',
+        choices=POLICY_CHOICES['unreachable'], help='what to do if routers are unreachable')
+    parser.add_argument('--commit', dest='commit', choices=POLICY_CHOICES['commit'],
+        help='whether to commit, no stops after validating')
+    parser.add_argument('--confirm', dest='confirm', choices=POLICY_CHOICES['confirm'],
+        help='whether to confirm the confirmed commit')
+    parser.add_argument('--verify', dest='verify', choices=POLICY_CHOICES['verify'],
+        help='check the routers after the commit and roll back if a check fails, '
+        'strict also on warnings, by default yes')
+    parser.add_argument('--confirm-timeout', dest='confirm_timeout', type=int,
+        help='seconds before a confirmed commit that is not confirmed is rolled back')
+
+def parse_policy(args):
+    """Makes the policy from the --policy file and the options that override it.
+    Exits if the file isn't a JSON object of the settings in POLICY with one of
+    their POLICY_CHOICES, so the scripts stop before they connect to any router."""
+
+    policy = dict(POLICY)
+    if args.policy:
+        with open(args.policy) as policy_file:
+            try:
+                settings = json.load(policy_file)
+            except ValueError as error:
+                sys.exit('{0} is not valid JSON: {1}'.format(args.policy, error))
+        if not isinstance(settings, dict):
+            sys.exit('{0} has to be a JSON object of settings'.format(args.policy))
+        for setting in settings:
+            if setting not in POLICY:
+                sys.exit('Unknown setting "{0}" in {1}'.format(setting, args.policy))
+        policy.update(settings)
+    if args.yes:
+        policy.update({'unreachable': 'skip', 'commit': 'yes', 'confirm': 'yes'})
+    for setting in POLICY:
+        if getattr(args, setting) is not None:
+            policy[setting] = getattr(args, setting)
+    for setting in POLICY_CHOICES:
+        if policy[setting] not in POLICY_CHOICES[setting]:
+            sys.exit('Setting "{0}" is {1}, not one of {2}'.format(setting,
+                json.dumps(policy[setting]), ', '.join(POLICY_CHOICES[setting])))
+    if type(policy['confirm_timeout']) is not int or policy['confirm_timeout'] <= 0:
+        sys.exit('Setting "confirm_timeout" is {0}, not a number of seconds'.format(
+            json.dumps(policy['confirm_timeout'])))
+    return policy
 
 def main():
     parser = argparse.ArgumentParser()
-    parser.add_argument('-c', '--config', dest='config', 
-        help='vpn parameters')
+    parser.add_argument('-c', '--config', dest='config', nargs='+',
+        help='vpn parameters, several files, a file with several VPNs or a directory '
+        'adds them all in one commit')
+    parser.add_argument('-p', '--pool', dest='pool', type=netconf_pool.parse_address,
+        help='borrow sessions from a netconf pool at host:port')
+    parser.add_argument('-i', '--incremental', dest='incremental', action='store_true',
+        help='only push the config that the routers don\'t already have')
+    parser.add_argument('-t', '--trace', dest='trace',
+        help='write timings of every phase and netconf call to this file, see tracing.py')
+    parser.add_argument('--render', dest='render',
+        help='write the config of every router to this directory instead of pushing it')
+    parser.add_argument('--cache', dest='cache',
+        help='keep the generated templates in this directory and reuse them')
+    parser.add_argument('-w', '--workers', dest='workers', type=int,
+        help='split the routers over this many worker processes, see shards.py')
+    policy_arguments(parser)
     args = parser.parse_args()
-    vpn_parameters = ET.parse(args.config) 
-    layer3_vpn(vpn_parameters)
+    policy = parse_policy(args)
+    if args.pool:
+        netconf_pool.use(args.pool)
+    if args.trace:
+        tracing.enable(args.trace)
+    if args.cache:
+        artifacts.use(args.cache)
+    if args.render:
+        artifacts.render(batch_routers(parameter_files(args.config)), args.render)
+        return
+    if args.workers:
+        import shards # imports this module
+        shards.provision(shards.batch_parameters(parameter_files(args.config)), args.workers,
+            args.incremental, policy)
+        return
+    # The files are read one VPN at a time, see iter_vpn_parameters.
+    layer3_vpn_batch(args.config, args.incremental, policy)
 
 
 if __name__ == "__main__":
     main()
-
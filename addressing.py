@@ -0,0 +1,94 @@
+import ipaddress
+
+# The addressing plan of the VPNs and the checks on it. Every VPN has the customer
+# net 10.0.<vpn-id>.0/24, and every router in it a loopback 10.0.<vpn-id>.<256-id>/32
+# in that net, id from inventory. The netmasks and prefix lengths that the
+# templates need are looked up in tables made once, instead of being packed and
+# unpacked for every address.
+
+# netmask in dotted-quad notation by prefix length, and the other way around
+NETMASKS = [str(ipaddress.IPv4Network((0, length)).netmask) for length in range(33)]
+PREFIX_LENGTHS = dict((netmask, length) for length, netmask in enumerate(NETMASKS))
+
+
+def customer_net(vpn_id):
+    return '10.0.{0}.0/24'.format(vpn_id)
+
+def loopback(vpn_id, router_id):
+    return '10.0.{0}.{1}/32'.format(vpn_id, 256 - router_id)
+
+def netmask(cidr):
+    """Converts from slash notation to address and netmask, e.g. 10.0.134.0/31 to
+    10.0.134.0 and 255.255.255.254."""
+
+    address, prefix_length = cidr.split('/')
+    return address, NETMASKS[int(prefix_length)]
+
+def interface_network(cidr):
+    """The network of an interface address in slash notation. Raises ValueError
+    if it isn't one."""
+
+    if '/' not in cidr:
+        raise ValueError('{0} is not in x.x.x.x/y notation'.format(cidr))
+    return ipaddress.IPv4Interface(cidr).network
+
+def check(parameters):
+    """Checks the addresses in parameters, the model.RouterParams by router that
+    add_vpn.vpn_variables makes, in one pass over all routers. The interfaces and
+    loopbacks have to be in the customer net of their VPN and must not overlap
+    each other, on any router in the VPN. The static routes and bgp neighbors have
+    to be valid addresses. Raises ValueError with every problem found, so that a
+    VPN with bad addresses is rejected before a session is opened."""
+
+    errors = []
+    # (first address, last address, what it is) as integers, by vpn id
+    subnets = {}
+    for router in sorted(parameters):
+        cfg_param = parameters[router]
+        try:
+            customer = ipaddress.IPv4Network(cfg_param.customer_net)
+        except ValueError as error:
+            errors.append('VPN {0} has no customer net: {1}'.format(cfg_param.vpn_id, error))
+            continue
+        addresses = [('interface ' + interface.name, interface.address)
+            for interface in cfg_param.interfaces]
+        addresses.append(('loopback', cfg_param.loopback))
+        for name, address in addresses:
+            where = '{0} {1} on router "{2}"'.format(name, address, router)
+            try:
+                network = interface_network(address)
+            except ValueError as error:
+                errors.append('{0} is not a valid address: {1}'.format(where, error))
+                continue
+            if not network.subnet_of(customer):
+                errors.append('{0} is not in the customer net {1}'.format(where, customer))
+            subnets.setdefault(cfg_param.vpn_id, []).append((int(network.network_address),
+                int(network.broadcast_address), where))
+        for static_route in cfg_param.static_routes:
+            try:
+                if '/' not in static_route.network:
+                    raise ValueError('not in x.x.x.x/y notation')
+                ipaddress.IPv4Network(static_route.network)
+                ipaddress.IPv4Address(static_route.next_hop)
+            except ValueError as error:
+                errors.append('static route {0} via {1} on router "{2}" is not valid: {3}'.
+                    format(static_route.network, static_route.next_hop, router, error))
+        for bgp_neighbor in cfg_param.bgp_neighbors:
+            try:
+                ipaddress.IPv4Address(bgp_neighbor.address)
+            except ValueError as error:
+                errors.append('bgp neighbor {0} on router "{1}" is not valid: {2}'.format(
+                    bgp_neighbor.address, router, error))
+
+    # Sorted on the first address, a subnet overlaps an earlier one if it starts
+    # before the furthest end so far.
+    for vpn_id in subnets:
+        furthest = None
+        for first, last, where in sorted(subnets[vpn_id]):
+            if furthest is not None and first <= furthest[0]:
+                errors.append('{0} overlaps {1}'.format(where, furthest[1]))
+            if furthest is None or last > furthest[0]:
+                furthest = (last, where)
+
+    if len(errors) > 0:
+        raise ValueError('\n'.join(errors))
@@ -0,0 +1,60 @@
+import hashlib
+import json
+from lxml import etree as ET
+import os
+
+# Part of the key of every artifact. Raise it when a template generator changes
+# what it makes, so that artifacts made by the old generator are not used.
+GENERATOR_VERSION = 2
+
+# Directory of the artifact cache. Set by use() in the scripts, None means that
+# the templates are generated every time.
+directory = None
+
+
+def use(cache_directory):
+    global directory
+    os.makedirs(cache_directory, exist_ok=True)
+    directory = cache_directory
+
+def key(generator, cfg_param):
+    """Content hash of the parameters that generator makes a template from. The
+    model.RouterParams are named tuples, which json writes as nested lists."""
+
+    content = json.dumps({'generator': generator.__name__, 'version': GENERATOR_VERSION,
+        'parameters': cfg_param}, sort_keys=True)
+    return hashlib.sha256(content.encode()).hexdigest()
+
+def template(generator, cfg_param):
+    """Returns generator(cfg_param), e.g. add_vpn.junos_template(cfg_param). If
+    there is a cache, a template made from the same parameters before is read
+    from it instead, and a new one is stored in it."""
+
+    if directory is None:
+        return generator(cfg_param)
+    path = os.path.join(directory, key(generator, cfg_param) + '.xml')
+    if os.path.exists(path):
+        return ET.parse(path).getroot()
+    artifact = ET.tostring(generator(cfg_param))
+    # Written under another name first, so that another run never reads half a file.
+    partial = '{0}.{1}'.format(path, os.getpid())
+    with open(partial, 'wb') as output:
+        output.write(artifact)
+    os.replace(partial, path)
+    # Parsed again, like the ones read from the cache. The children of the XR
+    # elements with a default namespace only get that namespace when parsed, and
+    # merge_config has to find the same tags in all templates of a router.
+    return ET.fromstring(artifact)
+
+def render(routers, render_directory):
+    """Writes the config in routers to <router>.xml in render_directory instead of
+    sending it to the routers."""
+
+    os.makedirs(render_directory, exist_ok=True)
+    for router in sorted(routers):
+        if routers[router].get('config') is None:
+            continue # no driver for the type of router
+        path = os.path.join(render_directory, router + '.xml')
+        with open(path, 'wb') as output:
+            output.write(ET.tostring(routers[router]['config'], pretty_print=True))
+        print('Wrote config for router {0} to {1}'.format(router, path))
@@ -0,0 +1,242 @@
+import argparse
+import ipaddress
+import itertools
+import json
+from lxml import etree as ET
+import platform
+import sys
+import time
+import tracemalloc
+
+import add_vpn
+import addressing
+import delete_vpn
+
+# Fraction a stage may get slower than the baseline before it counts as a regression.
+TOLERANCE = 0.2
+
+# Interface names by router type, the way the platform names its ports.
+INTERFACE_NAMES = {
+    'junos': 'ge-0/0/{0}',
+    'xr': 'GigabitEthernet0/0/0/{0}',
+    'ios': 'GigabitEthernet{1}' # numbered from 1
+}
+
+def synthetic_parameters(routers, interfaces, routes, neighbors, vpn_id=134, types=None):
+    """Creates a vpn-parameters document, in the same format as vpn-parameters.xml,
+    with the given number of routers and the given number of interfaces, static
+    routes and bgp neighbors on every router. The routers are named pe1, pe2, ...
+    and are added to the inventory with the type in types, a dictionary keyed on
+    router name, by default every other one as junos and xr. The interfaces are
+    named like that type names them. Open an inventory with
+    add_vpn.inventory.open(':memory:') first to keep them out of the inventory
+    database.
+
+    The interfaces are /31 links numbered from the start of the customer net. A
+    VPN with more links than fit below the loopbacks runs past it, and doesn't
+    pass addressing.check."""
+
+    nc = 'urn:ietf:params:xml:ns:netconf:base:1.0'
+    vpn = 'http://lundnet.com/ns/yang/layer3vpn'
+    data = ET.Element('{%s}data' % nc, nsmap={'nc': nc})
+    layer3vpn = ET.SubElement(data, '{%s}layer3vpn' % vpn, nsmap={'vpn': vpn})
+    general = ET.SubElement(layer3vpn, '{%s}general' % vpn)
+    ET.SubElement(general, '{%s}description' % vpn).text = 'Benchmark VPN'
+    ET.SubElement(general, '{%s}vpn-id' % vpn).text = str(vpn_id)
+    ET.SubElement(general, '{%s}management-ip' % vpn).text = '172.16.1.1/32'
+    ET.SubElement(general, '{%s}management-rt' % vpn).text = '100:999'
+    routers_element = ET.SubElement(layer3vpn, '{%s}routers' % vpn)
+    customer = int(ipaddress.IPv4Network(addressing.customer_net(vpn_id)).network_address)
+    inventory = {}
+    for number in range(1, routers + 1):
+        name = 'pe{0}'.format(number)
+        if types is None:
+            router_type = 'junos' if number % 2 else 'xr'
+        else:
+            router_type = types[name]
+        inventory[name] = {
+            'ip': '127.0.0.1',
+            'user': 'benchmark',
+            'pass': 'benchmark',
+            'type': router_type,
+            'id': number
+        }
+        router = ET.SubElement(routers_element, '{%s}router' % vpn)
+        ET.SubElement(router, '{%s}router-name' % vpn).text = name
+        # the address of the first link of the router and its peer
+        first = customer + 2 * (number - 1) * interfaces
+        interfaces_element = ET.SubElement(router, '{%s}interfaces' % vpn)
+        for index in range(interfaces):
+            interface = ET.SubElement(interfaces_element, '{%s}interface' % vpn)
+            ET.SubElement(interface, '{%s}int-name' % vpn).text = \
+                INTERFACE_NAMES[router_type].format(index, index + 1)
+            ET.SubElement(interface, '{%s}address' % vpn).text = '{0}/31'.format(
+                ipaddress.IPv4Address(first + 2 * index))
+            ET.SubElement(interface, '{%s}bandwidth' % vpn).text = '100'
+        routing = ET.SubElement(router, '{%s}routing' % vpn)
+        static = ET.SubElement(routing, '{%s}static' % vpn)
+        for index in range(routes):
+            route = ET.SubElement(static, '{%s}route' % vpn)
+            ET.SubElement(route, '{%s}network' % vpn).text = '192.{0}.{1}.0/24'.format(
+                index // 256, index % 256)
+            ET.SubElement(route, '{%s}next-hop' % vpn).text = str(
+                ipaddress.IPv4Address(first + 1))
+        bgp = ET.SubElement(routing, '{%s}bgp' % vpn)
+        for index in range(neighbors):
+            neighbor = ET.SubElement(bgp, '{%s}neighbor' % vpn)
+            ET.SubElement(neighbor, '{%s}address' % vpn).text = str(
+                ipaddress.IPv4Address(first + 2 * index + 1))
+            ET.SubElement(neighbor, '{%s}remote-as' % vpn).text = str(4200000000 + index)
+    add_vpn.inventory.update(inventory)
+    return ET.tostring(data)
+
+def measure(stage, repeat, setup=lambda: None):
+    """Runs stage(setup()) repeat times, setup is not timed. Returns the fastest
+    run in seconds and the peak memory allocated during one run in bytes.
+
+    The memory is what tracemalloc sees, i.e. Python objects. Memory that libxml2
+    allocates for the trees themselves is not included."""
+
+    seconds = None
+    for attempt in range(repeat):
+        data = setup()
+        start = time.perf_counter()
+        stage(data)
+        elapsed = time.perf_counter() - start
+        if seconds is None or elapsed < seconds:
+            seconds = elapsed
+    # Memory is measured in a separate run since tracemalloc slows things down.
+    data = setup()
+    tracemalloc.start()
+    stage(data)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {'seconds': seconds, 'peak_bytes': peak}
+
+def check_addresses(parameters):
+    """addressing.check on the synthetic VPN. A large one doesn't fit in its
+    customer net, then this includes the cost of reporting every problem."""
+
+    try:
+        addressing.check(parameters)
+    except ValueError:
+        pass
+
+def run(routers, interfaces, routes, neighbors, repeat):
+    """Measures every config generation stage for one document size."""
+
+    document = synthetic_parameters(routers, interfaces, routes, neighbors)
+    vpn_parameters = ET.ElementTree(ET.fromstring(document))
+    parameters = add_vpn.vpn_variables(vpn_parameters)
+    junos_configs = [add_vpn.junos_template(parameters[router]) for router in parameters]
+    xr_configs = [add_vpn.xr_template(parameters[router]) for router in parameters]
+
+    stages = {}
+    stages['parse'] = measure(lambda data: ET.fromstring(document), repeat)
+    stages['config_variables'] = measure(lambda data: add_vpn.vpn_variables(vpn_parameters),
+        repeat)
+    stages['addressing'] = measure(lambda data: check_addresses(parameters), repeat)
+    # Every router gets every template, regardless of its type in inventory.
+    stages['junos_template'] = measure(lambda data: [add_vpn.junos_template(parameters[router])
+        for router in parameters], repeat)
+    stages['xr_template'] = measure(lambda data: [add_vpn.xr_template(parameters[router])
+        for router in parameters], repeat)
+    stages['ios_template'] = measure(lambda data: [add_vpn.ios_template(parameters[router])
+        for router in parameters], repeat)
+    stages['junos_delete_template'] = measure(lambda data: [
+        delete_vpn.junos_delete_template(parameters[router]) for router in parameters], repeat)
+    stages['xr_delete_template'] = measure(lambda data: [
+        delete_vpn.xr_delete_template(parameters[router]) for router in parameters], repeat)
+    stages['ios_delete_template'] = measure(lambda data: [
+        delete_vpn.ios_delete_template(parameters[router]) for router in parameters], repeat)
+    # Payload size of the generated configuration, for reference.
+    payload = sum(len(ET.tostring(config)) for config in junos_configs + xr_configs)
+    delete_configs = [delete_vpn.junos_delete_template(parameters[router])
+        for router in parameters] + [delete_vpn.xr_delete_template(parameters[router])
+        for router in parameters]
+    delete_payload = sum(len(ET.tostring(config)) for config in delete_configs)
+
+    return {
+        'routers': routers,
+        'interfaces': interfaces,
+        'routes': routes,
+        'neighbors': neighbors,
+        'payload_bytes': payload,
+        'delete_payload_bytes': delete_payload,
+        'stages': stages
+    }
+
+def compare(results, baseline, tolerance=TOLERANCE):
+    """Returns a description of every stage that is more than tolerance slower
+    than the same stage and document size in baseline."""
+
+    regressions = []
+    def size(result):
+        return (result['routers'], result['interfaces'], result['routes'], result['neighbors'])
+    previous = {}
+    for result in baseline['results']:
+        previous[size(result)] = result
+    for result in results:
+        if size(result) not in previous:
+            continue
+        for stage in result['stages']:
+            if stage not in previous[size(result)]['stages']:
+                continue
+            now = result['stages'][stage]['seconds']
+            before = previous[size(result)]['stages'][stage]['seconds']
+            if now > before * (1 + tolerance):
+                regressions.append('{0} with {1} routers, {2} interfaces, {3} routes, '
+                    '{4} neighbors: {5:.4f}s -> {6:.4f}s'.format(stage, *size(result),
+                    before, now))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description='Measures config generation '
+        'for synthetic VPNs. Runs offline, no routers needed.')
+    parser.add_argument('-n', '--routers', dest='routers', type=int, nargs='+',
+        default=[10, 100, 1000], help='number of routers')
+    parser.add_argument('-m', '--interfaces', dest='interfaces', type=int, nargs='+',
+        default=[2], help='interfaces per router')
+    parser.add_argument('-k', '--routes', dest='routes', type=int, nargs='+',
+        default=[2], help='static routes per router')
+    parser.add_argument('-j', '--neighbors', dest='neighbors', type=int, nargs='+',
+        default=[1], help='bgp neighbors per router')
+    parser.add_argument('-r', '--repeat', dest='repeat', type=int, default=3,
+        help='runs per stage, the fastest one is reported')
+    parser.add_argument('-o', '--output', dest='output',
+        help='write the results as JSON to this file instead of stdout')
+    parser.add_argument('-b', '--baseline', dest='baseline',
+        help='earlier results to check for regressions against')
+    parser.add_argument('-t', '--tolerance', dest='tolerance', type=float,
+        default=TOLERANCE, help='allowed slowdown against the baseline, 0.2 is 20%%')
+    args = parser.parse_args()
+
+    # The synthetic routers are only kept in memory.
+    add_vpn.inventory.open(':memory:')
+    results = []
+    for size in itertools.product(args.routers, args.interfaces, args.routes, args.neighbors):
+        print('Benchmarking {0} routers, {1} interfaces, {2} routes, {3} neighbors'.format(
+            *size), file=sys.stderr)
+        results.append(run(*size, repeat=args.repeat))
+    report = {
+        'python': platform.python_version(),
+        'lxml': '.'.join(str(part) for part in ET.LXML_VERSION),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'results': results
+    }
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(report, output, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    if args.baseline:
+        with open(args.baseline) as baseline:
+            regressions = compare(results, json.load(baseline), args.tolerance)
+        for regression in regressions:
+            print('Regression: ' + regression, file=sys.stderr)
+        if len(regressions) > 0:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -1,130 +1,409 @@
 import argparse
 from lxml import etree as ET
-import ncclient.operations
-import ncclient.transport
-from ncclient import manager
-import socket
-import struct
 import sys
 
 import add_vpn # importing the script that adds a vpn
-
-# PE-routers in network
-inventory = {
-    'lund': {
-        'ip': '192.168.1.128',
-        'user': 'cisco',
-        'pass': 'cisco',
-        'type': 'xr',
-        'id': 1
-    },
-    'malmo': {
-        'ip': '192.168.1.133',
-        'user': 'junos',
-        'pass': 'junos123',
-        'type': 'junos',
-        'id': 2
-    },
-    'oslo': {
-        'ip': '192.168.1.127',
-        'user': 'admin',
-        'pass': 'admin',
-        'type': 'ios',
-        'id': 3
-    },
-    'stockholm': {
-        'ip': '192.168.1.132',
-        'user': 'cisco',
-        'pass': 'cisco',
-        'type': 'xr',
-        'id': 4
-    },
-    'sundsvall': {
-        'ip': '192.168.1.131',
-        'user': 'cisco',
-        'pass': 'cisco',
-        'type': 'xr',
-        'id': 5
-    }
-}
-
-def delete_junos(config):
-    """Modifies the template to make it delete a vpn instead of adding. This entails
-    adding the operation=delete, or operation=remove, attribute at key locations in the 
-    template to override the default merge behavior. Deletion must be done deep enough
-    into the XML tree in order to not make unwanted deletions. E.g. deletion at the
-    interfaces tag will remove all interfaces on the router which is not what we want.
-
-    Delete operation deletes configuration, but if the config is not found, router returns
-    error. Remove operation also deletes configuration, but if the config is not found,
-    router still returns OK. Remove operation seems most appropriate because we then avoid 
-    error if someone has manually removed some part of the template already."""
-
-    # Get customer VRF name
-    vrf_name = config.xpath('//routing-instances/instance/name')[0].text
-
-    # Deleting the logical interfaces ("units" in Junos parlance)
-    for unit in config.xpath('/config/configuration/interfaces/interface/unit'):
-        unit.attrib['{urn:ietf:params:xml:ns:netconf:base:1.0}operation'] = 'remove'
-    
-    # Deleting customer subnet prefix list.
-    for prefix in config.xpath('''/config/configuration/policy-options/prefix-list/
-            name[text()='{0}']/..'''.format(vrf_name)):
-        prefix.attrib['{urn:ietf:params:xml:ns:netconf:base:1.0}operation'] = 'remove'
-    
-    # Deleting customer rt list.
-    for comm in config.xpath('''/config/configuration/policy-options/community/
-            name[text()='{0}']/..'''.format(vrf_name)):
-        comm.attrib['{urn:ietf:params:xml:ns:netconf:base:1.0}operation'] = 'remove'
-
-    # Deleting policy statements
-    for policy in config.xpath('/config/configuration/policy-options/policy-statement'):
-        policy.attrib['operation'] = 'remove'
-
-    # Deleting routing instance
-    for instance in config.xpath('/config/configuration/routing-instances/instance'):
-        instance.attrib['operation'] = 'remove'
-
+import addressing
+import artifacts
+import drivers
+from model import Interface, RouterParams, StaticRoute, VpnParams
+import netconf_pool
+import tracing
+import xpaths
+
+# PE-routers in network, shared with add_vpn.py
+inventory = add_vpn.inventory
+
+# Delete templates. Only the keys of what is removed are sent, with the
+# operation=remove attribute at key locations to override the default merge
+# behavior. Deletion must be done deep enough into the XML tree in order to not
+# make unwanted deletions. E.g. deletion at the interfaces tag will remove all
+# interfaces on the router which is not what we want.
+#
+# Delete operation deletes configuration, but if the config is not found, router
+# returns error. Remove operation also deletes configuration, but if the config is
+# not found, router still returns OK. Remove operation seems most appropriate
+# because we then avoid error if someone has manually removed some part of the
+# template already.
+
+REMOVE = '{urn:ietf:params:xml:ns:netconf:base:1.0}operation'
+
+def junos_delete_skeleton():
+    config = ET.Element('config', nsmap=add_vpn.nsmap_netconf)
+    configuration = ET.SubElement(config, 'configuration')
+
+    # logical interfaces ("units" in Junos parlance), filled in by junos_delete_template
+    ET.SubElement(configuration, 'interfaces')
+
+    # customer subnet prefix list, customer rt list and policy statements.
+    policy_options = ET.SubElement(configuration, 'policy-options')
+    prefix_list = ET.SubElement(policy_options, 'prefix-list', {REMOVE: 'remove'})
+    ET.SubElement(prefix_list, 'name').text = '{vrf_name}'
+    community = ET.SubElement(policy_options, 'community', {REMOVE: 'remove'})
+    ET.SubElement(community, 'name').text = '{vrf_name}'
+    for policy in ['EXPORT', 'IMPORT']:
+        policy_statement = ET.SubElement(policy_options, 'policy-statement',
+            operation='remove')
+        ET.SubElement(policy_statement, 'name').text = '{vrf_name}_%s' % policy
+
+    # routing instance
+    routing_instances = ET.SubElement(configuration, 'routing-instances')
+    instance = ET.SubElement(routing_instances, 'instance', operation='remove')
+    ET.SubElement(instance, 'name').text = '{vrf_name}'
     return config
 
-def delete_xr(config):
-    """ See docstring on function delete_junos. This does the same thing, but for XR."""
-
-    # Get customer VRF name
-    vrf_name = config.xpath('/config/vrfs/vrf/vrf-name')[0].text
-
-    # Deleting interfaces
-    for interface in config.xpath('/config/interface-configurations/interface-configuration'):
-        interface.attrib['{urn:ietf:params:xml:ns:netconf:base:1.0}operation'] = 'remove'
-
-    # Deleting VRF
-    for vrf in config.xpath('/config/vrfs/vrf'):
-        vrf.attrib['{urn:ietf:params:xml:ns:netconf:base:1.0}operation'] = 'remove'
-
-    # Deleting VRF specific static routes
-    for router_static in config.xpath('/config/router-static/vrfs/vrf'):
-        router_static.attrib['{urn:ietf:params:xml:ns:netconf:base:1.0}operation'] = 'remove'
-
-    # Deleting BGP VRF address family configuration
-    for bgp_vrf in config.xpath('/config/bgp/instance/instance-as/four-byte-as/vrfs/vrf'):
-        bgp_vrf.attrib['{urn:ietf:params:xml:ns:netconf:base:1.0}operation'] = 'remove'
+def junos_delete_unit_skeleton():
+    interface = ET.Element('interface')
+    ET.SubElement(interface, 'name').text = '{name}'
+    unit = ET.SubElement(interface, 'unit', {REMOVE: 'remove'})
+    ET.SubElement(unit, 'name').text = '{unit}'
+    return interface
+
+def xr_delete_interface_skeleton():
+    interface_configuration = ET.Element('interface-configuration', {REMOVE: 'remove'})
+    ET.SubElement(interface_configuration, 'active').text = 'act'
+    ET.SubElement(interface_configuration, 'interface-name').text = '{name}'
+    return interface_configuration
+
+def xr_delete_vrf_skeleton():
+    """The VRF, its static routes and its BGP configuration. The static routes
+    are added by xr_delete_template if there are any."""
+
+    # wrapper element for the top level elements
+    vrf_config = ET.Element('vrf-config')
+    vrfs = ET.SubElement(vrf_config, 'vrfs', nsmap=add_vpn.Cisco_IOS_XR_infra_rsi_cfg)
+    vrf = ET.SubElement(vrfs, 'vrf', {REMOVE: 'remove'})
+    ET.SubElement(vrf, 'vrf-name').text = '{vrf_name}'
+
+    bgp = ET.SubElement(vrf_config, 'bgp', nsmap=add_vpn.Cisco_IOS_XR_ipv4_bgp_cfg)
+    instance = ET.SubElement(bgp, 'instance')
+    ET.SubElement(instance, 'instance-name').text = 'default'
+    instance_as = ET.SubElement(instance, 'instance-as')
+    ET.SubElement(instance_as, 'as').text = '0'
+    four_byte_as = ET.SubElement(instance_as, 'four-byte-as')
+    ET.SubElement(four_byte_as, 'as').text = '100'
+    vrfs = ET.SubElement(four_byte_as, 'vrfs')
+    vrf = ET.SubElement(vrfs, 'vrf', {REMOVE: 'remove'})
+    ET.SubElement(vrf, 'vrf-name').text = '{vrf_name}'
+    return vrf_config
+
+def xr_delete_static_skeleton():
+    router_static = ET.Element('router-static', nsmap=add_vpn.Cisco_IOS_XR_ip_static_cfg)
+    vrfs = ET.SubElement(router_static, 'vrfs')
+    vrf = ET.SubElement(vrfs, 'vrf', {REMOVE: 'remove'})
+    ET.SubElement(vrf, 'vrf-name').text = '{vrf_name}'
+    return router_static
+
+def xr_delete_routing_policy_skeleton():
+    """Prefix set, community set and route policies of the VRF (note: not deleting
+    the management prefix set and rt community)."""
+
+    routing_policy = ET.Element('routing-policy',
+        nsmap=add_vpn.Cisco_IOS_XR_policy_repository_cfg)
+    sets = ET.SubElement(routing_policy, 'sets')
+    ext_community_rt_sets = ET.SubElement(sets, 'extended-community-rt-sets')
+    ext_community_rt_set = ET.SubElement(ext_community_rt_sets, 'extended-community-rt-set',
+        {REMOVE: 'remove'})
+    ET.SubElement(ext_community_rt_set, 'set-name').text = '{vrf_name}'
+    prefix_sets = ET.SubElement(sets, 'prefix-sets')
+    prefix_set = ET.SubElement(prefix_sets, 'prefix-set', {REMOVE: 'remove'})
+    ET.SubElement(prefix_set, 'set-name').text = '{vrf_name}'
+    route_policies = ET.SubElement(routing_policy, 'route-policies')
+    for policy in ['EXPORT', 'IMPORT']:
+        route_policy = ET.SubElement(route_policies, 'route-policy', {REMOVE: 'remove'})
+        ET.SubElement(route_policy, 'route-policy-name').text = '{vrf_name}_%s' % policy
+    return routing_policy
+
+def ios_delete_skeleton():
+    """The VRF definition and its BGP configuration. The static routes and the
+    interfaces are added by ios_delete_template."""
+
+    config = ET.Element('config', nsmap=add_vpn.nsmap_netconf)
+    native = ET.SubElement(config, 'native', nsmap=add_vpn.Cisco_IOS_XE_native)
+    vrf = ET.SubElement(native, 'vrf')
+    definition = ET.SubElement(vrf, 'definition', {REMOVE: 'remove'})
+    ET.SubElement(definition, 'name').text = '{vrf_name}'
+    ET.SubElement(native, 'interface')
+    router = ET.SubElement(native, 'router')
+    bgp = ET.SubElement(router, 'bgp', nsmap=add_vpn.Cisco_IOS_XE_bgp)
+    ET.SubElement(bgp, 'id').text = '100'
+    bgp_ipv4 = ET.SubElement(ET.SubElement(ET.SubElement(bgp, 'address-family'),
+        'with-vrf'), 'ipv4')
+    ET.SubElement(bgp_ipv4, 'af-name').text = 'unicast'
+    bgp_vrf = ET.SubElement(bgp_ipv4, 'vrf', {REMOVE: 'remove'})
+    ET.SubElement(bgp_vrf, 'name').text = '{vrf_name}'
+    return config
 
-    # Deleting prefix list (note: not deleting the management prefix list)
-    for prefix in config.xpath('''/config/routing-policy/sets/prefix-sets/prefix-set/
-            set-name[text()='{0}']/..'''.format(vrf_name)):
-        prefix.attrib['{urn:ietf:params:xml:ns:netconf:base:1.0}operation'] = 'remove'
+def ios_delete_interface_skeleton(interface_type):
+    """The VRF, address and policy of a physical interface. The interface itself
+    is left, unlike the loopback."""
+
+    interface = ET.Element(interface_type)
+    ET.SubElement(interface, 'name').text = '{name}'
+    ET.SubElement(interface, 'vrf', {REMOVE: 'remove'})
+    ET.SubElement(ET.SubElement(interface, 'ip'), 'address', {REMOVE: 'remove'})
+    ET.SubElement(interface, 'service-policy', {REMOVE: 'remove'},
+        nsmap=add_vpn.Cisco_IOS_XE_policy)
+    return interface
+
+def ios_delete_loopback_skeleton():
+    loopback = ET.Element('Loopback', {REMOVE: 'remove'})
+    ET.SubElement(loopback, 'name').text = '{vpn_id}'
+    return loopback
+
+def ios_delete_static_skeleton():
+    ip = ET.Element('ip')
+    vrf = ET.SubElement(ET.SubElement(ip, 'route'), 'vrf', {REMOVE: 'remove'})
+    ET.SubElement(vrf, 'name').text = '{vrf_name}'
+    return ip
+
+JUNOS_DELETE = add_vpn.Template(junos_delete_skeleton())
+JUNOS_DELETE_UNIT = add_vpn.Template(junos_delete_unit_skeleton())
+XR_DELETE_INTERFACE = add_vpn.Template(xr_delete_interface_skeleton())
+XR_DELETE_VRF = add_vpn.Template(xr_delete_vrf_skeleton())
+XR_DELETE_STATIC = add_vpn.Template(xr_delete_static_skeleton())
+XR_DELETE_ROUTING_POLICY = add_vpn.Template(xr_delete_routing_policy_skeleton())
+IOS_DELETE = add_vpn.Template(ios_delete_skeleton())
+IOS_DELETE_LOOPBACK = add_vpn.Template(ios_delete_loopback_skeleton())
+IOS_DELETE_STATIC = add_vpn.Template(ios_delete_static_skeleton())
+# interface templates by interface type, made the first time a type is used
+IOS_DELETE_INTERFACES = {}
+
+def has_loopback(cfg_param, loopback_name):
+    """Whether the VPN in cfg_param has its loopback on the router. The parameters
+    of a VPN have the address of the loopback, the footprints have the loopback
+    among the interfaces if it is in the VRF. A loopback that isn't in the VRF
+    may be used for something else and is left alone."""
+
+    return cfg_param.loopback is not None or loopback_name in cfg_param.interface_names()
+
+def junos_delete_template(cfg_param):
+    """Creates the config that deletes the vpn in cfg_param from a Junos router,
+    the same parts that add_vpn.junos_template adds. Unit 0 of the interfaces is
+    removed unless the interface name has another unit, e.g. ge-0/0/1.5."""
+
+    config = JUNOS_DELETE.render(cfg_param.fields())
+    interfaces = config[0].find('interfaces')
+    loopback_name = 'lo0.{0}'.format(cfg_param.vpn_id)
+    for interface in cfg_param.interfaces:
+        if interface.name != loopback_name:
+            name, dot, unit = interface.name.partition('.')
+            interfaces.append(JUNOS_DELETE_UNIT.render({'name': name, 'unit': unit or '0'}))
+    if has_loopback(cfg_param, loopback_name):
+        interfaces.append(JUNOS_DELETE_UNIT.render({'name': 'lo0', 'unit': cfg_param.vpn_id}))
+    return config
 
-    # Deleting community list (note: not deleting management rt community)
-    for community in config.xpath('''/config/routing-policy/sets/extended-community-rt-sets/
-            extended-community-rt-set/set-name[text()='{0}']/..'''.format(vrf_name)):
-        community.attrib['{urn:ietf:params:xml:ns:netconf:base:1.0}operation'] = 'remove'
+def xr_delete_template(cfg_param):
+    """See junos_delete_template. This does the same thing, but for XR."""
+
+    values = cfg_param.fields()
+    config = ET.Element('config', nsmap=add_vpn.nsmap_netconf)
+
+    # Interfaces and the loopback
+    loopback_name = 'Loopback{0}'.format(cfg_param.vpn_id)
+    interface_configurations = ET.SubElement(config, 'interface-configurations',
+        nsmap=add_vpn.Cisco_IOS_XR_ifmgr_cfg)
+    for interface in cfg_param.interfaces:
+        if interface.name != loopback_name:
+            interface_configurations.append(XR_DELETE_INTERFACE.render(
+                {'name': interface.name}))
+    if has_loopback(cfg_param, loopback_name):
+        interface_configurations.append(XR_DELETE_INTERFACE.render({'name': loopback_name}))
+
+    vrfs, bgp = XR_DELETE_VRF.render(values)
+    config.append(vrfs)
+    if len(cfg_param.static_routes) > 0:
+        config.append(XR_DELETE_STATIC.render(values))
+    config.append(bgp)
+    config.append(XR_DELETE_ROUTING_POLICY.render(values))
+    return config
 
-    # Deleting route policies
-    for policy in config.xpath('/config/routing-policy/route-policies/route-policy'):
-        policy.attrib['{urn:ietf:params:xml:ns:netconf:base:1.0}operation'] = 'remove'
+def ios_delete_template(cfg_param):
+    """See junos_delete_template. This does the same thing, but for IOS-XE."""
 
+    values = cfg_param.fields()
+    config = IOS_DELETE.render(values)
+    native = config[0]
+    interfaces = native.find('interface')
+    loopback_name = 'Loopback{0}'.format(cfg_param.vpn_id)
+    for interface in cfg_param.interfaces:
+        if interface.name == loopback_name:
+            continue
+        interface_type, number = drivers.ios_interface_name(interface.name)
+        if interface_type not in IOS_DELETE_INTERFACES:
+            IOS_DELETE_INTERFACES[interface_type] = add_vpn.Template(
+                ios_delete_interface_skeleton(interface_type))
+        interfaces.append(IOS_DELETE_INTERFACES[interface_type].render({'name': number}))
+    if has_loopback(cfg_param, loopback_name):
+        interfaces.append(IOS_DELETE_LOOPBACK.render(values))
+    if len(cfg_param.static_routes) > 0:
+        native.insert(2, IOS_DELETE_STATIC.render(values))
     return config
 
+# What a VPN can have on a router, see junos_footprints. Empty leaves are selection
+# nodes in the get-config filter, so only the names are fetched.
+
+def junos_footprint_skeleton():
+    configuration = ET.Element('configuration')
+    policy_options = ET.SubElement(configuration, 'policy-options')
+    for tag in ['prefix-list', 'community', 'policy-statement']:
+        ET.SubElement(ET.SubElement(policy_options, tag), 'name')
+    instance = ET.SubElement(ET.SubElement(configuration, 'routing-instances'), 'instance')
+    ET.SubElement(instance, 'name')
+    ET.SubElement(ET.SubElement(instance, 'interface'), 'name')
+    return [configuration]
+
+def xr_footprint_skeleton():
+    interface_configurations = ET.Element('interface-configurations',
+        nsmap=add_vpn.Cisco_IOS_XR_ifmgr_cfg)
+    interface_configuration = ET.SubElement(interface_configurations,
+        'interface-configuration')
+    ET.SubElement(interface_configuration, 'active')
+    ET.SubElement(interface_configuration, 'interface-name')
+    ET.SubElement(interface_configuration, 'vrf', nsmap=add_vpn.Cisco_IOS_XR_infra_rsi_cfg)
+
+    vrfs = ET.Element('vrfs', nsmap=add_vpn.Cisco_IOS_XR_infra_rsi_cfg)
+    ET.SubElement(ET.SubElement(vrfs, 'vrf'), 'vrf-name')
+
+    router_static = ET.Element('router-static', nsmap=add_vpn.Cisco_IOS_XR_ip_static_cfg)
+    vrf = ET.SubElement(ET.SubElement(router_static, 'vrfs'), 'vrf')
+    ET.SubElement(vrf, 'vrf-name')
+    vrf_prefix = vrf
+    for tag in ['address-family', 'vrfipv4', 'vrf-unicast', 'vrf-prefixes', 'vrf-prefix']:
+        vrf_prefix = ET.SubElement(vrf_prefix, tag)
+    ET.SubElement(vrf_prefix, 'prefix')
+    ET.SubElement(vrf_prefix, 'prefix-length')
+
+    bgp = ET.Element('bgp', nsmap=add_vpn.Cisco_IOS_XR_ipv4_bgp_cfg)
+    vrf = bgp
+    for tag in ['instance', 'instance-as', 'four-byte-as', 'vrfs', 'vrf']:
+        vrf = ET.SubElement(vrf, tag)
+    ET.SubElement(vrf, 'vrf-name')
+
+    routing_policy = ET.Element('routing-policy',
+        nsmap=add_vpn.Cisco_IOS_XR_policy_repository_cfg)
+    sets = ET.SubElement(routing_policy, 'sets')
+    ET.SubElement(ET.SubElement(ET.SubElement(sets, 'extended-community-rt-sets'),
+        'extended-community-rt-set'), 'set-name')
+    ET.SubElement(ET.SubElement(ET.SubElement(sets, 'prefix-sets'), 'prefix-set'),
+        'set-name')
+    ET.SubElement(ET.SubElement(ET.SubElement(routing_policy, 'route-policies'),
+        'route-policy'), 'route-policy-name')
+    return [interface_configurations, vrfs, router_static, bgp, routing_policy]
+
+def ios_footprint_skeleton():
+    native = ET.Element('native', nsmap=add_vpn.Cisco_IOS_XE_native)
+    ET.SubElement(ET.SubElement(ET.SubElement(native, 'vrf'), 'definition'), 'name')
+    # The interfaces are a list per type, so all of them are fetched.
+    ET.SubElement(native, 'interface')
+    route_vrf = ET.SubElement(ET.SubElement(ET.SubElement(native, 'ip'), 'route'), 'vrf')
+    ET.SubElement(route_vrf, 'name')
+    forwarding_list = ET.SubElement(route_vrf, 'ip-route-interface-forwarding-list')
+    ET.SubElement(forwarding_list, 'prefix')
+    ET.SubElement(forwarding_list, 'mask')
+    bgp_vrf = ET.SubElement(ET.SubElement(native, 'router'), 'bgp',
+        nsmap=add_vpn.Cisco_IOS_XE_bgp)
+    for tag in ['address-family', 'with-vrf', 'ipv4', 'vrf']:
+        bgp_vrf = ET.SubElement(bgp_vrf, tag)
+    ET.SubElement(bgp_vrf, 'name')
+    return [native]
+
+def leaf_values(running):
+    return set((element.text or '').strip() for element in running.iter()
+        if len(element) == 0)
+
+def footprint_ids(names, vpn_ids, units):
+    """The vpn_ids that have a VRF or policy among the leaf values in names, see
+    leaf_values, or a loopback in their VRF, the loopback units."""
+
+    found = []
+    for vpn_id in vpn_ids:
+        vrf_name = 'VRF_{0}'.format(vpn_id)
+        if vrf_name in names or vrf_name + '_EXPORT' in names or \
+                vrf_name + '_IMPORT' in names or str(vpn_id) in units:
+            found.append(vpn_id)
+    return found
+
+def footprint(vpn_id, interface_names, static_networks):
+    """The model.RouterParams that the delete templates need. Only the interface
+    names and the static route networks are known from the running config."""
+
+    vpn = VpnParams(str(vpn_id), 'VRF_{0}'.format(vpn_id), None, None, None, None)
+    return RouterParams(vpn, tuple(Interface(name, None, None) for name in interface_names),
+        None, tuple(StaticRoute(network, None) for network in static_networks), ())
+
+def junos_footprints(running, vpn_ids):
+    """Finds what the VPNs with vpn_ids have on a router, in the running config
+    that was fetched with the footprint skeleton. Returns parameters for the delete
+    templates, like add_vpn.vpn_variables makes, for every VPN that has anything
+    left on the router. A VPN that was only partly deleted is found as well."""
+
+    # A loopback unit is only in a VRF as long as the routing instance is there,
+    # so the VRF finds the VPN.
+    footprints = {}
+    for vpn_id in footprint_ids(leaf_values(running), vpn_ids, []):
+        interfaces = []
+        for instance in running.iterfind('configuration/routing-instances/instance'):
+            if (instance.findtext('name') or '').strip() != 'VRF_{0}'.format(vpn_id):
+                continue
+            for interface in instance.iterfind('interface/name'):
+                interfaces.append(interface.text.strip())
+        footprints[str(vpn_id)] = footprint(vpn_id, interfaces, [])
+    return footprints
+
+def xr_footprints(running, vpn_ids):
+    """See junos_footprints. This does the same thing, but for XR."""
+
+    names = leaf_values(running)
+    units = []
+    for configuration in running.iterfind('.//{*}interface-configuration'):
+        name = configuration.findtext('{*}interface-name') or ''
+        if name.startswith('Loopback') and configuration.findtext('{*}vrf') == \
+                'VRF_{0}'.format(name[len('Loopback'):]):
+            units.append(name[len('Loopback'):])
+    footprints = {}
+    for vpn_id in footprint_ids(names, vpn_ids, units):
+        vrf_name = 'VRF_{0}'.format(vpn_id)
+        interfaces = []
+        for configuration in running.iterfind('.//{*}interface-configuration'):
+            if configuration.findtext('{*}vrf') == vrf_name:
+                interfaces.append(configuration.findtext('{*}interface-name'))
+        static_routes = []
+        for vrf in running.iterfind('{*}router-static/{*}vrfs/{*}vrf'):
+            if vrf.findtext('{*}vrf-name') != vrf_name:
+                continue
+            for vrf_prefix in vrf.iterfind('.//{*}vrf-prefix'):
+                static_routes.append('{0}/{1}'.format(vrf_prefix.findtext('{*}prefix'),
+                    vrf_prefix.findtext('{*}prefix-length')))
+        footprints[str(vpn_id)] = footprint(vpn_id, interfaces, static_routes)
+    return footprints
+
+def ios_footprints(running, vpn_ids):
+    """See junos_footprints. This does the same thing, but for IOS-XE."""
+
+    units = []
+    for loopback in running.iterfind('{*}native/{*}interface/{*}Loopback'):
+        name = (loopback.findtext('{*}name') or '').strip()
+        if loopback.findtext('{*}vrf/{*}forwarding') == 'VRF_{0}'.format(name):
+            units.append(name)
+    footprints = {}
+    for vpn_id in footprint_ids(leaf_values(running), vpn_ids, units):
+        vrf_name = 'VRF_{0}'.format(vpn_id)
+        interfaces = []
+        for interface in running.iterfind('{*}native/{*}interface/*'):
+            if interface.findtext('{*}vrf/{*}forwarding') == vrf_name:
+                interfaces.append(add_vpn.localname(interface) +
+                    interface.findtext('{*}name'))
+        static_routes = []
+        for vrf in running.iterfind('{*}native/{*}ip/{*}route/{*}vrf'):
+            if vrf.findtext('{*}name') != vrf_name:
+                continue
+            for route in vrf.iterfind('{*}ip-route-interface-forwarding-list'):
+                static_routes.append('{0}/{1}'.format(route.findtext('{*}prefix'),
+                    addressing.PREFIX_LENGTHS[route.findtext('{*}mask')]))
+        footprints[str(vpn_id)] = footprint(vpn_id, interfaces, static_routes)
+    return footprints
+
 def close_sessions(routers):
     """If something goes wrong during the configuration change this function
     attempts to discard any uncommitted changes and close all sessions."""
@@ -141,123 +420,132 @@ def close_sessions(routers):
             print('Could not do clean exit on router {0}'.format(router))
     sys.exit('exit')
 
-def delete_layer3_vpn(vpn_parameters):
+def delete_layer3_vpn(vpn_parameters, policy=None):
+    """Deletes the VPN on its routers. policy decides instead of asking, see
+    add_vpn.POLICY."""
+
+    remove(delete_routers(vpn_parameters), policy)
+
+def delete_routers(vpn_parameters):
+    """Builds the delete config of every router in vpn_parameters."""
+
     # Dictionary that will hold the netconf sessions and config templates.
     routers = {}
 
-    # namespaces used in vpn_parameters
-    nsmap = {
-        'nc': 'urn:ietf:params:xml:ns:netconf:base:1.0',
-        'vpn': 'http://lundnet.com/ns/yang/layer3vpn'
-        }
-
     # Getting router names from vpn_parameters and checking if they are in inventory.
-    for router in vpn_parameters.xpath('//vpn:router-name', namespaces=nsmap):
-        if router.text not in inventory:
-            print('Warning: Router "{0}" is not in inventory.'.format(router.text))
-            print('No action taken on router "{0}"'.format(router.text))
+    names = [router.text for router in xpaths.ROUTER_NAMES(vpn_parameters)]
+    found = inventory.resolve(names)
+    for router in names:
+        if router not in found:
+            print('Warning: Router "{0}" is not in inventory.'.format(router))
+            print('No action taken on router "{0}"'.format(router))
             continue
-        routers[router.text] = {}
+        routers[router] = {}
 
-    # Building the templates. Using functions from add_vpn.py
+    # Building the templates.
+    parameters = add_vpn.vpn_variables(vpn_parameters)
     for router in routers:
-        if inventory[router]['type'] == 'junos':
-            config_parameters = add_vpn.config_variables(vpn_parameters, router)
-            junos_template = add_vpn.junos_template(config_parameters)
-            routers[router]['config'] = delete_junos(junos_template)
-        if inventory[router]['type'] == 'xr':
-            config_parameters = add_vpn.config_variables(vpn_parameters, router)
-            xr_template = add_vpn.xr_template(config_parameters)
-            routers[router]['config'] = delete_xr(xr_template)
+        if add_vpn.driver(router) is not None:
+            routers[router]['config'] = artifacts.template(
+                add_vpn.driver(router).delete_template, parameters[router])
+    return routers
+
+def delete_vpn_ids(vpn_ids, names=None, policy=None):
+    """Deletes the VPNs with vpn_ids from the routers in names, by default every
+    router in inventory that there is a driver for, without their parameter files. What every
+    VPN has on a router is found with one get-config per router, and all of it is
+    removed with one commit per router."""
+
+    if names is None:
+        names = []
+        for router_type in sorted(drivers.DRIVERS):
+            names.extend(inventory.by_type(router_type))
+    routers = {}
+    found = inventory.resolve(names)
+    for router in names:
+        if router not in found:
+            print('Warning: Router "{0}" is not in inventory.'.format(router))
+            continue
+        routers[router] = {}
+
+    def discover(router):
+        driver = add_vpn.driver(router)
+        running = add_vpn.running_config(routers[router]['session'], driver.footprint())
+        footprints = driver.footprints(running, vpn_ids)
+        if len(footprints) == 0:
+            print('None of the VPNs are on router {0}'.format(router))
+            return
+        print('Deleting VPN {0} on router {1}'.format(', '.join(sorted(footprints)), router))
+        configs = []
+        for vpn_id in sorted(footprints):
+            configs.append(driver.delete_template(footprints[vpn_id]))
+        for config in configs[1:]:
+            add_vpn.merge_config(configs[0], config)
+        routers[router]['config'] = configs[0]
+
+    remove(routers, policy, discover)
+
+def remove(routers, policy=None, discover=None):
+    """Pushes the delete config in routers and commits it. If discover is given,
+    discover(router) builds the config once the candidate is locked. Routers
+    that end up without config are left as they are."""
+
+    if policy is None:
+        policy = add_vpn.POLICY
 
     # Establishing netconf sessions
-    unreachable = []
-    for router in routers:
-        # Junos specific device_params argument means that we need this if:
-        if inventory[router]['type'] == 'junos':
-            try:
-                session = manager.connect(host=inventory[router]['ip'],
-                                    username=inventory[router]['user'],
-                                    password=inventory[router]['pass'],
-                                    device_params = {'name':'junos'},
-                                    hostkey_verify=False)
-                routers[router]['session'] = session
-            except ncclient.transport.errors.SSHError:
-                unreachable.append(router)
-        if inventory[router]['type'] == 'xr':
-            try:
-                session = manager.connect(host=inventory[router]['ip'],
-                                        username=inventory[router]['user'],
-                                        password=inventory[router]['pass'],
-                                        hostkey_verify=False)
-                routers[router]['session'] = session
-            except ncclient.transport.errors.SSHError:
-                unreachable.append(router)
+    unreachable = add_vpn.connect_sessions(routers)
 
     # Gives you the option of aborting the script if one or more routers are unreachable.
     if len(unreachable) > 0:
         for router in unreachable:
             print('Router "{0}" not reachable via Netconf'.format(router))
-        decision = input('Do you want to proceed without unreachable routers? (yes/[no]): ')
-        if decision == 'yes':
+        if add_vpn.decide(policy, 'unreachable',
+                'Do you want to proceed without unreachable routers?'):
             for router in unreachable:
                 print('Removing router "{0}" from sessions.'.format(router))
                 del routers[router]
         else:
             close_sessions(routers)
 
+    # Each phase below runs on all routers at the same time, see add_vpn.run_phase.
+
     # Locking and discarding any pre-existing changes to candidate.
-    for router in routers:
-        try:
-            print('Locking candidate on {0}'.format(router))
-            routers[router]['session'].lock('candidate')
-            routers[router]['session'].discard_changes()
-        except Exception as error:
-            print(error)
-            print('Something went wrong during locking on router {0}'.format(router))
-            close_sessions(routers)
+    def lock(router):
+        print('Locking candidate on {0}'.format(router))
+        routers[router]['session'].lock('candidate')
+        routers[router]['session'].discard_changes()
+    add_vpn.run_phase(routers, 'locking', lock)
+
+    # Finding what to delete.
+    if discover is not None:
+        add_vpn.run_phase(routers, 'discovery', discover)
 
     # Making the change.
-    for router in routers:
+    def edit_config(router):
+        if routers[router].get('config') is None:
+            return
         # Junos requires default_operation=none. XR doesn't work with this argument.
-        if inventory[router]['type'] == 'junos':
-            try:
-                routers[router]['session'].edit_config(target='candidate',
-                    config=routers[router]['config'], default_operation='none')
-            except Exception as error:
-                print(error)
-                print('Something went wrong during edit-config on router {0}'.format(router))
-                close_sessions(routers)
-        if inventory[router]['type'] == 'xr':
-            try:
-                routers[router]['session'].edit_config(target='candidate',
-                    config=routers[router]['config'])
-            except Exception as error:
-                print(error)
-                print('Something went wrong during edit-config on router {0}'.format(router))
-                close_sessions(routers)
+        routers[router]['session'].edit_config(target='candidate',
+            config=routers[router]['config'], **add_vpn.driver(router).delete_options)
+    add_vpn.run_phase(routers, 'edit-config', edit_config)
 
     # Validating the change.
-    for router in routers:
-        try:
-            print('Validating config on {0}'.format(router))
-            routers[router]['session'].validate(source='candidate')
-        except Exception as error:
-            print(error)
-            print('Something went wrong during validate on router {0}'.format(router))
-            close_sessions(routers)
-    
+    def validate(router):
+        if routers[router].get('config') is None:
+            return
+        print('Validating config on {0}'.format(router))
+        routers[router]['session'].validate(source='candidate')
+    add_vpn.run_phase(routers, 'validate', validate)
+
     # Doing commit.
-    decision = input('Commit delete? (yes/[no]): ')
-    if decision == 'yes':
-        for router in routers:
-            try:
-                routers[router]['session'].commit()
-                print('Delete successful on router {0}'.format(router))
-            except Exception as error:
-                print(error)
-                print('Something went wrong during commit on router {0}'.format(router))
-                close_sessions(routers)
+    if add_vpn.decide(policy, 'commit', 'Commit delete?'):
+        def commit(router):
+            if routers[router].get('config') is None:
+                return
+            routers[router]['session'].commit()
+            print('Delete successful on router {0}'.format(router))
+        add_vpn.run_phase(routers, 'commit', commit)
     else:
         close_sessions(routers)
 
@@ -268,9 +556,40 @@ def main():
     parser = argparse.ArgumentParser()
     parser.add_argument('-c', '--config', dest='config', 
         help='vpn parameters')
+    parser.add_argument('-v', '--vpn-id', dest='vpn_ids', type=int, nargs='+',
+        help='delete the VPNs with these ids, found on the routers, instead of the '
+        'one in a parameter file')
+    parser.add_argument('-r', '--routers', dest='routers', nargs='+',
+        help='with --vpn-id, the routers to delete them from, by default all')
+    parser.add_argument('-p', '--pool', dest='pool', type=netconf_pool.parse_address,
+        help='borrow sessions from a netconf pool at host:port')
+    parser.add_argument('-t', '--trace', dest='trace',
+        help='write timings of every phase and netconf call to this file, see tracing.py')
+    parser.add_argument('--render', dest='render',
+        help='write the delete config of every router to this directory instead of '
+        'pushing it, needs a parameter file')
+    parser.add_argument('--cache', dest='cache',
+        help='keep the generated templates in this directory and reuse them')
+    add_vpn.policy_arguments(parser)
     args = parser.parse_args()
+    policy = add_vpn.parse_policy(args)
+    if args.pool:
+        netconf_pool.use(args.pool)
+    if args.trace:
+        tracing.enable(args.trace)
+    if args.cache:
+        artifacts.use(args.cache)
+    if args.render:
+        if args.config is None:
+            sys.exit('--render needs the parameter file, what --vpn-id deletes is only '
+                'known once the routers are asked')
+        artifacts.render(delete_routers(ET.parse(args.config)), args.render)
+        return
+    if args.vpn_ids:
+        delete_vpn_ids(args.vpn_ids, args.routers, policy)
+        return
     vpn_parameters = ET.parse(args.config) 
-    delete_layer3_vpn(vpn_parameters)
+    delete_layer3_vpn(vpn_parameters, policy)
 
 if __name__ == "__main__":
     main()
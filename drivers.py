@@ -0,0 +1,80 @@
+import importlib
+import re
+
+# The platforms that the scripts can configure, keyed on the type of a router in
+# inventory. A new platform is one more driver here, the scripts look the driver
+# up instead of checking the type.
+
+
+class Driver:
+    """What the scripts need for one platform:
+
+    device_params      ncclient device_params, None for plain netconf
+    delete_options     edit-config arguments for the delete config
+    template           add_vpn: the config template, from cfg_param
+    delete_template    delete_vpn: the delete config, from cfg_param
+    footprint          delete_vpn: get-config skeleton for the VPNs on a router
+    footprints         delete_vpn: delete parameters from that running config
+    snapshot           test_vpn: router state for the checks
+    checks             test_vpn: checks before the VPN is added
+    verify_checks      test_vpn: checks after the VPN is committed
+
+    The functions and classes are given as 'module.name' and imported the first
+    time they are used, since the scripts that have them import this module."""
+
+    def __init__(self, device_params=None, delete_options=None, **parts):
+        self.device_params = device_params
+        self.delete_options = delete_options or {}
+        self.parts = parts
+
+    def __getattr__(self, name):
+        parts = self.__dict__.get('parts', {})
+        if name not in parts:
+            raise AttributeError(name)
+        module, attribute = parts[name].split('.')
+        value = getattr(importlib.import_module(module), attribute)
+        setattr(self, name, value)
+        return value
+
+
+DRIVERS = {
+    'junos': Driver(
+        device_params={'name': 'junos'},
+        # The delete config only has operations where something is removed.
+        delete_options={'default_operation': 'none'},
+        template='add_vpn.junos_template',
+        delete_template='delete_vpn.junos_delete_template',
+        footprint='delete_vpn.junos_footprint_skeleton',
+        footprints='delete_vpn.junos_footprints',
+        snapshot='test_vpn.JunosSnapshot',
+        checks='test_vpn.JUNOS_CHECKS',
+        verify_checks='test_vpn.JUNOS_VERIFY_CHECKS'),
+    'xr': Driver(
+        template='add_vpn.xr_template',
+        delete_template='delete_vpn.xr_delete_template',
+        footprint='delete_vpn.xr_footprint_skeleton',
+        footprints='delete_vpn.xr_footprints',
+        snapshot='test_vpn.XrSnapshot',
+        checks='test_vpn.XR_CHECKS',
+        verify_checks='test_vpn.XR_VERIFY_CHECKS'),
+    # IOS-XE with the native yang models, e.g. oslo.
+    'ios': Driver(
+        device_params={'name': 'iosxe'},
+        template='add_vpn.ios_template',
+        delete_template='delete_vpn.ios_delete_template',
+        footprint='delete_vpn.ios_footprint_skeleton',
+        footprints='delete_vpn.ios_footprints',
+        snapshot='test_vpn.IosSnapshot',
+        checks='test_vpn.IOS_CHECKS',
+        verify_checks='test_vpn.IOS_VERIFY_CHECKS')
+}
+
+
+def ios_interface_name(interface_name):
+    """Splits an interface name into type and number, e.g. GigabitEthernet2 into
+    GigabitEthernet and 2, since the native model has a list per type."""
+
+    match = re.fullmatch(r'([A-Za-z][A-Za-z-]*?)-?(\d\S*)', interface_name)
+    if match is None:
+        raise ValueError('Not an IOS interface name: {0}'.format(interface_name))
+    return match.group(1), match.group(2)
@@ -0,0 +1,222 @@
+import argparse
+import json
+import os
+import sqlite3
+import threading
+
+# Where the inventory is kept if VPN_INVENTORY doesn't say otherwise.
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'inventory.db')
+
+# PE-routers in network. A new inventory database starts out with these.
+SEED = {
+    'lund': {
+        'ip': '192.168.1.128',
+        'user': 'cisco',
+        'pass': 'cisco',
+        'type': 'xr',
+        'id': 1
+    },
+    'malmo': {
+        'ip': '192.168.1.133',
+        'user': 'junos',
+        'pass': 'junos123',
+        'type': 'junos',
+        'id': 2
+    },
+    'oslo': {
+        'ip': '192.168.1.127',
+        'user': 'admin',
+        'pass': 'admin',
+        'type': 'ios',
+        'id': 3
+    },
+    'stockholm': {
+        'ip': '192.168.1.132',
+        'user': 'cisco',
+        'pass': 'cisco',
+        'type': 'xr',
+        'id': 4
+    },
+    'sundsvall': {
+        'ip': '192.168.1.131',
+        'user': 'cisco',
+        'pass': 'cisco',
+        'type': 'xr',
+        'id': 5
+    }
+}
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS routers (
+    name TEXT PRIMARY KEY,
+    ip TEXT NOT NULL,
+    port INTEGER NOT NULL DEFAULT 830,
+    user TEXT NOT NULL,
+    pass TEXT NOT NULL,
+    type TEXT NOT NULL,
+    id INTEGER NOT NULL UNIQUE,
+    site TEXT
+);
+CREATE INDEX IF NOT EXISTS routers_type ON routers (type);
+CREATE INDEX IF NOT EXISTS routers_site ON routers (site);
+CREATE INDEX IF NOT EXISTS routers_ip ON routers (ip);
+'''
+
+COLUMNS = ['name', 'ip', 'port', 'user', 'pass', 'type', 'id', 'site']
+
+
+def entry(row):
+    """Makes a database row into an inventory entry, the same dictionary that the
+    scripts have always used, e.g. inventory[router]['type']."""
+
+    return dict(zip(COLUMNS[1:], row[1:]))
+
+
+class Inventory:
+    """The PE routers, kept in an SQLite database. Works like the old inventory
+    dictionary keyed on router name. The database is opened the first time it is
+    needed and every router is read from it at most once, as it is looked up.
+    There are also lookups on type, id, site and ip, which use indexes."""
+
+    def __init__(self, path=None):
+        self.path = path
+        self.connection = None
+        self.cache = {}
+        self.lock = threading.Lock()
+
+    def open(self, path):
+        """Uses the database at path from now on, ':memory:' for one that is only
+        kept while the script runs. A new database gets the SEED routers."""
+
+        with self.lock:
+            if self.connection is not None:
+                self.connection.close()
+            self.path = path
+            self.connection = None
+            self.cache = {}
+
+    def query(self, sql, parameters=()):
+        with self.lock:
+            if self.connection is None:
+                if self.path is None:
+                    self.path = os.environ.get('VPN_INVENTORY', DEFAULT_PATH)
+                # The sessions are opened from worker threads, hence the lock
+                # and check_same_thread.
+                self.connection = sqlite3.connect(self.path, check_same_thread=False)
+                self.connection.executescript(SCHEMA)
+                if self.connection.execute('SELECT count(*) FROM routers').fetchone()[0] == 0:
+                    self.insert(SEED)
+            with self.connection:
+                return self.connection.execute(sql, parameters).fetchall()
+
+    def insert(self, routers):
+        rows = []
+        for name in routers:
+            router = routers[name]
+            rows.append((name, router['ip'], router.get('port', 830), router['user'],
+                router['pass'], router['type'], router['id'], router.get('site', name)))
+        with self.connection:
+            self.connection.executemany('INSERT OR REPLACE INTO routers VALUES '
+                '(?, ?, ?, ?, ?, ?, ?, ?)', rows)
+
+    def select(self, where, parameters):
+        routers = {}
+        for row in self.query('SELECT * FROM routers WHERE ' + where, parameters):
+            routers[row[0]] = entry(row)
+        self.cache.update(routers)
+        return routers
+
+    def resolve(self, names):
+        """Looks up many routers with one query. Returns the entries of the ones
+        that are in inventory, keyed on name, and remembers them so that the
+        lookups that follow don't go to the database."""
+
+        missing = sorted(set(name for name in names if name not in self.cache))
+        # SQLite allows 999 parameters in one statement.
+        for start in range(0, len(missing), 900):
+            part = missing[start:start + 900]
+            self.select('name IN ({0})'.format(', '.join('?' * len(part))), part)
+        return dict((name, self.cache[name]) for name in names if name in self.cache)
+
+    def by_type(self, router_type):
+        return self.select('type = ?', (router_type,))
+
+    def by_site(self, site):
+        return self.select('site = ?', (site,))
+
+    def by_ip(self, ip):
+        return self.select('ip = ?', (ip,))
+
+    def by_id(self, router_id):
+        routers = self.select('id = ?', (router_id,))
+        for name in routers:
+            return name
+        return None
+
+    def __getitem__(self, name):
+        if name not in self.cache and len(self.resolve([name])) == 0:
+            raise KeyError(name)
+        return self.cache[name]
+
+    def __contains__(self, name):
+        return name in self.cache or len(self.resolve([name])) > 0
+
+    def __setitem__(self, name, router):
+        self.update({name: router})
+
+    def update(self, routers):
+        """Adds or replaces routers in the database."""
+
+        routers = dict(routers)
+        self.query('SELECT 1') # opens the database
+        with self.lock:
+            self.insert(routers)
+        for name in routers:
+            self.cache.pop(name, None)
+
+    def __delitem__(self, name):
+        self.query('DELETE FROM routers WHERE name = ?', (name,))
+        self.cache.pop(name, None)
+
+    def __iter__(self):
+        return iter([row[0] for row in self.query('SELECT name FROM routers ORDER BY id')])
+
+    def __len__(self):
+        return self.query('SELECT count(*) FROM routers')[0][0]
+
+    def items(self):
+        rows = self.query('SELECT * FROM routers ORDER BY id')
+        return [(row[0], entry(row)) for row in rows]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Shows and changes the router '
+        'inventory that the scripts use.')
+    parser.add_argument('-d', '--database', dest='database',
+        help='inventory database, by default $VPN_INVENTORY or ' + DEFAULT_PATH)
+    parser.add_argument('-t', '--type', dest='type', help='only list routers of this type')
+    parser.add_argument('-s', '--site', dest='site', help='only list routers at this site')
+    parser.add_argument('-i', '--import', dest='import_file',
+        help='add the routers in a JSON file, e.g. from mock_netconf.py --write-inventory')
+    parser.add_argument('-r', '--remove', dest='remove', nargs='+', default=[],
+        help='remove these routers')
+    args = parser.parse_args()
+
+    inventory = Inventory(args.database)
+    if args.import_file:
+        with open(args.import_file) as routers:
+            inventory.update(json.load(routers))
+    for name in args.remove:
+        del inventory[name]
+    if args.type:
+        routers = sorted(inventory.by_type(args.type).items())
+    elif args.site:
+        routers = sorted(inventory.by_site(args.site).items())
+    else:
+        routers = inventory.items()
+    for name, router in routers:
+        print('{0:<16}{1:<6}{2:>5}  {3}:{4}  {5}'.format(name, router['type'], router['id'],
+            router['ip'], router['port'], router['site']))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,754 @@
+import argparse
+from copy import deepcopy
+import itertools
+import json
+from lxml import etree as ET
+import paramiko
+import selectors
+import socket
+import sys
+import threading
+import time
+
+import add_vpn
+
+NETCONF_NS = 'urn:ietf:params:xml:ns:netconf:base:1.0'
+EOM = b']]>]]>'
+
+# Capabilities in the hello message. Only base:1.0 is offered so that the
+# end-of-message framing is used.
+CAPABILITIES = [
+    'urn:ietf:params:netconf:base:1.0',
+    'urn:ietf:params:netconf:capability:candidate:1.0',
+    'urn:ietf:params:netconf:capability:confirmed-commit:1.0',
+    'urn:ietf:params:netconf:capability:validate:1.0',
+    'urn:ietf:params:netconf:capability:rollback-on-error:1.0',
+]
+JUNOS_CAPABILITIES = ['http://xml.juniper.net/netconf/junos/1.0']
+
+# Physical interfaces that every simulated router has.
+JUNOS_INTERFACES = ['ge-0/0/{0}'.format(port) for port in range(10)] + \
+    ['ge-0/1/{0}'.format(port) for port in range(10)]
+XR_INTERFACES = ['GigabitEthernet0/0/0/{0}'.format(port) for port in range(10)]
+IOS_INTERFACES = ['GigabitEthernet{0}'.format(port) for port in range(1, 11)]
+IOS_NATIVE = 'http://cisco.com/ns/yang/Cisco-IOS-XE-native'
+
+# Leaves that identify an entry in a list, e.g. an interface or a VRF. Elements
+# without any of these are treated as containers.
+KEY_LEAVES = ('name', 'active', 'neighbor-address', 'prefix', 'prefix-length', 'id', 'fwd',
+    'asn-ip')
+
+# Bandwidths in Mbit/s that have a POLICE_<n>M policer on every router.
+POLICERS = [10, 100, 1000]
+
+# Default number of minutes before a confirmed commit is rolled back.
+CONFIRM_TIMEOUT = 10
+
+_session_ids = itertools.count(1)
+_host_key = None
+
+
+class RPCError(Exception):
+    def __init__(self, tag, message, error_type='application'):
+        Exception.__init__(self, message)
+        self.tag = tag
+        self.error_type = error_type
+
+
+def localname(element):
+    return ET.QName(element).localname
+
+def is_key(element):
+    name = localname(element)
+    return len(element) == 0 and (name in KEY_LEAVES or name.endswith('-name'))
+
+def keys(element):
+    return [(child.tag, (child.text or '').strip()) for child in element if is_key(child)]
+
+def find_match(parent, element):
+    """Finds the child of parent that is the same list entry or container as element."""
+
+    for child in parent:
+        if child.tag == element.tag and keys(child) == keys(element):
+            return child
+    return None
+
+def operation(element):
+    # Junos also accepts the attribute without namespace, delete_vpn uses both.
+    return element.get('{%s}operation' % NETCONF_NS) or element.get('operation')
+
+def clean(element):
+    """Returns a copy of element without operation attributes."""
+
+    element = deepcopy(element)
+    for node in element.iter():
+        node.attrib.pop('{%s}operation' % NETCONF_NS, None)
+        node.attrib.pop('operation', None)
+    return element
+
+def edit(target, config, default_operation='merge'):
+    """Applies the children of the edit-config config element to target."""
+
+    for element in config:
+        if not isinstance(element.tag, str):
+            continue # comments
+        op = operation(element) or default_operation
+        match = find_match(target, element)
+        if op in ('remove', 'delete'):
+            if match is None:
+                if op == 'delete':
+                    raise RPCError('data-missing', '{0} not found'.format(localname(element)))
+                continue
+            target.remove(match)
+        elif op == 'replace':
+            if match is not None:
+                target.remove(match)
+            target.append(clean(element))
+        elif op == 'create':
+            if match is not None:
+                raise RPCError('data-exists', '{0} already exists'.format(localname(element)))
+            target.append(clean(element))
+        elif len(element) == 0:
+            # leaf
+            if op == 'merge' and not is_key(element):
+                if match is None:
+                    target.append(clean(element))
+                else:
+                    match.text = element.text
+        elif match is not None:
+            edit(match, element, op)
+        else:
+            # Something that isn't there. merge creates it, with default operation
+            # none only the nested operations count. A nested remove of what isn't
+            # there does nothing and a delete fails, so a container that only
+            # has those is not created either.
+            placeholder = ET.SubElement(target, element.tag)
+            for key in element:
+                if is_key(key):
+                    placeholder.append(clean(key))
+            edit(placeholder, element, op)
+            if len(placeholder) == len(keys(element)) and \
+                    (op != 'merge' or len(element) > len(keys(element))):
+                target.remove(placeholder)
+
+def subtree_filter(data, filter_element):
+    """Applies an RFC 6241 subtree filter. data and filter_element have the same
+    tag. Returns a filtered copy of data or None if nothing matches."""
+
+    children = [child for child in filter_element if isinstance(child.tag, str)]
+    content = [child for child in children if len(child) == 0 and (child.text or '').strip()]
+    # content match nodes decide if data is included at all
+    for match in content:
+        if not any(child.tag == match.tag and (child.text or '').strip() == match.text.strip()
+                for child in data):
+            return None
+    if len(children) == len(content):
+        return deepcopy(data)
+    result = ET.Element(data.tag, nsmap=data.nsmap)
+    result.text = data.text
+    for child in data:
+        # There can be one selection per list entry, the first one that matches
+        # is used.
+        for selection in children:
+            if child.tag != selection.tag:
+                continue
+            if len(selection) == 0:
+                result.append(deepcopy(child))
+                break
+            filtered = subtree_filter(child, selection)
+            if filtered is not None:
+                result.append(filtered)
+                break
+    if len(result) == 0:
+        return None
+    return result
+
+def apply_filter(datastore, filter_element):
+    """Filters the top level elements of a datastore. Without a filter the whole
+    datastore is returned."""
+
+    if filter_element is None:
+        return [deepcopy(element) for element in datastore]
+    result = []
+    for selection in filter_element:
+        if not isinstance(selection.tag, str):
+            continue
+        for element in datastore:
+            if element.tag == selection.tag:
+                filtered = subtree_filter(element, selection)
+                if filtered is not None:
+                    result.append(filtered)
+    return result
+
+
+class MockRouter:
+    """Datastores and operational state of one simulated PE router."""
+
+    def __init__(self, name, dialect, port, user='mock', password='mock', latency=None):
+        self.name = name
+        self.dialect = dialect
+        self.port = port
+        self.user = user
+        self.password = password
+        # seconds to wait before answering, per rpc name and 'default'
+        self.latency = latency or {}
+        self.running = ET.Element('datastore')
+        self.candidate = ET.Element('datastore')
+        self.lock_owner = None
+        self.confirmed = None # (rollback copy, timer) during a confirmed commit
+        self.mutex = threading.RLock()
+        if dialect == 'junos':
+            self.interfaces = list(JUNOS_INTERFACES)
+        elif dialect == 'ios':
+            self.interfaces = list(IOS_INTERFACES)
+        else:
+            self.interfaces = list(XR_INTERFACES)
+        self.add_policers()
+        self.candidate = deepcopy(self.running)
+
+    def add_policers(self):
+        """The policers are set up when a router is installed, the scripts only
+        check that they are there."""
+
+        if self.dialect == 'junos':
+            firewall = ET.SubElement(ET.SubElement(self.running, 'configuration'), 'firewall')
+            for bandwidth in POLICERS:
+                policer = ET.SubElement(firewall, 'policer')
+                ET.SubElement(policer, 'name').text = 'POLICE_{0}M'.format(bandwidth)
+            return
+        if self.dialect == 'ios':
+            # The native model also has the physical interfaces in the config.
+            policy = 'http://cisco.com/ns/yang/Cisco-IOS-XE-policy'
+            native = ET.SubElement(self.running, '{%s}native' % IOS_NATIVE,
+                nsmap={None: IOS_NATIVE})
+            interface = ET.SubElement(native, '{%s}interface' % IOS_NATIVE)
+            for name in self.interfaces:
+                ethernet = ET.SubElement(interface, '{%s}GigabitEthernet' % IOS_NATIVE)
+                ET.SubElement(ethernet, '{%s}name' % IOS_NATIVE).text = name[
+                    len('GigabitEthernet'):]
+            policy_element = ET.SubElement(native, '{%s}policy' % IOS_NATIVE)
+            for bandwidth in POLICERS:
+                policy_map = ET.SubElement(policy_element, '{%s}policy-map' % policy,
+                    nsmap={'policy': policy})
+                ET.SubElement(policy_map, '{%s}name' % policy).text = 'POLICE_{0}M'.format(
+                    bandwidth)
+            return
+        policymgr = 'http://cisco.com/ns/yang/Cisco-IOS-XR-infra-policymgr-cfg'
+        manager = ET.SubElement(self.running, '{%s}policy-manager' % policymgr,
+            nsmap={None: policymgr})
+        policy_maps = ET.SubElement(manager, '{%s}policy-maps' % policymgr)
+        for bandwidth in POLICERS:
+            policy_map = ET.SubElement(policy_maps, '{%s}policy-map' % policymgr)
+            ET.SubElement(policy_map, '{%s}type' % policymgr).text = 'qos'
+            ET.SubElement(policy_map, '{%s}name' % policymgr).text = 'POLICE_{0}M'.format(
+                bandwidth)
+
+    def wait(self, rpc_name):
+        delay = self.latency.get(rpc_name, self.latency.get('default', 0))
+        if delay:
+            time.sleep(delay)
+
+    def datastore(self, name):
+        if name == 'running':
+            return self.running
+        if name == 'candidate':
+            return self.candidate
+        raise RPCError('invalid-value', 'unknown datastore {0}'.format(name))
+
+    def check_lock(self, session_id):
+        if self.lock_owner is not None and self.lock_owner != session_id:
+            raise RPCError('in-use', 'configuration database locked by session {0}'.format(
+                self.lock_owner), 'protocol')
+
+    def commit(self, session_id, confirmed=False, timeout=None):
+        self.check_lock(session_id)
+        if self.confirmed is not None:
+            self.confirmed[1].cancel()
+            rollback = self.confirmed[0]
+            self.confirmed = None
+        else:
+            rollback = deepcopy(self.running)
+        self.running = deepcopy(self.candidate)
+        if confirmed:
+            timer = threading.Timer(timeout, self.rollback)
+            timer.daemon = True
+            self.confirmed = (rollback, timer)
+            timer.start()
+
+    def rollback(self):
+        """Reverts a confirmed commit that was never confirmed."""
+
+        with self.mutex:
+            if self.confirmed is None:
+                return
+            self.confirmed[1].cancel()
+            self.running = self.confirmed[0]
+            self.candidate = deepcopy(self.running)
+            self.confirmed = None
+
+    def unlock_session(self, session_id):
+        with self.mutex:
+            if self.lock_owner == session_id:
+                self.lock_owner = None
+                self.candidate = deepcopy(self.running)
+
+    def handle(self, rpc, session_id):
+        """Executes one rpc and returns the list of elements for the rpc-reply, an
+        empty list means <ok/>."""
+
+        operation_element = [child for child in rpc if isinstance(child.tag, str)][0]
+        name = localname(operation_element)
+        self.wait(name)
+        with self.mutex:
+            handler = getattr(self, 'rpc_' + name.replace('-', '_'), None)
+            if handler is None:
+                raise RPCError('operation-not-supported', '{0} is not supported'.format(name))
+            return handler(operation_element, session_id)
+
+    def child(self, element, name):
+        for child in element:
+            if isinstance(child.tag, str) and localname(child) == name:
+                return child
+        return None
+
+    def target(self, element, name):
+        # <target><candidate/></target>
+        return localname(self.child(element, name)[0])
+
+    def rpc_lock(self, element, session_id):
+        self.check_lock(session_id)
+        if self.target(element, 'target') != 'candidate':
+            raise RPCError('operation-not-supported', 'only candidate can be locked')
+        self.lock_owner = session_id
+        return []
+
+    def rpc_unlock(self, element, session_id):
+        if self.lock_owner != session_id:
+            raise RPCError('lock-denied', 'not locked by this session', 'protocol')
+        self.lock_owner = None
+        return []
+
+    def rpc_discard_changes(self, element, session_id):
+        self.check_lock(session_id)
+        self.candidate = deepcopy(self.running)
+        return []
+
+    def rpc_edit_config(self, element, session_id):
+        self.check_lock(session_id)
+        target = self.target(element, 'target')
+        default_operation = self.child(element, 'default-operation')
+        default_operation = 'merge' if default_operation is None else default_operation.text
+        config = self.child(element, 'config')
+        datastore = self.datastore(target)
+        if self.dialect == 'junos':
+            # Junos config has everything under one configuration element.
+            root = self.child(config, 'configuration')
+            configuration = self.child(datastore, 'configuration')
+            if configuration is None:
+                configuration = ET.SubElement(datastore, 'configuration')
+            edit(configuration, root, default_operation)
+        else:
+            edit(datastore, config, default_operation)
+        return []
+
+    def rpc_validate(self, element, session_id):
+        return []
+
+    def rpc_commit(self, element, session_id):
+        confirmed = self.child(element, 'confirmed') is not None
+        timeout = self.child(element, 'confirm-timeout')
+        timeout = 60 * CONFIRM_TIMEOUT if timeout is None else int(timeout.text)
+        self.commit(session_id, confirmed, timeout)
+        return []
+
+    def rpc_commit_configuration(self, element, session_id):
+        # Junos commit, the confirm timeout is in minutes
+        confirmed = self.child(element, 'confirmed') is not None
+        timeout = self.child(element, 'confirm-timeout')
+        timeout = CONFIRM_TIMEOUT if timeout is None else int(timeout.text)
+        self.commit(session_id, confirmed, 60 * timeout)
+        return []
+
+    def rpc_cancel_commit(self, element, session_id):
+        if self.confirmed is None:
+            raise RPCError('operation-failed', 'no confirmed commit in progress')
+        self.rollback()
+        return []
+
+    def rpc_get_config(self, element, session_id):
+        source = self.target(element, 'source')
+        filter_element = self.child(element, 'filter')
+        data = ET.Element('{%s}data' % NETCONF_NS)
+        data.extend(apply_filter(self.datastore(source), filter_element))
+        return [data]
+
+    def rpc_get(self, element, session_id):
+        filter_element = self.child(element, 'filter')
+        data = ET.Element('{%s}data' % NETCONF_NS)
+        data.extend(apply_filter(self.operational(), filter_element))
+        return [data]
+
+    def rpc_close_session(self, element, session_id):
+        return []
+
+    # Junos operational rpcs
+
+    def rpc_get_interface_information(self, element, session_id):
+        units = {}
+        configuration = self.child(self.running, 'configuration')
+        if configuration is not None:
+            for interface in configuration.iterfind('interfaces/interface'):
+                units[interface.findtext('name')] = [unit.findtext('name')
+                    for unit in interface.iterfind('unit')]
+        information = ET.Element('interface-information')
+        for name in self.interfaces:
+            physical = ET.SubElement(information, 'physical-interface')
+            # Junos pads the values with newlines.
+            ET.SubElement(physical, 'name').text = '\n{0}\n'.format(name)
+            ET.SubElement(physical, 'admin-status').text = '\nup\n'
+            ET.SubElement(physical, 'oper-status').text = '\nup\n'
+            for unit in units.get(name, []):
+                logical = ET.SubElement(physical, 'logical-interface')
+                ET.SubElement(logical, 'name').text = '\n{0}.{1}\n'.format(name, unit)
+                ET.SubElement(logical, 'admin-status').text = '\nup\n'
+                ET.SubElement(logical, 'oper-status').text = '\nup\n'
+        return [information]
+
+    def rpc_get_instance_information(self, element, session_id):
+        information = ET.Element('instance-information')
+        master = ET.SubElement(information, 'instance-core')
+        ET.SubElement(master, 'instance-name').text = 'master'
+        configuration = self.child(self.running, 'configuration')
+        if configuration is not None:
+            for instance in configuration.iterfind('routing-instances/instance'):
+                core = ET.SubElement(information, 'instance-core')
+                ET.SubElement(core, 'instance-name').text = instance.findtext('name')
+                ET.SubElement(core, 'instance-type').text = instance.findtext('instance-type')
+                rd = instance.findtext('route-distinguisher/rd-type')
+                if rd is not None:
+                    ET.SubElement(core, 'route-distinguisher').text = rd
+        return [information]
+
+    # XR and IOS-XE operational data
+
+    def operational(self):
+        """Builds the XR operational data that the tests in test_vpn ask for."""
+
+        if self.dialect == 'ios':
+            return self.ios_operational()
+        ifmgr_oper = 'http://cisco.com/ns/yang/Cisco-IOS-XR-ifmgr-oper'
+        ifmgr_cfg = 'http://cisco.com/ns/yang/Cisco-IOS-XR-ifmgr-cfg'
+        ipv4_oper = 'http://cisco.com/ns/yang/Cisco-IOS-XR-ipv4-io-oper'
+        configured = []
+        for configuration in self.running.iter('{%s}interface-configuration' % ifmgr_cfg):
+            configured.append(configuration.findtext('{%s}interface-name' % ifmgr_cfg))
+
+        properties = ET.Element('{%s}interface-properties' % ifmgr_oper, nsmap={None: ifmgr_oper})
+        node = ET.SubElement(ET.SubElement(properties, '{%s}data-nodes' % ifmgr_oper),
+            '{%s}data-node' % ifmgr_oper)
+        interfaces = ET.SubElement(ET.SubElement(node, '{%s}system-view' % ifmgr_oper),
+            '{%s}interfaces' % ifmgr_oper)
+        for name in self.interfaces + [name for name in configured if name not in self.interfaces]:
+            interface = ET.SubElement(interfaces, '{%s}interface' % ifmgr_oper)
+            ET.SubElement(interface, '{%s}interface-name' % ifmgr_oper).text = name
+            ET.SubElement(interface, '{%s}parent-interface' % ifmgr_oper).text = name
+            ET.SubElement(interface, '{%s}type' % ifmgr_oper).text = 'IFT_GETHERNET'
+            ET.SubElement(interface, '{%s}state' % ifmgr_oper).text = 'im-state-up'
+
+        network = ET.Element('{%s}ipv4-network' % ipv4_oper, nsmap={None: ipv4_oper})
+        path = ['nodes', 'node', 'interface-data', 'vrfs', 'vrf', 'briefs']
+        briefs = network
+        for tag in path:
+            briefs = ET.SubElement(briefs, '{%s}%s' % (ipv4_oper, tag))
+        for name in configured:
+            brief = ET.SubElement(briefs, '{%s}brief' % ipv4_oper)
+            ET.SubElement(brief, '{%s}interface-name' % ipv4_oper).text = name
+        return [properties, network]
+
+    def ios_operational(self):
+        """The ietf-interfaces state of the interfaces in the native config, which
+        has the physical interfaces and the loopbacks that the VPNs added."""
+
+        ietf = 'urn:ietf:params:xml:ns:yang:ietf-interfaces'
+        state = ET.Element('{%s}interfaces-state' % ietf, nsmap={None: ietf})
+        for interface in self.running.iterfind('{%s}native/{%s}interface/*' % (IOS_NATIVE,
+                IOS_NATIVE)):
+            entry = ET.SubElement(state, '{%s}interface' % ietf)
+            ET.SubElement(entry, '{%s}name' % ietf).text = localname(interface) + \
+                interface.findtext('{%s}name' % IOS_NATIVE)
+            ET.SubElement(entry, '{%s}admin-status' % ietf).text = 'up'
+            ET.SubElement(entry, '{%s}oper-status' % ietf).text = 'up'
+        return [state]
+
+
+def host_key():
+    global _host_key
+    if _host_key is None:
+        _host_key = paramiko.RSAKey.generate(2048)
+    return _host_key
+
+def hello(dialect, session_id):
+    capabilities = CAPABILITIES + (JUNOS_CAPABILITIES if dialect == 'junos' else [])
+    message = ET.Element('{%s}hello' % NETCONF_NS, nsmap={None: NETCONF_NS})
+    capabilities_element = ET.SubElement(message, '{%s}capabilities' % NETCONF_NS)
+    for capability in capabilities:
+        ET.SubElement(capabilities_element, '{%s}capability' % NETCONF_NS).text = capability
+    ET.SubElement(message, '{%s}session-id' % NETCONF_NS).text = str(session_id)
+    return ET.tostring(message)
+
+def reply(rpc, elements=None, error=None):
+    rpc_reply = ET.Element('{%s}rpc-reply' % NETCONF_NS, nsmap={None: NETCONF_NS})
+    for attribute in rpc.attrib:
+        rpc_reply.set(attribute, rpc.get(attribute))
+    if error is not None:
+        rpc_error = ET.SubElement(rpc_reply, '{%s}rpc-error' % NETCONF_NS)
+        ET.SubElement(rpc_error, '{%s}error-type' % NETCONF_NS).text = error.error_type
+        ET.SubElement(rpc_error, '{%s}error-tag' % NETCONF_NS).text = error.tag
+        ET.SubElement(rpc_error, '{%s}error-severity' % NETCONF_NS).text = 'error'
+        ET.SubElement(rpc_error, '{%s}error-message' % NETCONF_NS).text = str(error)
+    elif elements:
+        rpc_reply.extend(elements)
+    else:
+        ET.SubElement(rpc_reply, '{%s}ok' % NETCONF_NS)
+    return ET.tostring(rpc_reply)
+
+
+class SSHServer(paramiko.ServerInterface):
+    def __init__(self, router):
+        self.router = router
+        self.subsystem = threading.Event()
+
+    def get_allowed_auths(self, username):
+        return 'password'
+
+    def check_auth_password(self, username, password):
+        if username == self.router.user and password == self.router.password:
+            return paramiko.AUTH_SUCCESSFUL
+        return paramiko.AUTH_FAILED
+
+    def check_channel_request(self, kind, chanid):
+        if kind == 'session':
+            return paramiko.OPEN_SUCCEEDED
+        return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+    def check_channel_subsystem_request(self, channel, name):
+        if name == 'netconf':
+            self.subsystem.set()
+            return True
+        return False
+
+def serve_session(router, client):
+    """Runs one netconf session over an accepted TCP connection."""
+
+    transport = paramiko.Transport(client)
+    transport.add_server_key(host_key())
+    server = SSHServer(router)
+    session_id = next(_session_ids)
+    try:
+        transport.start_server(server=server)
+        channel = transport.accept(30)
+        if channel is None or not server.subsystem.wait(30):
+            return
+        channel.sendall(hello(router.dialect, session_id) + EOM)
+        buffer = b''
+        greeted = False
+        while True:
+            data = channel.recv(65536)
+            if not data:
+                return
+            buffer += data
+            while EOM in buffer:
+                message, buffer = buffer.split(EOM, 1)
+                if not greeted:
+                    greeted = True # the client hello
+                    continue
+                rpc = ET.fromstring(message.strip())
+                try:
+                    elements = router.handle(rpc, session_id)
+                    channel.sendall(reply(rpc, elements) + EOM)
+                except RPCError as error:
+                    channel.sendall(reply(rpc, error=error) + EOM)
+                if localname(rpc[0]) == 'close-session':
+                    return
+    except (EOFError, OSError, paramiko.SSHException):
+        pass
+    finally:
+        router.unlock_session(session_id)
+        transport.close()
+
+
+class MockNetwork:
+    """Listens on one port per simulated router, all on the same address."""
+
+    def __init__(self, routers, address='127.0.0.1'):
+        self.routers = routers
+        self.address = address
+        self.selector = selectors.DefaultSelector()
+        for router in routers:
+            listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            listener.bind((address, router.port))
+            listener.listen(16)
+            self.selector.register(listener, selectors.EVENT_READ, router)
+
+    def serve_forever(self):
+        while True:
+            for key, events in self.selector.select():
+                client, peer = key.fileobj.accept()
+                threading.Thread(target=serve_session, args=(key.data, client),
+                    daemon=True).start()
+
+    def start(self):
+        host_key()
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    def inventory(self):
+        """Inventory entries for the simulated routers, in the format of
+        add_vpn.inventory."""
+
+        inventory = {}
+        for number, router in enumerate(self.routers, 1):
+            inventory[router.name] = {
+                'ip': self.address,
+                'port': router.port,
+                'user': router.user,
+                'pass': router.password,
+                'type': router.dialect,
+                'id': number
+            }
+        return inventory
+
+
+def mock_routers(count, dialect='mixed', base_port=8300, latency=None):
+    routers = []
+    for number in range(1, count + 1):
+        if dialect == 'mixed':
+            router_dialect = 'junos' if number % 2 else 'xr'
+        else:
+            router_dialect = dialect
+        routers.append(MockRouter('pe{0}'.format(number), router_dialect,
+            base_port + number, latency=latency))
+    return routers
+
+def load_test(network, interfaces, routes, neighbors):
+    """Runs the test_vpn checks, the add_vpn pipeline and then the delete_vpn
+    pipeline against the simulated routers, without the prompts, and prints how
+    long every phase took."""
+
+    import benchmark
+    import test_vpn
+
+    document = benchmark.synthetic_parameters(len(network.routers), interfaces, routes,
+        neighbors, types=dict((router.name, router.dialect) for router in network.routers))
+    # synthetic_parameters adds its own inventory entries, the mock ones replace them.
+    add_vpn.inventory.update(network.inventory())
+    vpn_parameters = ET.ElementTree(ET.fromstring(document))
+    timings = {}
+
+    start = time.perf_counter()
+    # Not add_vpn.vpn_routers, which rejects a synthetic VPN with more links than
+    # fit in its customer net, see benchmark.synthetic_parameters.
+    parameters = add_vpn.vpn_variables(vpn_parameters)
+    routers = add_vpn.parameter_routers(parameters)
+    timings['build'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    unreachable = add_vpn.connect_sessions(routers)
+    timings['connect'] = time.perf_counter() - start
+    for router in unreachable:
+        print('Router "{0}" not reachable via Netconf'.format(router))
+        del routers[router]
+
+    def tests(router):
+        driver = add_vpn.driver(router)
+        test_vpn.print_results(test_vpn.run_checks(driver.snapshot(routers[router]['session']),
+            driver.checks, parameters[router], router))
+    def lock(router):
+        routers[router]['session'].lock('candidate')
+        routers[router]['session'].discard_changes()
+    def edit_config(router):
+        routers[router]['session'].edit_config(target='candidate',
+            config=routers[router]['config'])
+    def validate(router):
+        routers[router]['session'].validate(source='candidate')
+    def confirmed_commit(router):
+        routers[router]['session'].commit(confirmed=True)
+    def commit(router):
+        routers[router]['session'].commit()
+    def delete(router):
+        # Same templates and edit-config arguments as delete_vpn.delete_layer3_vpn
+        driver = add_vpn.driver(router)
+        routers[router]['session'].edit_config(target='candidate',
+            config=driver.delete_template(parameters[router]), **driver.delete_options)
+    def close(router):
+        routers[router]['session'].unlock()
+        routers[router]['session'].close_session()
+    for name, phase in [('tests', tests), ('lock', lock), ('edit-config', edit_config),
+            ('validate', validate), ('confirmed commit', confirmed_commit),
+            ('commit', commit), ('delete', delete), ('delete validate', validate),
+            ('delete commit', commit), ('close', close)]:
+        start = time.perf_counter()
+        add_vpn.run_phase(routers, name, phase)
+        timings[name] = time.perf_counter() - start
+
+    for name in timings:
+        print('{0:<18}{1:8.3f} s'.format(name, timings[name]))
+    return timings
+
+def parse_latency(text):
+    """rpc=seconds, e.g. commit=2.5. Without rpc name it sets the default."""
+
+    if '=' in text:
+        rpc_name, seconds = text.split('=', 1)
+    else:
+        rpc_name, seconds = 'default', text
+    return (rpc_name, float(seconds))
+
+def main():
+    parser = argparse.ArgumentParser(description='Simulated Junos, XR and IOS-XE PE routers '
+        'that speak netconf over SSH.')
+    parser.add_argument('-n', '--routers', dest='routers', type=int, default=10,
+        help='number of simulated routers, named pe1, pe2, ...')
+    parser.add_argument('-d', '--dialect', dest='dialect', default='mixed',
+        choices=['mixed', 'junos', 'xr', 'ios'], help='platform of the routers, mixed is '
+        'junos and xr')
+    parser.add_argument('-a', '--address', dest='address', default='127.0.0.1',
+        help='address to listen on')
+    parser.add_argument('-p', '--base-port', dest='base_port', type=int, default=8300,
+        help='router pe<n> listens on base port + n')
+    parser.add_argument('-l', '--latency', dest='latency', type=parse_latency,
+        action='append', default=[], help='delay before replying, in seconds, '
+        'for all rpcs (0.05) or one rpc (commit=2). Can be repeated.')
+    parser.add_argument('-w', '--write-inventory', dest='write_inventory',
+        help='write the inventory of the simulated routers as JSON to this file')
+    parser.add_argument('--load-test', dest='load_test', action='store_true',
+        help='provision and test a synthetic VPN on all routers, then exit')
+    parser.add_argument('-m', '--interfaces', dest='interfaces', type=int, default=2,
+        help='interfaces per router in the load test')
+    parser.add_argument('-k', '--routes', dest='routes', type=int, default=2,
+        help='static routes per router in the load test')
+    parser.add_argument('-j', '--neighbors', dest='neighbors', type=int, default=1,
+        help='bgp neighbors per router in the load test')
+    args = parser.parse_args()
+
+    routers = mock_routers(args.routers, args.dialect, args.base_port, dict(args.latency))
+    network = MockNetwork(routers, args.address)
+    if args.write_inventory:
+        with open(args.write_inventory, 'w') as output:
+            json.dump(network.inventory(), output, indent=2)
+    network.start()
+    print('{0} routers listening on {1}, ports {2}-{3}'.format(len(routers), args.address,
+        routers[0].port, routers[-1].port), file=sys.stderr)
+    if args.load_test:
+        # The simulated routers are only kept in memory.
+        add_vpn.inventory.open(':memory:')
+        load_test(network, args.interfaces, args.routes, args.neighbors)
+        return
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+from collections import namedtuple
+
+# The configuration parameters that the templates and checks are made from, see
+# add_vpn.layer3vpn_variables. They are named tuples: immutable, so one router's
+# parameters can be shared by threads and worker processes without copies, and
+# slotted, so a router costs a few tuples instead of a tree of dictionaries.
+
+
+class VpnParams(namedtuple('VpnParams', ['vpn_id', 'vrf_name', 'management_rt',
+        'management_ip', 'customer_net', 'customer_rt'])):
+    """The parameters that all routers in one VPN have in common. The routers of
+    a VPN share the same VpnParams."""
+
+    __slots__ = ()
+
+
+class Interface(namedtuple('Interface', ['name', 'address', 'bandwidth'])):
+    """An interface of a router in the VPN, address in slash notation."""
+
+    __slots__ = ()
+
+
+class StaticRoute(namedtuple('StaticRoute', ['network', 'next_hop'])):
+    """A static route in the vrf, network in slash notation."""
+
+    __slots__ = ()
+
+
+class BgpNeighbor(namedtuple('BgpNeighbor', ['address', 'remote_as'])):
+    """A BGP neighbor in the vrf."""
+
+    __slots__ = ()
+
+
+class RouterParams(namedtuple('RouterParams', ['vpn', 'interfaces', 'loopback',
+        'static_routes', 'bgp_neighbors'])):
+    """The parameters of one router in a VPN. interfaces, static_routes and
+    bgp_neighbors are tuples of Interface, StaticRoute and BgpNeighbor."""
+
+    __slots__ = ()
+
+    vpn_id = property(lambda self: self.vpn.vpn_id)
+    vrf_name = property(lambda self: self.vpn.vrf_name)
+    management_rt = property(lambda self: self.vpn.management_rt)
+    management_ip = property(lambda self: self.vpn.management_ip)
+    customer_net = property(lambda self: self.vpn.customer_net)
+    customer_rt = property(lambda self: self.vpn.customer_rt)
+
+    def fields(self):
+        """The VPN parameters and the loopback by name, for the placeholders of
+        add_vpn.Template."""
+
+        values = self.vpn._asdict()
+        values['loopback'] = self.loopback
+        return values
+
+    def interface_names(self):
+        return [interface.name for interface in self.interfaces]
+
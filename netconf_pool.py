@@ -0,0 +1,293 @@
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing.connection import Client, Listener
+from lxml import etree as ET
+import os
+import secrets
+import stat
+import threading
+import time
+
+import sessions # open_session() and inventory
+
+# Where the pool listens if nothing else is given.
+DEFAULT_ADDRESS = ('localhost', 8300)
+# Shared secret between the pool and the scripts, if NETCONF_POOL_AUTHKEY doesn't
+# give one. The pool creates it the first time it starts, readable by its owner
+# only. Anyone with the secret can make the pool unpickle what they send.
+KEY_FILE = os.path.join(os.path.expanduser('~'), '.netconf_pool_key')
+# The session methods that a client may call through the pool.
+METHODS = ['lock', 'unlock', 'discard_changes', 'edit_config', 'validate', 'commit',
+    'cancel_commit', 'get', 'get_config', 'rpc']
+# Seconds between health checks of the idle sessions.
+HEALTH_INTERVAL = 30
+# Idle sessions that have not been borrowed for this many seconds are closed.
+IDLE_TIMEOUT = 600
+
+# Address of a running pool. Set by use() in the scripts, None means that the
+# scripts connect to the routers themselves.
+address = None
+
+
+class PoolError(Exception):
+    pass
+
+
+class SessionPool:
+    """Keeps one warm netconf session per inventory router. A session is borrowed
+    by one client at a time and goes back to the pool when the client is done."""
+
+    def __init__(self, idle_timeout=IDLE_TIMEOUT):
+        self.idle_timeout = idle_timeout
+        self.sessions = {}
+        self.last_used = {}
+        self.borrowed = set()
+        self.condition = threading.Condition()
+
+    def borrow(self, router, timeout=None):
+        if timeout is None:
+            timeout = sessions.CONNECT_TIMEOUT
+        if router not in sessions.inventory:
+            raise PoolError('Router "{0}" is not in inventory'.format(router))
+        with self.condition:
+            # Waits for the router to be released by another client.
+            if not self.condition.wait_for(lambda: router not in self.borrowed, timeout):
+                raise PoolError('Router "{0}" is busy'.format(router))
+            self.borrowed.add(router)
+        try:
+            session = self.sessions.get(router)
+            # Reconnecting if the session has died since it was last used.
+            if session is None or not session.connected:
+                print('Connecting to router {0}'.format(router))
+                self.sessions[router] = sessions.open_session(router, timeout)
+            return self.sessions[router]
+        except Exception:
+            self.release(router)
+            raise
+
+    def release(self, router):
+        with self.condition:
+            self.last_used[router] = time.monotonic()
+            self.borrowed.discard(router)
+            self.condition.notify_all()
+
+    def warm_up(self):
+        """Connects to all routers in inventory."""
+
+        def warm(router):
+            try:
+                self.sessions[router] = sessions.open_session(router)
+                self.last_used[router] = time.monotonic()
+            except Exception:
+                print('Router "{0}" not reachable via Netconf'.format(router))
+        with ThreadPoolExecutor(max_workers=sessions.MAX_WORKERS) as executor:
+            executor.map(warm, sessions.inventory)
+
+    def health_check(self):
+        """Closes sessions that have been idle too long, and reconnects idle
+        sessions that have been dropped by the router."""
+
+        with self.condition:
+            # A copy, borrow adds sessions without holding the condition.
+            idle = [router for router in list(self.sessions) if router not in self.borrowed]
+            # Borrowing them so that no client gets them during the check.
+            self.borrowed.update(idle)
+        for router in idle:
+            session = self.sessions[router]
+            try:
+                if time.monotonic() - self.last_used[router] > self.idle_timeout:
+                    print('Closing idle session on router {0}'.format(router))
+                    del self.sessions[router]
+                    session.close_session()
+                elif not session.connected:
+                    print('Reconnecting to router {0}'.format(router))
+                    self.sessions[router] = sessions.open_session(router)
+            except Exception as error:
+                print(error)
+                self.sessions.pop(router, None)
+            finally:
+                with self.condition:
+                    self.borrowed.discard(router)
+                    self.condition.notify_all()
+
+    def health_check_loop(self, interval=HEALTH_INTERVAL):
+        while True:
+            time.sleep(interval)
+            self.health_check()
+
+    def serve(self, connection):
+        """Handles one client. The first message borrows a router session and the
+        following messages are method calls on that session."""
+
+        router = None
+        clean = False
+        try:
+            request, router, timeout = connection.recv()
+            try:
+                session = self.borrow(router, timeout)
+            except Exception as error:
+                router = None
+                connection.send(('error', str(error)))
+                return
+            connection.send(('ok', None))
+            while True:
+                request, method, args, kwargs = connection.recv()
+                if request == 'release':
+                    clean = True
+                    connection.send(('ok', None))
+                    return
+                if method not in METHODS:
+                    connection.send(('error', 'Method {0} is not allowed'.format(method)))
+                    continue
+                try:
+                    reply = getattr(session, method)(*args, **kwargs)
+                except Exception as error:
+                    connection.send(('error', str(error)))
+                    continue
+                connection.send(('ok', reply_to_xml(reply)))
+        except EOFError:
+            pass
+        finally:
+            if router is not None:
+                # The client went away without releasing. Making sure that it
+                # doesn't leave a locked candidate behind.
+                if not clean:
+                    try:
+                        session.discard_changes()
+                        session.unlock()
+                    except Exception:
+                        pass
+                self.release(router)
+            connection.close()
+
+    def run(self, listen_address):
+        listener = Listener(listen_address, authkey=authkey(create=True))
+        print('Netconf pool listening on {0}:{1}'.format(*listen_address))
+        threading.Thread(target=self.health_check_loop, daemon=True).start()
+        while True:
+            connection = listener.accept()
+            threading.Thread(target=self.serve, args=(connection,), daemon=True).start()
+
+
+def reply_to_xml(reply):
+    """Makes a netconf reply picklable. Junos replies are NCElement objects with
+    the namespaces already removed, other platforms give an RPCReply."""
+
+    if reply is None:
+        return None
+    if hasattr(reply, 'data_xml') and not hasattr(reply, 'xml'):
+        return reply.data_xml
+    return reply.xml
+
+
+class PooledReply:
+    """Stands in for the ncclient reply objects on the script side, with the
+    parts of them that the scripts use."""
+
+    def __init__(self, xml):
+        self.xml = xml
+        self.root = ET.fromstring(xml.encode())
+        self.data = self.root.find('{urn:ietf:params:xml:ns:netconf:base:1.0}data')
+        if self.data is None:
+            self.data = self.root.find('data')
+        self.ok = self.root.find('.//{urn:ietf:params:xml:ns:netconf:base:1.0}ok') is not None
+
+    def xpath(self, expression, namespaces={}):
+        return self.root.xpath(expression, namespaces=namespaces)
+
+
+class PooledSession:
+    """A session borrowed from the pool. Has the same methods as an ncclient
+    manager, but close_session hands the session back to the pool instead of
+    closing it."""
+
+    def __init__(self, router, pool_address, timeout=None):
+        self.router = router
+        self.connection = Client(pool_address, authkey=authkey())
+        self.connection.send(('borrow', router, timeout))
+        status, message = self.connection.recv()
+        if status == 'error':
+            self.connection.close()
+            raise PoolError(message)
+
+    def __getattr__(self, method):
+        def call(*args, **kwargs):
+            # lxml elements can't be pickled, so they are sent as strings.
+            args = [to_string(arg) for arg in args]
+            for key in kwargs:
+                kwargs[key] = to_string(kwargs[key])
+            self.connection.send(('call', method, args, kwargs))
+            status, reply = self.connection.recv()
+            if status == 'error':
+                raise PoolError(reply)
+            if reply is None:
+                return None
+            return PooledReply(reply)
+        return call
+
+    @property
+    def connected(self):
+        return not self.connection.closed
+
+    def close_session(self):
+        self.connection.send(('release', None, None, None))
+        self.connection.recv()
+        self.connection.close()
+
+
+def authkey(create=False):
+    """The shared secret from NETCONF_POOL_AUTHKEY, or else from KEY_FILE. With
+    create, a new random secret is written to KEY_FILE if there is none. A key
+    file that others can read is refused."""
+
+    if os.environ.get('NETCONF_POOL_AUTHKEY'):
+        return os.environ['NETCONF_POOL_AUTHKEY'].encode()
+    if create and not os.path.exists(KEY_FILE):
+        descriptor = os.open(KEY_FILE, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(descriptor, 'w') as key_file:
+            key_file.write(secrets.token_hex(32))
+        print('Wrote a new pool secret to {0}'.format(KEY_FILE))
+    try:
+        mode = os.stat(KEY_FILE).st_mode
+    except FileNotFoundError:
+        raise PoolError('No pool secret: set NETCONF_POOL_AUTHKEY or start the pool '
+            'to create {0}'.format(KEY_FILE))
+    if mode & (stat.S_IRWXG | stat.S_IRWXO):
+        raise PoolError('{0} can be read by others, chmod 600 it'.format(KEY_FILE))
+    with open(KEY_FILE) as key_file:
+        return key_file.read().strip().encode()
+
+def to_string(argument):
+    if ET.iselement(argument):
+        return ET.tostring(argument).decode()
+    return argument
+
+def parse_address(text):
+    host, port = text.rsplit(':', 1)
+    return (host, int(port))
+
+def use(pool_address):
+    """Makes add_vpn.connect borrow sessions from the pool at pool_address."""
+
+    global address
+    address = pool_address
+
+def borrow(router, timeout=None):
+    return PooledSession(router, address, timeout)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-l', '--listen', dest='listen', type=parse_address,
+        default=DEFAULT_ADDRESS, help='address to listen on, host:port')
+    parser.add_argument('-w', '--warm', dest='warm', action='store_true',
+        help='connect to all routers in inventory at start')
+    parser.add_argument('-i', '--idle-timeout', dest='idle_timeout', type=int,
+        default=IDLE_TIMEOUT, help='seconds before an idle session is closed')
+    args = parser.parse_args()
+    pool = SessionPool(args.idle_timeout)
+    if args.warm:
+        pool.warm_up()
+    pool.run(args.listen)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import sessions # MAX_WORKERS
+
+# Seconds that one router may spend in one phase before it counts as failed.
+PHASE_TIMEOUT = 300
+
+_executor = None
+
+
+def executor():
+    """ncclient is blocking, so the netconf calls run in a thread pool that is
+    shared by all phases. Its size limits how many routers are talked to at the
+    same time, the event loop itself can have any number of routers going."""
+
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=sessions.MAX_WORKERS)
+    return _executor
+
+
+class Timeout(TimeoutError):
+    """A function that took longer than its timeout. Its thread can't be stopped,
+    so the function is still running when this is raised."""
+
+
+async def call(function, *args, timeout=None, late=None):
+    """Runs a blocking function in the executor. If it takes longer than timeout
+    seconds the coroutine is cancelled and Timeout is raised. The clock starts
+    when a thread picks the function up, not while it waits for a free thread.
+    A thread that is already running can't be stopped, it finishes in the
+    background and then calls late, if given, with what the function returned or
+    raised, e.g. to close a session that nobody waits for anymore."""
+
+    loop = asyncio.get_running_loop()
+    started = loop.create_future()
+    def job():
+        loop.call_soon_threadsafe(lambda: started.done() or started.set_result(None))
+        return function(*args)
+    work = executor().submit(job)
+    def finish(work):
+        late(work.exception() if work.exception() is not None else work.result())
+    try:
+        await started
+        return await asyncio.wait_for(asyncio.wrap_future(work), timeout)
+    except asyncio.TimeoutError:
+        if late is not None:
+            work.add_done_callback(finish)
+        raise Timeout('timed out after {0} seconds'.format(timeout))
+    except asyncio.CancelledError:
+        if not work.cancel() and late is not None:
+            work.add_done_callback(finish)
+        raise
+
+async def phase(routers, operation, timeout=PHASE_TIMEOUT, late=None):
+    """Runs operation(router) on all routers at the same time and waits for all of
+    them. Returns the outcome for every router, which is what operation returned
+    or the exception that it raised. late(router, outcome) is called for the
+    routers that time out, once their operation is done, see call."""
+
+    async def run_router(router):
+        finish = None
+        if late is not None:
+            finish = lambda outcome: late(router, outcome)
+        try:
+            return await call(operation, router, timeout=timeout, late=finish)
+        except Exception as error:
+            return error
+    outcomes = await asyncio.gather(*[run_router(router) for router in routers])
+    return dict(zip(routers, outcomes))
+
+def run(coroutine):
+    """Runs a phase from the blocking scripts. Ctrl-C cancels the
+    routers that are still waiting."""
+
+    return asyncio.run(coroutine)
@@ -0,0 +1,38 @@
+from ncclient import manager
+
+import drivers
+from inventory import Inventory
+
+# The routers and how to connect to them, shared by the scripts, the netconf pool
+# and the orchestrator. It imports none of them, so a script that is run as
+# __main__ and the modules that it imports all see the same inventory.
+
+# Seconds to wait for the SSH handshake and netconf hello exchange with one router.
+CONNECT_TIMEOUT = 30
+# Upper limit on the number of routers that are talked to at the same time.
+MAX_WORKERS = 32
+
+# PE-routers in network, see inventory.py
+inventory = Inventory()
+
+
+def driver(router):
+    """The driver for the type of router, see drivers.py. None if the scripts
+    can't configure it."""
+
+    return drivers.DRIVERS.get(inventory[router]['type'])
+
+def open_session(router, timeout=CONNECT_TIMEOUT):
+    """Connects to a router in inventory with ncclient."""
+
+    # Junos and IOS-XE have device_params in their driver, XR has none.
+    options = {}
+    if driver(router).device_params is not None:
+        options['device_params'] = driver(router).device_params
+    return manager.connect(host=inventory[router]['ip'],
+                        port=inventory[router].get('port', 830),
+                        username=inventory[router]['user'],
+                        password=inventory[router]['pass'],
+                        hostkey_verify=False,
+                        timeout=timeout,
+                        **options)
@@ -0,0 +1,416 @@
+import multiprocessing
+from multiprocessing.connection import wait
+import os
+import sys
+import threading
+import time
+import traceback
+
+import add_vpn
+import artifacts
+import netconf_pool
+import orchestrator
+import test_vpn
+import tracing
+
+# Sharded provisioning. The routers are split over worker processes, so that
+# building the templates and parsing the replies, which hold the GIL, use more
+# than one core. Every worker builds the templates of its routers and has the
+# sessions to them. The coordinator, in the process that runs the script, starts
+# every phase on all workers and waits for all of them before the next one, so a
+# failure anywhere still stops the change everywhere before it is committed, like
+# add_vpn.provision.
+
+# Worker processes when the script doesn't say.
+PROCESSES = os.cpu_count() or 1
+
+# The workers are forked, whatever the default start method of the platform is.
+# They inherit the modules that the script has imported and set up, and leave
+# without running its atexit handlers, see worker.
+CONTEXT = multiprocessing.get_context('fork')
+
+
+def batch_parameters(paths):
+    """Reads the VPNs in the parameter files at paths and returns a list of
+    cfg_param per router. The batch is made by add_vpn.batch_routers, so that the
+    sharded and the serial script leave out the same VPNs, see
+    add_vpn.vpn_conflicts. The templates that it builds for that are dropped, the
+    workers build their own, or read them from the artifact cache."""
+
+    routers = add_vpn.batch_routers(paths)
+    return dict((router, routers[router]['parameters']) for router in routers)
+
+def shard(routers, count):
+    """Splits the router names into count lists of about the same length."""
+
+    shards = [[] for number in range(count)]
+    for index, router in enumerate(sorted(routers)):
+        shards[index % count].append(router)
+    return [routers for routers in shards if len(routers) > 0]
+
+
+class Shard:
+    """The routers of one worker process. Runs the phases that the coordinator
+    asks for and sends the outcome of every router back as soon as it has one."""
+
+    def __init__(self, connection, parameters, settings):
+        self.connection = connection
+        self.parameters = parameters
+        self.settings = settings
+        self.routers = {}
+        # Routers that timed out in a phase that still uses their sessions.
+        self.busy = set()
+        self.sending = threading.Lock()
+        self.operations = {
+            'build': self.build,
+            'locking': self.lock,
+            'diff against running': self.diff,
+            'edit-config': self.edit_config,
+            'validate': self.validate,
+            'confirmed commit': self.confirmed_commit,
+            'verify': self.verify,
+            'cancel': self.cancel,
+            'final commit': self.commit
+        }
+
+    def send(self, message):
+        # The phases send from the executor threads.
+        with self.sending:
+            self.connection.send(message)
+
+    def outcome(self, description, router, passed, lines):
+        self.send(('outcome', description, router, passed, lines))
+
+    def report(self, reported, description, router, passed, lines):
+        # Only the first outcome of a router counts, a router that timed out can
+        # still finish later.
+        with self.sending:
+            if router in reported:
+                return
+            reported.add(router)
+            self.connection.send(('outcome', description, router, passed, lines))
+
+    def serve(self):
+        while True:
+            command = self.connection.recv()
+            if command[0] == 'drop':
+                for router in command[1]:
+                    self.routers.pop(router, None)
+            elif command[0] == 'connect':
+                self.connect()
+            elif command[0] == 'close':
+                self.close()
+                return
+            else:
+                self.phase(command[1])
+            self.send(('done', command[0]))
+
+    def phase(self, description):
+        """Runs one phase on all routers of the shard at the same time, see
+        orchestrator.phase."""
+
+        operation = self.operations[description]
+        reported = set()
+        def run(router):
+            try:
+                lines, passed = operation(router)
+            except Exception as error:
+                lines, passed = [str(error), 'Something went wrong during {0} on router '
+                    '{1}'.format(description, router)], False
+            self.report(reported, description, router, passed, lines)
+        timeout = orchestrator.PHASE_TIMEOUT
+        if description == 'build':
+            # Nothing to wait for, the templates only need the GIL.
+            for router in self.parameters:
+                run(router)
+            return
+        # A router that timed out is closed when its operation is done, close
+        # leaves it alone.
+        def close_late(router, outcome):
+            self.close_router(router)
+        outcomes = orchestrator.run(orchestrator.phase(list(self.routers), run, timeout,
+            close_late))
+        for router in outcomes:
+            if isinstance(outcomes[router], orchestrator.Timeout):
+                self.busy.add(router)
+            if outcomes[router] is not None:
+                self.report(reported, description, router, False, [str(outcomes[router]),
+                    'Something went wrong during {0} on router {1}'.format(description,
+                    router)])
+
+    def build(self, router):
+        for cfg_param in self.parameters[router]:
+            built = add_vpn.parameter_routers({router: cfg_param})[router]
+            if router not in self.routers:
+                self.routers[router] = built
+                continue
+            if built.get('config') is not None: # None if there is no driver
+                add_vpn.merge_config(self.routers[router]['config'], built['config'])
+            self.routers[router]['vpns'].extend(built['vpns'])
+            self.routers[router]['parameters'].extend(built['parameters'])
+        return [], True
+
+    def connect(self):
+        """Connects to the routers of the shard, see add_vpn.connect_sessions. The
+        ones that can't be reached are reported as failed."""
+
+        errors = []
+        try:
+            unreachable = add_vpn.connect_sessions(self.routers)
+        except Exception as error:
+            unreachable = list(self.routers)
+            errors.append(str(error))
+        for router in self.routers:
+            self.outcome('connect', router, router not in unreachable, errors)
+            errors = []
+
+    # The same netconf operations as in add_vpn.provision. They return the lines
+    # for the coordinator to print and whether they passed.
+
+    def lock(self, router):
+        self.routers[router]['session'].lock('candidate')
+        self.routers[router]['session'].discard_changes()
+        return ['Locking candidate on router {0}'.format(router)], True
+
+    def diff(self, router):
+        running = add_vpn.running_config(self.routers[router]['session'],
+            self.routers[router]['config'])
+        add_vpn.config_diff(self.routers[router]['config'], running)
+        return [], True
+
+    def edit_config(self, router):
+        if len(self.routers[router]['config']) == 0:
+            return ['Router {0} already has the config'.format(router)], True
+        self.routers[router]['session'].edit_config(target='candidate',
+            config=self.routers[router]['config'])
+        return ['Pushing config to candidate on router {0}'.format(router)], True
+
+    def validate(self, router):
+        self.routers[router]['session'].validate(source='candidate')
+        return ['Validating candidate on router {0}'.format(router)], True
+
+    def confirmed_commit(self, router):
+        self.routers[router]['session'].commit(confirmed=True,
+            timeout=str(self.settings.get('confirm_timeout',
+                add_vpn.POLICY['confirm_timeout'])))
+        return [], True
+
+    def verify(self, router):
+        results = test_vpn.verify(self.routers[router]['session'],
+            self.routers[router]['parameters'], router,
+            time.monotonic() + orchestrator.PHASE_TIMEOUT)
+        lines = []
+        for check, status, messages in results:
+            lines.extend(messages)
+        return lines, test_vpn.passed(results, self.settings.get('verify') == 'strict')
+
+    def cancel(self, router):
+        self.routers[router]['session'].cancel_commit()
+        return ['Rolling back the commit on router {0}'.format(router)], True
+
+    def commit(self, router):
+        self.routers[router]['session'].commit()
+        return ['Commit on router {0} successful'.format(router)], True
+
+    def close(self):
+        """Discards what isn't committed and closes the sessions, like
+        add_vpn.close_sessions but without exiting."""
+
+        for router in self.routers:
+            if 'session' in self.routers[router] and router not in self.busy:
+                self.close_router(router)
+
+    def close_router(self, router):
+        try:
+            self.routers[router]['session'].discard_changes()
+            self.routers[router]['session'].unlock()
+            self.routers[router]['session'].close_session()
+            self.outcome('close', router, True, ['Closed session on router {0}'.
+                format(router)])
+        except Exception as error:
+            self.outcome('close', router, False, [str(error),
+                'Could not do clean exit on router {0}'.format(router)])
+
+def worker(connection, inventory, parameters, settings):
+    """Runs one shard in a worker process. The worker has its own in-memory
+    inventory with the routers of the shard, so it doesn't need the database."""
+
+    add_vpn.inventory.open(':memory:')
+    add_vpn.inventory.update(inventory)
+    if settings.get('pool') is not None:
+        netconf_pool.use(settings['pool'])
+    if settings.get('cache') is not None:
+        artifacts.use(settings['cache'])
+    if settings.get('trace') is not None:
+        tracing.enable(settings['trace'])
+    try:
+        Shard(connection, parameters, settings).serve()
+    except Exception:
+        traceback.print_exc()
+    finally:
+        # The worker doesn't run the atexit handler that writes a .json trace.
+        tracing.write_otel()
+        connection.close()
+
+
+class Coordinator:
+    """Starts the worker processes and runs the phases on all of them. Every
+    phase ends when all workers have reported it done, which is the barrier
+    between the phases. settings has the pool, cache and trace of the script and
+    the confirm_timeout and verify of its policy, see provision. Any of them can
+    be left out."""
+
+    def __init__(self, parameters, processes=PROCESSES, settings=None):
+        self.settings = settings or {}
+        self.workers = {}
+        for number, routers in enumerate(shard(parameters, processes), 1):
+            connection, worker_connection = CONTEXT.Pipe()
+            settings = dict(self.settings, trace=shard_path(self.settings.get('trace'), number))
+            process = CONTEXT.Process(target=worker, args=(worker_connection,
+                add_vpn.inventory.resolve(routers),
+                dict((router, parameters[router]) for router in routers), settings),
+                daemon=True)
+            process.start()
+            worker_connection.close()
+            self.workers[connection] = {'process': process, 'routers': set(routers)}
+
+    def routers(self):
+        routers = set()
+        for connection in self.workers:
+            routers |= self.workers[connection]['routers']
+        return routers
+
+    def run(self, command, description=None):
+        """Sends command to every worker and prints the outcomes as they come in.
+        Returns the routers that failed. A worker that dies fails all its routers."""
+
+        failed = set()
+        waiting = set(self.workers)
+        for connection in self.workers:
+            connection.send((command, description))
+        while len(waiting) > 0:
+            for connection in wait(waiting):
+                try:
+                    message = connection.recv()
+                except EOFError:
+                    print('Worker process with routers {0} stopped'.format(
+                        ', '.join(sorted(self.workers[connection]['routers']))))
+                    failed |= self.workers[connection]['routers']
+                    waiting.remove(connection)
+                    continue
+                if message[0] == 'done':
+                    waiting.remove(connection)
+                    continue
+                kind, phase, router, passed, lines = message
+                if phase != description:
+                    continue # from a router that timed out in an earlier phase
+                for line in lines:
+                    print(line)
+                if not passed:
+                    failed.add(router)
+        return failed
+
+    def phase(self, description):
+        return self.run('phase', description)
+
+    def drop(self, routers):
+        self.run('drop', routers)
+        for connection in self.workers:
+            self.workers[connection]['routers'] -= set(routers)
+
+    def close(self):
+        print('Closing all sessions')
+        for connection in list(self.workers):
+            try:
+                connection.send(('close', None))
+            except (BrokenPipeError, OSError):
+                continue
+        self.run_until_closed()
+        for connection in self.workers:
+            self.workers[connection]['process'].join()
+
+    def run_until_closed(self):
+        waiting = set(self.workers)
+        while len(waiting) > 0:
+            for connection in wait(waiting):
+                try:
+                    message = connection.recv()
+                except EOFError:
+                    waiting.remove(connection)
+                    continue
+                if message[0] == 'outcome':
+                    for line in message[4]:
+                        print(line)
+
+    def abort(self):
+        self.close()
+        sys.exit('exit')
+
+def shard_path(path, number):
+    """Trace file of one worker, e.g. trace.json becomes trace.shard1.json."""
+
+    if path is None:
+        return None
+    base, extension = os.path.splitext(path)
+    return '{0}.shard{1}{2}'.format(base, number, extension)
+
+def provision(parameters, processes=PROCESSES, incremental=False, policy=None):
+    """add_vpn.provision for the routers in parameters, see batch_parameters,
+    sharded over processes worker processes."""
+
+    if policy is None:
+        policy = add_vpn.POLICY
+    coordinator = Coordinator(parameters, processes, {
+        'pool': netconf_pool.address,
+        'cache': artifacts.directory,
+        'trace': tracing.path,
+        'confirm_timeout': policy['confirm_timeout'],
+        'verify': policy['verify']
+    })
+
+    # Building the templates in the workers, nothing is sent if one fails.
+    if len(coordinator.phase('build')) > 0:
+        coordinator.abort()
+
+    # Establishing netconf sessions
+    unreachable = coordinator.run('connect', 'connect')
+    if len(unreachable) > 0:
+        for router in sorted(unreachable):
+            print('Router "{0}" not reachable via Netconf'.format(router))
+        if add_vpn.decide(policy, 'unreachable',
+                'Do you want to proceed without unreachable routers?'):
+            for router in sorted(unreachable):
+                print('Removing router "{0}" from sessions.'.format(router))
+            coordinator.drop(unreachable)
+        else:
+            coordinator.abort()
+
+    # Every phase has to pass on every router in every worker before the next
+    # one starts.
+    phases = ['locking', 'edit-config', 'validate']
+    if incremental:
+        phases.insert(1, 'diff against running')
+    for description in phases:
+        if len(coordinator.phase(description)) > 0:
+            coordinator.abort()
+
+    # Doing confirmed commit.
+    if not add_vpn.decide(policy, 'commit', 'Do {0} second confirm commit?'.format(
+            policy['confirm_timeout'])):
+        coordinator.abort()
+    if len(coordinator.phase('confirmed commit')) > 0:
+        coordinator.abort()
+
+    # Confirming if the checks pass, or rolling back on all routers if they don't.
+    if policy['verify'] != 'no':
+        print('Verifying the commit')
+        if len(coordinator.phase('verify')) > 0:
+            print('Verification failed')
+            coordinator.phase('cancel')
+            coordinator.abort()
+    if not add_vpn.decide(policy, 'confirm', 'Confirm the commit?'):
+        coordinator.abort()
+    coordinator.phase('final commit')
+
+    # Unlocking candidate and closing the sessions.
+    coordinator.abort()
@@ -1,121 +1,347 @@
 import argparse
 from lxml import etree as ET
-import ncclient.operations
-import ncclient.transport
-from ncclient import manager
-import socket
-import struct
 import sys
-
-import add_vpn # importing the script that adds a vpn
-
-# PE-routers in network
-inventory = {
-    'lund': {
-        'ip': '192.168.1.128',
-        'user': 'cisco',
-        'pass': 'cisco',
-        'type': 'xr',
-        'id': 1
-    },
-    'malmo': {
-        'ip': '192.168.1.133',
-        'user': 'junos',
-        'pass': 'junos123',
-        'type': 'junos',
-        'id': 2
-    },
-    'oslo': {
-        'ip': '192.168.1.127',
-        'user': 'admin',
-        'pass': 'admin',
-        'type': 'ios',
-        'id': 3
-    },
-    'stockholm': {
-        'ip': '192.168.1.132',
-        'user': 'cisco',
-        'pass': 'cisco',
-        'type': 'xr',
-        'id': 4
-    },
-    'sundsvall': {
-        'ip': '192.168.1.131',
-        'user': 'cisco',
-        'pass': 'cisco',
-        'type': 'xr',
-        'id': 5
-    }
-}
+import time
+
+import drivers
+import netconf_pool
+import sessions
+import tracing
+import xpaths
+
+# PE-routers in network, shared with add_vpn.py
+inventory = sessions.inventory
+
+class Snapshot:
+    """Router state for the checks. Every request is sent to the router the first
+    time a check needs it, and the reply is kept as an lxml element for the checks
+    that follow."""
+
+    def __init__(self, session):
+        self.session = session
+        self.replies = {}
+
+    def fetch(self, name, request):
+        if name not in self.replies:
+            self.replies[name] = self.element(request())
+        return self.replies[name]
+
+    def element(self, reply):
+        return reply.data
+
+class JunosSnapshot(Snapshot):
+    """The Junos checks need three round trips to the router, and the verify
+    checks one more for the committed VRF."""
+
+    def element(self, reply):
+        # Junos replies are not lxml elements, but their xml has no namespaces.
+        return ET.fromstring(netconf_pool.reply_to_xml(reply).encode())
+
+    def interfaces(self):
+        rpc = '<get-interface-information><terse/></get-interface-information>'
+        return self.fetch('interfaces', lambda: self.session.rpc(rpc))
+
+    def instances(self):
+        rpc = '<get-instance-information><detail/></get-instance-information>'
+        return self.fetch('instances', lambda: self.session.rpc(rpc))
+
+    def config(self):
+        # Communities and policers in one filter.
+        config_filter = '''
+        <filter type="subtree">
+            <configuration>
+                <policy-options>
+                    <community>
+                    </community>
+                </policy-options>
+                <firewall>
+                    <policer>
+                    </policer>
+                </firewall>
+            </configuration>
+        </filter>
+        '''
+        return self.fetch('config', lambda: self.session.get_config(source='candidate',
+            filter=config_filter))
+
+    def running(self):
+        # The routing instances, as committed.
+        config_filter = '''
+        <filter type="subtree">
+            <configuration>
+                <routing-instances>
+                </routing-instances>
+            </configuration>
+        </filter>
+        '''
+        return self.fetch('running', lambda: self.session.get_config(source='running',
+            filter=config_filter))
+
+class XrSnapshot(Snapshot):
+    """The XR checks need two round trips to the router, one for operational data
+    and one for configuration. The verify checks also get the committed VRF."""
+
+    def oper(self):
+        # Interface state, and the interfaces with ipv4 and ipv6 configuration.
+        oper_filter = '''
+        <filter type="subtree">
+            <interface-properties xmlns="http://cisco.com/ns/yang/Cisco-IOS-XR-ifmgr-oper">
+                <data-nodes>
+                    <data-node>
+                        <system-view>
+                            <interfaces>
+                                <interface>
+                                </interface>
+                            </interfaces>
+                        </system-view>
+                    </data-node>
+                </data-nodes>
+            </interface-properties>
+            <ipv4-network xmlns="http://cisco.com/ns/yang/Cisco-IOS-XR-ipv4-io-oper">
+                <nodes>
+                    <node>
+                        <interface-data>
+                            <vrfs>
+                                <vrf>
+                                    <briefs>
+                                        <brief>
+                                            <interface-name>
+                                            </interface-name>
+                                        </brief>
+                                    </briefs>
+                                </vrf>
+                            </vrfs>
+                        </interface-data>
+                    </node>
+                </nodes>
+            </ipv4-network>
+            <ipv6-network xmlns="http://cisco.com/ns/yang/Cisco-IOS-XR-ipv6-ma-oper">
+                <nodes>
+                    <node>
+                        <interface-data>
+                            <vrfs>
+                                <vrf>
+                                    <briefs>
+                                        <brief>
+                                            <interface-name>
+                                            </interface-name>
+                                        </brief>
+                                    </briefs>
+                                </vrf>
+                            </vrfs>
+                        </interface-data>
+                    </node>
+                </nodes>
+            </ipv6-network>
+        </filter>
+        '''
+        return self.fetch('oper', lambda: self.session.get(oper_filter))
+
+    def config(self):
+        # VRFs, BGP and policy maps in one filter.
+        config_filter = '''
+        <filter type="subtree">
+            <vrfs xmlns="http://cisco.com/ns/yang/Cisco-IOS-XR-infra-rsi-cfg">
+            </vrfs>
+            <bgp xmlns="http://cisco.com/ns/yang/Cisco-IOS-XR-ipv4-bgp-cfg">
+            </bgp>
+            <policy-manager xmlns="http://cisco.com/ns/yang/Cisco-IOS-XR-infra-policymgr-cfg">
+                <policy-maps>
+                </policy-maps>
+            </policy-manager>
+        </filter>
+        '''
+        return self.fetch('config', lambda: self.session.get_config(source='candidate',
+            filter=config_filter))
+
+    def running(self):
+        # The interfaces, VRFs and BGP, as committed.
+        config_filter = '''
+        <filter type="subtree">
+            <interface-configurations xmlns="http://cisco.com/ns/yang/Cisco-IOS-XR-ifmgr-cfg">
+            </interface-configurations>
+            <vrfs xmlns="http://cisco.com/ns/yang/Cisco-IOS-XR-infra-rsi-cfg">
+            </vrfs>
+            <bgp xmlns="http://cisco.com/ns/yang/Cisco-IOS-XR-ipv4-bgp-cfg">
+            </bgp>
+        </filter>
+        '''
+        return self.fetch('running', lambda: self.session.get_config(source='running',
+            filter=config_filter))
+
+class IosSnapshot(Snapshot):
+    """The IOS-XE checks need two round trips to the router, like the XR checks,
+    and the verify checks one more."""
+
+    def oper(self):
+        # Interface state from the ietf-interfaces yang module.
+        oper_filter = '''
+        <filter type="subtree">
+            <interfaces-state xmlns="urn:ietf:params:xml:ns:yang:ietf-interfaces">
+                <interface>
+                </interface>
+            </interfaces-state>
+        </filter>
+        '''
+        return self.fetch('oper', lambda: self.session.get(oper_filter))
+
+    def config(self):
+        # VRFs, interfaces and policy maps in one filter.
+        config_filter = '''
+        <filter type="subtree">
+            <native xmlns="http://cisco.com/ns/yang/Cisco-IOS-XE-native">
+                <vrf>
+                </vrf>
+                <interface>
+                </interface>
+                <policy>
+                </policy>
+            </native>
+        </filter>
+        '''
+        return self.fetch('config', lambda: self.session.get_config(source='candidate',
+            filter=config_filter))
+
+    def running(self):
+        # The VRFs, interfaces and BGP, as committed.
+        config_filter = '''
+        <filter type="subtree">
+            <native xmlns="http://cisco.com/ns/yang/Cisco-IOS-XE-native">
+                <vrf>
+                </vrf>
+                <interface>
+                </interface>
+                <router>
+                </router>
+            </native>
+        </filter>
+        '''
+        return self.fetch('running', lambda: self.session.get_config(source='running',
+            filter=config_filter))
+
+def run_checks(snapshot, checks, cfg_param, router, deadline=None):
+    """Runs the checks against the snapshot of one router. Returns a list with
+    (check name, status, messages) for every check, where status is pass, warn or
+    fail. A check fails if it returns an error message or raises, e.g. because
+    the router didn't answer, and the checks that haven't started when the
+    deadline (time.monotonic()) has passed fail without running."""
+
+    results = []
+    for check in checks:
+        if deadline is not None and time.monotonic() > deadline:
+            results.append((check.__name__, 'fail', ['error: timed out on router "{0}"'.
+                format(router)]))
+            continue
+        try:
+            with tracing.span(check.__name__, router):
+                warnings = check(snapshot, cfg_param, router)
+        except Exception as error:
+            results.append((check.__name__, 'fail', ['error: {0} on router "{1}": {2}'.
+                format(check.__name__, router, error)]))
+            continue
+        if any(warning.startswith('error:') for warning in warnings):
+            results.append((check.__name__, 'fail', warnings))
+        elif len(warnings) > 0:
+            results.append((check.__name__, 'warn', warnings))
+        else:
+            results.append((check.__name__, 'pass', []))
+    return results
+
+def print_results(results):
+    for check, status, messages in results:
+        for message in messages:
+            print(message)
+
+def passed(results, strict=False):
+    """True if none of the results of run_checks failed. A warning is often about
+    something that was there before the VPN, e.g. an interface that is down, so it
+    only counts if strict."""
+
+    failing = ['fail', 'warn'] if strict else ['fail']
+    return all(status not in failing for check, status, messages in results)
+
+def vrf_errors(cfg_param, router, rd, interfaces, neighbors, loopback):
+    """The errors of the *_test_vrf checks. rd, interfaces and neighbors are the
+    route distinguisher, interface names and bgp neighbor addresses that the
+    router has in the VRF, loopback the name of the VPN's loopback."""
+
+    errors = []
+    if rd != '100:{0}'.format(cfg_param.vpn_id):
+        errors.append('error: vrf "{0}" on router "{1}" has route distinguisher {2}, not '
+            '100:{3}'.format(cfg_param.vrf_name, router, rd, cfg_param.vpn_id))
+    for interface_name in cfg_param.interface_names() + [loopback]:
+        if interface_name not in interfaces:
+            errors.append('error: interface {0} on router "{1}" is not in vrf "{2}"'.format(
+                interface_name, router, cfg_param.vrf_name))
+    for bgp_neighbor in cfg_param.bgp_neighbors:
+        if bgp_neighbor.address not in neighbors:
+            errors.append('error: bgp neighbor {0} on router "{1}" is not in vrf "{2}"'.
+                format(bgp_neighbor.address, router, cfg_param.vrf_name))
+    return errors
 
 def junos_tests(session, cfg_param, router):
-    junos_test_int_exists(session, cfg_param, router)
-    junos_test_int_config(session, cfg_param, router)
-    junos_test_int_status(session, cfg_param, router)
-    junos_test_vrf_used(session, cfg_param, router)
-    junos_test_rd_used(session, cfg_param, router)
-    junos_test_rt_used(session, cfg_param, router)
-    junos_test_policer(session, cfg_param, router)
+    print_results(run_checks(JunosSnapshot(session), JUNOS_CHECKS, cfg_param, router))
     return
 
-def junos_test_int_exists(session, cfg_param, router):
-    rpc = "<get-interface-information><terse/></get-interface-information>"
-    response = session.rpc(rpc)
-    filtered_response = response.xpath('//physical-interface/name')
+def junos_test_int_exists(snapshot, cfg_param, router):
+    warnings = []
+    response = snapshot.interfaces()
+    filtered_response = xpaths.JUNOS_INTERFACE_NAMES(response)
     interfaces = []
     for interface in filtered_response:
         interfaces.append(interface.text.strip())
-    for interface_name in cfg_param['interfaces']:
+    for interface_name in cfg_param.interface_names():
         if interface_name not in interfaces:
-            print('warning: interface {0} doesn\'t exist on router "{1}"'.format(
+            warnings.append('warning: interface {0} doesn\'t exist on router "{1}"'.format(
                 interface_name, router))
-    return
+    return warnings
     
-def junos_test_int_config(session, cfg_param, router):
-    rpc = '<get-interface-information><terse/></get-interface-information>'
-    response = session.rpc(rpc)
-    for interface_name in cfg_param['interfaces']:
-        filtered_response = response.xpath('''//physical-interface/name[text()='\n{0}\n']
-            /../logical-interface'''.format(interface_name))
+def junos_test_int_config(snapshot, cfg_param, router):
+    warnings = []
+    response = snapshot.interfaces()
+    for interface_name in cfg_param.interface_names():
+        filtered_response = xpaths.JUNOS_LOGICAL_INTERFACES(response,
+            interface='\n{0}\n'.format(interface_name))
         if len(filtered_response) > 0:
-            print('warning: existing logical interface(s) detected on {0} on router "{1}"'.
-                format(interface_name, router))
-    return
+            warnings.append('warning: existing logical interface(s) detected on {0} on '
+                'router "{1}"'.format(interface_name, router))
+    return warnings
     
-def junos_test_int_status(session, cfg_param, router):
-    rpc = '<get-interface-information><terse/></get-interface-information>'
-    response = session.rpc(rpc)
-    for interface_name in cfg_param['interfaces']:
-        filtered_response = response.xpath('''//physical-interface/name[text()='\n{0}\n']
-            /../admin-status'''.format(interface_name))
+def junos_test_int_status(snapshot, cfg_param, router):
+    warnings = []
+    response = snapshot.interfaces()
+    for interface_name in cfg_param.interface_names():
+        filtered_response = xpaths.JUNOS_ADMIN_STATUS(response,
+            interface='\n{0}\n'.format(interface_name))
         if len(filtered_response) > 0:
             if filtered_response[0].text.strip() == 'down':
-                print('warning: interface {0} on router "{1}" is shutdown'.
+                warnings.append('warning: interface {0} on router "{1}" is shutdown'.
                     format(interface_name, router))
-    return
+    return warnings
 
-def junos_test_vrf_used(session, cfg_param, router):
-    vrf_name = cfg_param['vrf_name']
-    rpc = "<get-instance-information><detail/></get-instance-information>"
-    response = session.rpc(rpc)
-    filtered_response = response.xpath('//instance-name')
+def junos_test_vrf_used(snapshot, cfg_param, router):
+    warnings = []
+    vrf_name = cfg_param.vrf_name
+    response = snapshot.instances()
+    filtered_response = xpaths.JUNOS_INSTANCE_NAMES(response)
     for name in filtered_response:
         if name.text == vrf_name:
-            print('warning: vrf {0} is already configured on router "{1}"'.
+            warnings.append('warning: vrf {0} is already configured on router "{1}"'.
                 format(vrf_name, router))
-    return
+    return warnings
 
-def junos_test_rd_used(session, cfg_param, router):
-    rpc = "<get-instance-information><detail/></get-instance-information>"
-    response = session.rpc(rpc)
-    filtered_response = response.xpath("//route-distinguisher")
-    rd = cfg_param['customer_rt'] # rd and rt are the same value.
+def junos_test_rd_used(snapshot, cfg_param, router):
+    warnings = []
+    response = snapshot.instances()
+    filtered_response = xpaths.JUNOS_ROUTE_DISTINGUISHERS(response)
+    rd = cfg_param.customer_rt # rd and rt are the same value.
     for route_distinguisher in filtered_response:
         if route_distinguisher.text == rd:
-            print('warning: RD {0} already in use on router "{1}"'.format(rd, router))
-    return
+            warnings.append('warning: RD {0} already in use on router "{1}"'.format(rd,
+                router))
+    return warnings
 
-def junos_test_rt_used(session, cfg_param, router):
+def junos_test_rt_used(snapshot, cfg_param, router):
     """Check if an extended community rt list is configured that matches
     the customer rt. 
 
@@ -124,267 +350,345 @@ def junos_test_rt_used(session, cfg_param, router):
     not quite right. Unlike XR, import rt is not explicitly defined in
     the vrf configuration; only an import policy.
     """
+    warnings = []
     configured_communities = []
-    community_filter = '''
-    <configuration>
-        <policy-options>
-            <community>
-            </community>
-        </policy-options>
-    </configuration>
-    '''
-    response = session.get_config(source='candidate', filter=('subtree', community_filter))
-    communities = response.xpath('//members')
+    response = snapshot.config()
+    communities = xpaths.JUNOS_COMMUNITY_MEMBERS(response)
     for comm in communities:
         configured_communities.append(comm.text)
-    if 'target:' + cfg_param['customer_rt'] in configured_communities:
-        print('warning: a community list with rt {0} is already configured on router "{1}"'.
-            format(cfg_param['customer_rt'], router))
+    if 'target:' + cfg_param.customer_rt in configured_communities:
+        warnings.append('warning: a community list with rt {0} is already configured on '
+            'router "{1}"'.format(cfg_param.customer_rt, router))
+    return warnings
 
-def junos_test_policer(session, cfg_param, router):
+def junos_test_policer(snapshot, cfg_param, router):
     """Gets the names of the configured policers from the router configuration
-    and compares them to the policer in the cfg_param.
+    and compares them to the policers of the interfaces in cfg_param.
     """
+    warnings = []
     configured_policers = []
-    policer_filter = '''
-    <configuration>
-        <firewall>
-            <policer>
-            </policer>
-        </firewall>
-    </configuration>
-    '''
-    response = session.get_config(source='candidate', filter=('subtree', policer_filter))
-    filtered_response = response.xpath('//name')
+    response = snapshot.config()
+    # The reply also has the communities, which have names too.
+    filtered_response = xpaths.JUNOS_POLICER_NAMES(response)
     for policer_name in filtered_response:
         configured_policers.append(policer_name.text)
-    for interface_name in cfg_param['interfaces']:
-        policer = 'POLICE_{0}M'.format(cfg_param['interfaces'][interface_name]['bandwidth'])
+    for interface in cfg_param.interfaces:
+        policer = 'POLICE_{0}M'.format(interface.bandwidth)
         if policer not in configured_policers:
-            print('warning: policer {0} is not configured on router "{1}"'.format(
+            warnings.append('warning: policer {0} is not configured on router "{1}"'.format(
                 policer, router))
-    return
+    return warnings
+
+def junos_test_vrf(snapshot, cfg_param, router):
+    """The committed routing instance, with its route distinguisher, interfaces and
+    bgp neighbors."""
+
+    instances = xpaths.JUNOS_INSTANCE(snapshot.running(), vrf=cfg_param.vrf_name)
+    if len(instances) == 0:
+        return ['error: vrf "{0}" is not configured on router "{1}"'.format(
+            cfg_param.vrf_name, router)]
+    instance = instances[0]
+    return vrf_errors(cfg_param, router,
+        (instance.findtext('route-distinguisher/rd-type') or '').strip(),
+        [name.text.strip() for name in instance.iterfind('interface/name')],
+        [name.text.strip() for name in instance.iterfind('protocols/bgp/group/neighbor/name')],
+        'lo0.{0}'.format(cfg_param.vpn_id))
 
 def xr_tests(session, cfg_param, router):
-    xr_test_int_exists(session, cfg_param, router)
-    xr_test_int_config(session, cfg_param, router)
-    xr_test_int_status(session, cfg_param, router)
-    xr_test_vrf_used(session, cfg_param, router)
-    xr_test_rd_used(session, cfg_param, router)
-    xr_test_rt_used(session, cfg_param, router)
-    xr_test_policer(session, cfg_param, router)
+    print_results(run_checks(XrSnapshot(session), XR_CHECKS, cfg_param, router))
     return
 
-def xr_test_int_exists(session, cfg_param, router):
-    """Gets interface operational data from Cisco-IOS-XR-ifmgr-oper yang module."""
+def xr_test_int_exists(snapshot, cfg_param, router):
+    """Uses interface operational data from Cisco-IOS-XR-ifmgr-oper yang module."""
     
-    # Defines a prefix:namespace mapping for the xpath filter.
-    namespace = {'x': 'http://cisco.com/ns/yang/Cisco-IOS-XR-ifmgr-oper'}
-    # Subtree filter to make the router only send the data that we're interested in.
-    interface_filter = '''
-    <interface-properties xmlns="http://cisco.com/ns/yang/Cisco-IOS-XR-ifmgr-oper">
-        <data-nodes>
-            <data-node>
-                <system-view>
-                    <interfaces>
-                        <interface>
-                            <interface-name></interface-name>
-                        </interface>
-                    </interfaces>
-                </system-view>
-            </data-node>
-        </data-nodes>
-    </interface-properties>'''
-    response = session.get(('subtree', interface_filter))
-    interface_names = response.data.xpath('//x:interface-name', namespaces=namespace)
+    warnings = []
+    response = snapshot.oper()
+    interface_names = xpaths.XR_INTERFACE_NAMES(response)
     interfaces = []
     for name in interface_names:
         interfaces.append(name.text)
-    for interface_name in cfg_param['interfaces']:
+    for interface_name in cfg_param.interface_names():
         if interface_name not in interfaces:
-            print('warning: interface {0} doesn\'t exist on router "{1}"'.format(
+            warnings.append('warning: interface {0} doesn\'t exist on router "{1}"'.format(
                 interface_name, router))
-    return
+    return warnings
 
-def xr_test_int_config(session, cfg_param, router):
+def xr_test_int_config(snapshot, cfg_param, router):
+    warnings = []
     # List for interfaces with active ipv4 configuration
     ipv4_interfaces = []
     # List for interfaces with active ipv6 configuration
     ipv6_interfaces = []
+    response = snapshot.oper()
 
     # This yang module provides ipv4 operational data.
-    namespace = {'x': 'http://cisco.com/ns/yang/Cisco-IOS-XR-ipv4-io-oper'}
-    ipv4_filter = '''
-    <ipv4-network xmlns="http://cisco.com/ns/yang/Cisco-IOS-XR-ipv4-io-oper">
-        <nodes>
-            <node>
-                <interface-data>
-                    <vrfs>
-                        <vrf>
-                            <briefs>
-                                <brief>
-                                    <interface-name>
-                                    </interface-name>
-                                </brief>
-                            </briefs>
-                        </vrf>
-                    </vrfs>
-                </interface-data>
-            </node>
-        </nodes>
-    </ipv4-network>
-    '''
-    response = session.get(('subtree', ipv4_filter))
-    interface_names = response.data.xpath('//x:interface-name', namespaces=namespace)
+    interface_names = xpaths.XR_IPV4_INTERFACE_NAMES(response)
     for name in interface_names:
         ipv4_interfaces.append(name.text)
     
     # This yang module provides ipv6 operational data.
-    namespace = {'x': 'http://cisco.com/ns/yang/Cisco-IOS-XR-ipv6-ma-oper'}
-    ipv6_filter = '''
-    <ipv6-network xmlns="http://cisco.com/ns/yang/Cisco-IOS-XR-ipv6-ma-oper"> 
-        <nodes>
-            <node>
-                <interface-data>
-                    <vrfs>
-                        <vrf>
-                            <briefs>
-                                <brief>
-                                    <interface-name>
-                                    </interface-name>
-                                </brief>
-                            </briefs>
-                        </vrf>
-                    </vrfs>
-                </interface-data>
-            </node>
-        </nodes>
-    </ipv6-network>
-    '''
-    response = session.get(('subtree', ipv6_filter))
-    interface_names = response.data.xpath('//x:interface-name', namespaces=namespace)
+    interface_names = xpaths.XR_IPV6_INTERFACE_NAMES(response)
     for name in interface_names:
         ipv6_interfaces.append(name.text)
 
-    for interface_name in cfg_param['interfaces']:
+    for interface_name in cfg_param.interface_names():
         if interface_name in ipv4_interfaces:
-            print('warning: interface {0} on router "{1}" has ipv4 configuration'.
-                format(interface_name, router))
+            warnings.append('warning: interface {0} on router "{1}" has ipv4 '
+                'configuration'.format(interface_name, router))
         if interface_name in ipv6_interfaces:
-            print('warning: interface {0} on router "{1}" has ipv6 configuration'.
-                format(interface_name, router))
-    return
+            warnings.append('warning: interface {0} on router "{1}" has ipv6 '
+                'configuration'.format(interface_name, router))
+    return warnings
 
-def xr_test_int_status(session, cfg_param, router):
-    """Gets interface operational data from Cisco-IOS-XR-ifmgr-oper yang module."""
+def xr_test_int_status(snapshot, cfg_param, router):
+    """Uses interface operational data from Cisco-IOS-XR-ifmgr-oper yang module."""
     
-    # Defines a prefix:namespace mapping for the xpath filter.
-    namespace = {'x': 'http://cisco.com/ns/yang/Cisco-IOS-XR-ifmgr-oper'}
-    # Subtree filter to make the router only send the data that we're interested in.
-    interface_filter = '''
-    <interface-properties xmlns="http://cisco.com/ns/yang/Cisco-IOS-XR-ifmgr-oper">
-        <data-nodes>
-            <data-node>
-                <system-view>
-                    <interfaces>
-                        <interface>
-                        </interface>
-                    </interfaces>
-                </system-view>
-            </data-node>
-        </data-nodes>
-    </interface-properties>'''
-    response = session.get(('subtree', interface_filter))
-    for interface_name in cfg_param['interfaces']:
-        filtered_response = response.data.xpath('''//x:interface-name[text()='{0}']/..'''.
-            format(interface_name), namespaces=namespace)
+    warnings = []
+    response = snapshot.oper()
+    for interface_name in cfg_param.interface_names():
+        filtered_response = xpaths.XR_INTERFACE(response, interface=interface_name)
         if len(filtered_response) > 0:        
             state = filtered_response[0][3].text
             if state == 'im-state-admin-down':
-                print('warning: interface {0} on router "{1}" is shutdown'.
+                warnings.append('warning: interface {0} on router "{1}" is shutdown'.
                     format(interface_name, router))
-    return
+    return warnings
 
-def xr_test_vrf_used(session, cfg_param, router):
+def xr_test_vrf_used(snapshot, cfg_param, router):
+    warnings = []
     configured_vrfs = []
-    namespace = {'x': 'http://cisco.com/ns/yang/Cisco-IOS-XR-infra-rsi-cfg'}
-    vrf_filter = '''
-    <vrfs xmlns="http://cisco.com/ns/yang/Cisco-IOS-XR-infra-rsi-cfg">
-    </vrfs>
-    '''
-    response = session.get_config(source='candidate', filter=('subtree', vrf_filter))
-    vrf_names = response.data.xpath('//x:vrf-name', namespaces=namespace)
+    response = snapshot.config()
+    vrf_names = xpaths.XR_VRF_NAMES(response)
     for vrf_name in vrf_names:
         configured_vrfs.append(vrf_name.text)
-    if cfg_param['vrf_name'] in configured_vrfs:
-        print('warning: vrf "{0}" is already configured on router "{1}"'.format(
-            cfg_param['vrf_name'], router))
-    return
+    if cfg_param.vrf_name in configured_vrfs:
+        warnings.append('warning: vrf "{0}" is already configured on router "{1}"'.format(
+            cfg_param.vrf_name, router))
+    return warnings
 
-def xr_test_rd_used(session, cfg_param, router):
+def xr_test_rd_used(snapshot, cfg_param, router):
+    warnings = []
     configured_rds = []
-    namespace = {'x': 'http://cisco.com/ns/yang/Cisco-IOS-XR-ipv4-bgp-cfg'}
-    bgp_filter = '''
-    <bgp xmlns="http://cisco.com/ns/yang/Cisco-IOS-XR-ipv4-bgp-cfg"></bgp>
-    '''
-    response = session.get_config(source='candidate', filter=('subtree', bgp_filter))
-    rds = response.data.xpath('//x:route-distinguisher', namespaces=namespace)
+    response = snapshot.config()
+    rds = xpaths.XR_ROUTE_DISTINGUISHERS(response)
     for rd in rds:
         asn = rd[2].text
         asn_index = rd[3].text
         route_distinguisher = asn + ':' + asn_index
         configured_rds.append(route_distinguisher)
-    if cfg_param['customer_rt'] in configured_rds: # customer_rt == customer_rd
-        print('warning: RD "{0}" is already in use on router "{1}"'.format(
-            cfg_param['customer_rt'], router))
-    return
+    if cfg_param.customer_rt in configured_rds: # customer_rt == customer_rd
+        warnings.append('warning: RD "{0}" is already in use on router "{1}"'.format(
+            cfg_param.customer_rt, router))
+    return warnings
 
-def xr_test_rt_used(session, cfg_param, router):
+def xr_test_rt_used(snapshot, cfg_param, router):
     """To prevent accidental leaking of our prefixes to another VPN we need 
     to make sure that no existing VRFs are importing the RT that we are about
     to export."""
 
+    warnings = []
     # Will hold the configured import RTs on this router.
     configured_import_rts = []
 
-    namespace = {'x': 'http://cisco.com/ns/yang/Cisco-IOS-XR-ipv4-bgp-cfg'}
-    vrf_filter = '''
-    <vrfs xmlns="http://cisco.com/ns/yang/Cisco-IOS-XR-infra-rsi-cfg">
-    </vrfs>
-    '''
-    response = session.get_config(source='candidate', filter=('subtree', vrf_filter))
-    import_route_targets = response.data.xpath('''//x:import-route-targets/x:route-targets/
-        x:route-target/x:as-or-four-byte-as''', namespaces=namespace)
+    response = snapshot.config()
+    # Only the VRF configuration, the reply also has the BGP configuration.
+    import_route_targets = xpaths.XR_IMPORT_ROUTE_TARGETS(response)
     for import_target in import_route_targets:
         asn = import_target[1].text
         asn_index = import_target[2].text
         import_rt = asn + ':' + asn_index
         configured_import_rts.append(import_rt)
-    if cfg_param['customer_rt'] in configured_import_rts:
-        print('warning: customer rt "{0}" imported by existing VRF on router "{1}"'.format(
-            cfg_param['customer_rt'], router))
-    return
+    if cfg_param.customer_rt in configured_import_rts:
+        warnings.append('warning: customer rt "{0}" imported by existing VRF on router '
+            '"{1}"'.format(cfg_param.customer_rt, router))
+    return warnings
 
-def xr_test_policer(session, cfg_param, router):
+def xr_test_policer(snapshot, cfg_param, router):
+    warnings = []
     configured_policers = []
-    namespace = {'x': 'http://cisco.com/ns/yang/Cisco-IOS-XR-infra-policymgr-cfg'}
-    policer_filter = '''
-    <policy-manager xmlns="http://cisco.com/ns/yang/Cisco-IOS-XR-infra-policymgr-cfg">
-        <policy-maps>
-        </policy-maps>
-    </policy-manager>
-    '''
-    response = session.get_config(source='candidate', filter=('subtree', policer_filter))
-    policer_names = response.data.xpath('//x:name', namespaces=namespace)
+    response = snapshot.config()
+    policer_names = xpaths.XR_POLICY_MAP_NAMES(response)
     for name in policer_names:
         configured_policers.append(name.text)
-    for interface_name in cfg_param['interfaces']:
-        policer = 'POLICE_{0}M'.format(cfg_param['interfaces'][interface_name]['bandwidth'])
+    for interface in cfg_param.interfaces:
+        policer = 'POLICE_{0}M'.format(interface.bandwidth)
         if policer not in configured_policers:
-            print('warning: policer "{0}" not configured on router "{1}"'.format(
+            warnings.append('warning: policer "{0}" not configured on router "{1}"'.format(
                 policer, router))
+    return warnings
+
+def xr_test_vrf(snapshot, cfg_param, router):
+    """See junos_test_vrf. The route distinguisher and the neighbors are in the
+    BGP configuration of the VRF."""
+
+    response = snapshot.running()
+    bgp_vrfs = xpaths.XR_BGP_VRF(response, vrf=cfg_param.vrf_name)
+    if len(xpaths.XR_VRF(response, vrf=cfg_param.vrf_name)) == 0 or len(bgp_vrfs) == 0:
+        return ['error: vrf "{0}" is not configured on router "{1}"'.format(
+            cfg_param.vrf_name, router)]
+    rd = bgp_vrfs[0].find('{*}vrf-global/{*}route-distinguisher')
+    if rd is not None:
+        rd = '{0}:{1}'.format(rd.findtext('{*}as'), rd.findtext('{*}as-index'))
+    return vrf_errors(cfg_param, router, rd,
+        [name.text for name in xpaths.XR_VRF_INTERFACE_NAMES(response,
+            vrf=cfg_param.vrf_name)],
+        [address.text for address in bgp_vrfs[0].iterfind(
+            '{*}vrf-neighbors/{*}vrf-neighbor/{*}neighbor-address')],
+        'Loopback{0}'.format(cfg_param.vpn_id))
+
+def ios_tests(session, cfg_param, router):
+    print_results(run_checks(IosSnapshot(session), IOS_CHECKS, cfg_param, router))
     return
 
+def ios_test_int_exists(snapshot, cfg_param, router):
+    """Uses interface operational data from the ietf-interfaces yang module."""
+
+    warnings = []
+    response = snapshot.oper()
+    interfaces = []
+    for name in xpaths.IOS_INTERFACE_NAMES(response):
+        interfaces.append(name.text)
+    for interface_name in cfg_param.interface_names():
+        if interface_name not in interfaces:
+            warnings.append('warning: interface {0} doesn\'t exist on router "{1}"'.format(
+                interface_name, router))
+    return warnings
+
+def ios_test_int_config(snapshot, cfg_param, router):
+    """An interface that already has an address or a VRF is in use."""
+
+    warnings = []
+    response = snapshot.config()
+    for interface_name in cfg_param.interface_names():
+        interface_type, number = drivers.ios_interface_name(interface_name)
+        for interface in xpaths.IOS_INTERFACE(response, type=interface_type, number=number):
+            if interface.find('{*}ip/{*}address') is not None:
+                warnings.append('warning: interface {0} on router "{1}" has ipv4 '
+                    'configuration'.format(interface_name, router))
+            if interface.find('{*}vrf') is not None:
+                warnings.append('warning: interface {0} on router "{1}" is in a vrf'.format(
+                    interface_name, router))
+    return warnings
+
+def ios_test_int_status(snapshot, cfg_param, router):
+    warnings = []
+    response = snapshot.oper()
+    for interface_name in cfg_param.interface_names():
+        filtered_response = xpaths.IOS_ADMIN_STATUS(response, interface=interface_name)
+        if len(filtered_response) > 0:
+            if filtered_response[0].text == 'down':
+                warnings.append('warning: interface {0} on router "{1}" is shutdown'.
+                    format(interface_name, router))
+    return warnings
+
+def ios_test_vrf_used(snapshot, cfg_param, router):
+    warnings = []
+    response = snapshot.config()
+    for vrf_name in xpaths.IOS_VRF_NAMES(response):
+        if vrf_name.text == cfg_param.vrf_name:
+            warnings.append('warning: vrf "{0}" is already configured on router "{1}"'.
+                format(cfg_param.vrf_name, router))
+    return warnings
+
+def ios_test_rd_used(snapshot, cfg_param, router):
+    warnings = []
+    response = snapshot.config()
+    for rd in xpaths.IOS_ROUTE_DISTINGUISHERS(response):
+        if rd.text == cfg_param.customer_rt: # customer_rt == customer_rd
+            warnings.append('warning: RD "{0}" is already in use on router "{1}"'.format(
+                cfg_param.customer_rt, router))
+    return warnings
+
+def ios_test_rt_used(snapshot, cfg_param, router):
+    """See xr_test_rt_used."""
+
+    warnings = []
+    response = snapshot.config()
+    for import_rt in xpaths.IOS_IMPORT_ROUTE_TARGETS(response):
+        if import_rt.text == cfg_param.customer_rt:
+            warnings.append('warning: customer rt "{0}" imported by existing VRF on router '
+                '"{1}"'.format(cfg_param.customer_rt, router))
+            break
+    return warnings
+
+def ios_test_policer(snapshot, cfg_param, router):
+    warnings = []
+    configured_policers = []
+    response = snapshot.config()
+    for name in xpaths.IOS_POLICY_MAP_NAMES(response):
+        configured_policers.append(name.text)
+    for interface in cfg_param.interfaces:
+        policer = 'POLICE_{0}M'.format(interface.bandwidth)
+        if policer not in configured_policers:
+            warnings.append('warning: policer "{0}" not configured on router "{1}"'.format(
+                policer, router))
+    return warnings
+
+def ios_test_vrf(snapshot, cfg_param, router):
+    """See junos_test_vrf. The interfaces are in the VRF with vrf forwarding."""
+
+    response = snapshot.running()
+    definitions = xpaths.IOS_VRF(response, vrf=cfg_param.vrf_name)
+    if len(definitions) == 0:
+        return ['error: vrf "{0}" is not configured on router "{1}"'.format(
+            cfg_param.vrf_name, router)]
+    return vrf_errors(cfg_param, router, definitions[0].findtext('{*}rd'),
+        [ET.QName(interface).localname + interface.findtext('{*}name') for interface in
+            xpaths.IOS_VRF_INTERFACES(response, vrf=cfg_param.vrf_name)],
+        [address.text for address in xpaths.IOS_BGP_VRF_NEIGHBORS(response,
+            vrf=cfg_param.vrf_name)],
+        'Loopback{0}'.format(cfg_param.vpn_id))
+
+# The checks in the order they run.
+JUNOS_CHECKS = [
+    junos_test_int_exists,
+    junos_test_int_config,
+    junos_test_int_status,
+    junos_test_vrf_used,
+    junos_test_rd_used,
+    junos_test_rt_used,
+    junos_test_policer
+]
+XR_CHECKS = [
+    xr_test_int_exists,
+    xr_test_int_config,
+    xr_test_int_status,
+    xr_test_vrf_used,
+    xr_test_rd_used,
+    xr_test_rt_used,
+    xr_test_policer
+]
+IOS_CHECKS = [
+    ios_test_int_exists,
+    ios_test_int_config,
+    ios_test_int_status,
+    ios_test_vrf_used,
+    ios_test_rd_used,
+    ios_test_rt_used,
+    ios_test_policer
+]
+
+# The checks that still have to pass once the VPN is committed, see verify. The
+# others would find the config that the VPN itself has added by then. The vrf
+# checks fail if the commit didn't leave the VPN on the router.
+JUNOS_VERIFY_CHECKS = [junos_test_vrf, junos_test_int_exists, junos_test_int_status,
+    junos_test_policer]
+XR_VERIFY_CHECKS = [xr_test_vrf, xr_test_int_exists, xr_test_int_status, xr_test_policer]
+IOS_VERIFY_CHECKS = [ios_test_vrf, ios_test_int_exists, ios_test_int_status,
+    ios_test_policer]
+
+def verify(session, parameters, router, deadline=None):
+    """Runs the verify checks on a router that has just committed the VPNs with
+    the cfg_param in parameters. The VPNs share one snapshot, so the router is
+    asked once whatever the number of VPNs. Returns the results of run_checks."""
+
+    driver = sessions.driver(router)
+    snapshot, checks = driver.snapshot(session), driver.verify_checks
+    results = []
+    for cfg_param in parameters:
+        results.extend(run_checks(snapshot, checks, cfg_param, router, deadline))
+    return results
+
 def close_sessions(routers):
     """If something goes wrong during the configuration change this function
     attempts to discard any uncommitted changes and close all sessions."""
@@ -402,53 +706,30 @@ def close_sessions(routers):
     sys.exit('exit')
 
 def run_tests(vpn_parameters):
+    # add_vpn runs the verify checks in this module, so it is only needed here,
+    # when this is the script.
+    import add_vpn
+
     # dictionary that will hold the netconf sessions and config templates.
     routers = {}
 
-    # namespaces used in vpn_parameters
-    nsmap = {
-        'nc': 'urn:ietf:params:xml:ns:netconf:base:1.0',
-        'vpn': 'http://lundnet.com/ns/yang/layer3vpn'
-        }
-
     # Getting router names from vpn_parameters and checking if they are in inventory.
-    for router in vpn_parameters.xpath('//vpn:router-name', namespaces=nsmap):
-        if router.text not in inventory:
-            print('Warning: Router "{0}" is not in inventory.'.format(router.text))
-            print('No action taken on router "{0}"'.format(router.text))
+    names = [router.text for router in xpaths.ROUTER_NAMES(vpn_parameters)]
+    found = inventory.resolve(names)
+    for router in names:
+        if router not in found:
+            print('Warning: Router "{0}" is not in inventory.'.format(router))
+            print('No action taken on router "{0}"'.format(router))
             continue
-        routers[router.text] = {}
+        routers[router] = {}
 
     # Building the configuration XML data.
+    parameters = add_vpn.vpn_variables(vpn_parameters)
     for router in routers:
-        if inventory[router]['type'] == 'junos':
-            routers[router]['config_param'] = add_vpn.config_variables(vpn_parameters, router)
-        if inventory[router]['type'] == 'xr':
-            routers[router]['config_param'] = add_vpn.config_variables(vpn_parameters, router)
-            
+        routers[router]['config_param'] = parameters[router]
+
     # Establishing netconf sessions
-    unreachable = []
-    for router in routers:
-        # Junos specific device_params argument means that we need this if:
-        if inventory[router]['type'] == 'junos':
-            try:
-                session = manager.connect(host=inventory[router]['ip'],
-                                    username=inventory[router]['user'],
-                                    password=inventory[router]['pass'],
-                                    device_params = {'name':'junos'},
-                                    hostkey_verify=False)
-                routers[router]['session'] = session
-            except ncclient.transport.errors.SSHError:
-                unreachable.append(router)
-        if inventory[router]['type'] == 'xr':
-            try:
-                session = manager.connect(host=inventory[router]['ip'],
-                                        username=inventory[router]['user'],
-                                        password=inventory[router]['pass'],
-                                        hostkey_verify=False)
-                routers[router]['session'] = session
-            except ncclient.transport.errors.SSHError:
-                unreachable.append(router)
+    unreachable = add_vpn.connect_sessions(routers)
 
     # Gives you the option of aborting the script if one or more routers are unreachable.
     if len(unreachable) > 0:
@@ -464,18 +745,25 @@ def run_tests(vpn_parameters):
 
     # Running the tests.
     for router in routers:
-        if inventory[router]['type'] == 'junos':
-            junos_tests(routers[router]['session'], routers[router]['config_param'], router)
-            routers[router]['session'].close_session()
-        if inventory[router]['type'] == 'xr':
-            xr_tests(routers[router]['session'], routers[router]['config_param'], router)
+        driver = sessions.driver(router)
+        with tracing.span('tests', router):
+            print_results(run_checks(driver.snapshot(routers[router]['session']),
+                driver.checks, routers[router]['config_param'], router))
             routers[router]['session'].close_session()
 
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument('-c', '--config', dest='config', 
         help='vpn parameters')
+    parser.add_argument('-p', '--pool', dest='pool', type=netconf_pool.parse_address,
+        help='borrow sessions from a netconf pool at host:port')
+    parser.add_argument('-t', '--trace', dest='trace',
+        help='write timings of every check and netconf call to this file, see tracing.py')
     args = parser.parse_args()
+    if args.pool:
+        netconf_pool.use(args.pool)
+    if args.trace:
+        tracing.enable(args.trace)
     xml_parameters = ET.parse(args.config) 
     
     run_tests(xml_parameters)
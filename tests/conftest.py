@@ -0,0 +1,7 @@
+import os
+import sys
+
+# The scripts are top level modules, and the tests keep to an inventory in memory
+# with the seed routers instead of inventory.db.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ['VPN_INVENTORY'] = ':memory:'
@@ -0,0 +1,59 @@
+import pytest
+
+import add_vpn
+import addressing
+import test_batch
+
+LUND = 'interface GigabitEthernet0/0/0/2 {0} on router "lund"'
+MALMO = 'interface ge-0/0/1 {0} on router "malmo"'
+STOCKHOLM = 'interface GigabitEthernet0/0/0/3 {0} on router "stockholm"'
+
+
+def errors(lund, malmo, stockholm=None):
+    """The addressing.check errors of a VPN with one interface on lund and malmo,
+    and on stockholm if it has an address."""
+
+    interfaces = [('lund', 'GigabitEthernet0/0/0/2', lund), ('malmo', 'ge-0/0/1', malmo)]
+    if stockholm is not None:
+        interfaces.append(('stockholm', 'GigabitEthernet0/0/0/3', stockholm))
+    parameters = add_vpn.vpn_variables(add_vpn.ET.ElementTree(add_vpn.ET.fromstring(
+        test_batch.parameters(134, interfaces))))
+    try:
+        addressing.check(parameters)
+    except ValueError as error:
+        return str(error).split('\n')
+    return []
+
+def test_separate_links_pass():
+    assert errors('10.0.134.0/31', '10.0.134.2/31', '10.0.134.4/30') == []
+
+def test_same_link_overlaps():
+    assert errors('10.0.134.0/31', '10.0.134.1/31') == [
+        MALMO.format('10.0.134.1/31') + ' overlaps ' + LUND.format('10.0.134.0/31')]
+
+def test_contained_subnet_overlaps():
+    assert errors('10.0.134.0/30', '10.0.134.2/31') == [
+        MALMO.format('10.0.134.2/31') + ' overlaps ' + LUND.format('10.0.134.0/30')]
+
+def test_subnet_after_the_contained_one_overlaps_the_container():
+    # stockholm starts after the end of malmo, but inside lund.
+    assert errors('10.0.134.0/28', '10.0.134.2/31', '10.0.134.8/31') == [
+        MALMO.format('10.0.134.2/31') + ' overlaps ' + LUND.format('10.0.134.0/28'),
+        STOCKHOLM.format('10.0.134.8/31') + ' overlaps ' + LUND.format('10.0.134.0/28')]
+
+def test_interface_overlaps_loopback():
+    # The loopback of malmo, id 2, is 10.0.134.254.
+    assert errors('10.0.134.252/30', '10.0.134.2/31') == [
+        'loopback 10.0.134.254/32 on router "malmo" overlaps ' +
+        LUND.format('10.0.134.252/30'),
+        'loopback 10.0.134.255/32 on router "lund" overlaps ' +
+        LUND.format('10.0.134.252/30')]
+
+def test_interface_outside_the_customer_net():
+    assert errors('10.0.135.0/31', '10.0.134.2/31') == [
+        LUND.format('10.0.135.0/31') + ' is not in the customer net 10.0.134.0/24']
+
+@pytest.mark.parametrize('address', ['10.0.134.0', '10.0.134.300/31'])
+def test_invalid_address(address):
+    error, = errors(address, '10.0.134.2/31')
+    assert error.startswith(LUND.format(address) + ' is not a valid address: ')
@@ -0,0 +1,64 @@
+import os
+
+import pytest
+from lxml import etree as ET
+
+import add_vpn
+import artifacts
+import test_batch
+
+RSI = 'http://cisco.com/ns/yang/Cisco-IOS-XR-infra-rsi-cfg'
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(artifacts, 'directory', None)
+    artifacts.use(str(tmp_path / 'cache'))
+    return tmp_path / 'cache'
+
+def cfg_param(vpn_id=134):
+    document = test_batch.parameters(vpn_id, [('lund', 'GigabitEthernet0/0/0/2',
+        '10.0.{0}.0/31'.format(vpn_id))])
+    return add_vpn.vpn_variables(ET.ElementTree(ET.fromstring(document)))['lund']
+
+def counting(generator):
+    calls = []
+    def counted(cfg_param):
+        calls.append(cfg_param.vpn_id)
+        return generator(cfg_param)
+    counted.__name__ = generator.__name__
+    return counted, calls
+
+def test_hit_and_miss(cache):
+    generator, calls = counting(add_vpn.xr_template)
+    first = artifacts.template(generator, cfg_param())
+    second = artifacts.template(generator, cfg_param())
+    assert calls == ['134']
+    assert ET.tostring(first) == ET.tostring(second)
+    artifacts.template(generator, cfg_param(135))
+    assert calls == ['134', '135']
+    assert len(os.listdir(str(cache))) == 2
+
+def test_new_generator_version_misses(cache, monkeypatch):
+    generator, calls = counting(add_vpn.xr_template)
+    artifacts.template(generator, cfg_param())
+    monkeypatch.setattr(artifacts, 'GENERATOR_VERSION', artifacts.GENERATOR_VERSION + 1)
+    artifacts.template(generator, cfg_param())
+    assert calls == ['134', '134']
+
+def test_no_cache(monkeypatch):
+    monkeypatch.setattr(artifacts, 'directory', None)
+    generator, calls = counting(add_vpn.xr_template)
+    artifacts.template(generator, cfg_param())
+    artifacts.template(generator, cfg_param())
+    assert calls == ['134', '134']
+
+def test_cached_template_has_the_namespaces(cache):
+    generated = ET.fromstring(ET.tostring(add_vpn.xr_template(cfg_param())))
+    artifacts.template(add_vpn.xr_template, cfg_param())
+    cached = artifacts.template(add_vpn.xr_template, cfg_param())
+    assert [element.tag for element in cached.iter()] == \
+        [element.tag for element in generated.iter()]
+    # The children of an element with a default namespace have it too.
+    assert cached.find('{%s}vrfs/{%s}vrf/{%s}vrf-name' % (RSI, RSI, RSI)).text == 'VRF_134'
+    assert add_vpn.merge_conflicts(generated, cached) == []
@@ -0,0 +1,75 @@
+import pytest
+
+import add_vpn
+
+
+def parameters(vpn_id, interfaces, management_rt='100:999'):
+    """A vpn parameter file with interfaces, (router, interface name, address), on
+    the seed routers."""
+
+    routers = ''
+    for router in sorted(set(router for router, name, address in interfaces)):
+        routers += '<vpn:router><vpn:router-name>{0}</vpn:router-name><vpn:interfaces>'.format(
+            router)
+        for interface_router, name, address in interfaces:
+            if interface_router == router:
+                routers += ('<vpn:interface><vpn:int-name>{0}</vpn:int-name><vpn:address>{1}'
+                    '</vpn:address><vpn:bandwidth>100</vpn:bandwidth></vpn:interface>'.
+                    format(name, address))
+        routers += '</vpn:interfaces></vpn:router>'
+    return ('<nc:data xmlns:nc="urn:ietf:params:xml:ns:netconf:base:1.0">'
+        '<vpn:layer3vpn xmlns:vpn="http://lundnet.com/ns/yang/layer3vpn"><vpn:general>'
+        '<vpn:vpn-id>{0}</vpn:vpn-id><vpn:management-ip>172.16.1.1/32</vpn:management-ip>'
+        '<vpn:management-rt>{1}</vpn:management-rt></vpn:general><vpn:routers>{2}'
+        '</vpn:routers></vpn:layer3vpn></nc:data>'.format(vpn_id, management_rt, routers))
+
+def batch(tmp_path, *documents):
+    paths = []
+    for number, document in enumerate(documents):
+        path = tmp_path / 'vpn{0}.xml'.format(number)
+        path.write_text(document)
+        paths.append(str(path))
+    return add_vpn.batch_routers(paths)
+
+def test_separate_interfaces_are_batched(tmp_path):
+    routers = batch(tmp_path,
+        parameters(134, [('lund', 'GigabitEthernet0/0/0/2', '10.0.134.0/31'),
+            ('malmo', 'ge-0/0/1', '10.0.134.2/31')]),
+        parameters(135, [('lund', 'GigabitEthernet0/0/0/3', '10.0.135.0/31'),
+            ('malmo', 'ge-0/0/2', '10.0.135.2/31')]))
+    assert routers['lund']['vpns'] == ['134', '135']
+    assert routers['malmo']['vpns'] == ['134', '135']
+
+def test_shared_interface_leaves_vpn_out(tmp_path, capsys):
+    routers = batch(tmp_path,
+        parameters(134, [('lund', 'GigabitEthernet0/0/0/2', '10.0.134.0/31'),
+            ('malmo', 'ge-0/0/1', '10.0.134.2/31')]),
+        parameters(135, [('lund', 'GigabitEthernet0/0/0/3', '10.0.135.0/31'),
+            ('malmo', 'ge-0/0/1', '10.0.135.2/31')]))
+    # Left out on lund as well, where it doesn't conflict.
+    assert routers['lund']['vpns'] == ['134']
+    assert routers['malmo']['vpns'] == ['134']
+    assert 'interface ge-0/0/1 is already used by VPN 134' in capsys.readouterr().out
+
+def test_other_management_rt_leaves_vpn_out(tmp_path):
+    routers = batch(tmp_path,
+        parameters(134, [('malmo', 'ge-0/0/1', '10.0.134.2/31')]),
+        parameters(135, [('malmo', 'ge-0/0/2', '10.0.135.2/31')], management_rt='100:998'))
+    assert routers['malmo']['vpns'] == ['134']
+
+def test_merge_conflicts_finds_interface_in_two_vrfs(tmp_path):
+    vpns = [add_vpn.vpn_variables(add_vpn.ET.ElementTree(add_vpn.ET.fromstring(
+        parameters(vpn_id, [('lund', 'GigabitEthernet0/0/0/2', address)]).encode())))['lund']
+        for vpn_id, address in [(134, '10.0.134.0/31'), (135, '10.0.135.0/31')]]
+    first, second = [add_vpn.xr_template(cfg_param) for cfg_param in vpns]
+    conflicts = add_vpn.merge_conflicts(first, second)
+    assert conflicts == ['interface-configurations/interface-configuration[active=act, '
+        'interface-name=GigabitEthernet0/0/0/2]']
+    assert add_vpn.merge_conflicts(first, add_vpn.xr_template(vpns[0])) == []
+
+def test_router_in_two_vpns_of_one_document_is_refused():
+    document = '<batch>{0}{1}</batch>'.format(
+        parameters(134, [('malmo', 'ge-0/0/1', '10.0.134.2/31')]),
+        parameters(135, [('malmo', 'ge-0/0/2', '10.0.135.2/31')]))
+    with pytest.raises(ValueError, match='Router "malmo" is in both VPN 134 and VPN 135'):
+        add_vpn.vpn_variables(add_vpn.ET.ElementTree(add_vpn.ET.fromstring(document)))
@@ -0,0 +1,13 @@
+import test_vpn
+
+RESULTS = [('int_exists', 'pass', []),
+    ('int_status', 'warn', ['warning: interface ge-0/0/1 is down on router "pe1"'])]
+
+
+def test_warnings_only_fail_if_strict():
+    assert test_vpn.passed(RESULTS)
+    assert not test_vpn.passed(RESULTS, strict=True)
+
+def test_failure_fails():
+    results = RESULTS + [('policer', 'fail', ['error: timed out on router "pe1"'])]
+    assert not test_vpn.passed(results)
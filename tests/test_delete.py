@@ -0,0 +1,65 @@
+from lxml import etree as ET
+
+import delete_vpn
+import mock_netconf
+
+XR_RUNNING = '''<data>
+<interface-configurations xmlns="http://cisco.com/ns/yang/Cisco-IOS-XR-ifmgr-cfg">
+  <interface-configuration><active>act</active><interface-name>Loopback1</interface-name>
+    <description>mgmt</description></interface-configuration>
+  <interface-configuration><active>act</active><interface-name>Loopback2</interface-name>
+    <vrf xmlns="http://cisco.com/ns/yang/Cisco-IOS-XR-infra-rsi-cfg">VRF_2</vrf>
+  </interface-configuration>
+</interface-configurations>
+<vrfs xmlns="http://cisco.com/ns/yang/Cisco-IOS-XR-infra-rsi-cfg">
+  <vrf><vrf-name>VRF_2</vrf-name></vrf>
+</vrfs>
+</data>'''
+
+JUNOS_RUNNING = '''<data><configuration>
+<interfaces><interface><name>lo0</name>
+  <unit><name>1</name><description>mgmt</description></unit>
+  <unit><name>2</name></unit>
+</interface></interfaces>
+<routing-instances><instance><name>VRF_2</name>
+  <interface><name>lo0.2</name></interface>
+</instance></routing-instances>
+</configuration></data>'''
+
+
+def delete(running, footprints, template, **options):
+    """Edits running with the delete config of the footprints like the mock
+    router does, after a round trip through the text that is sent."""
+
+    for vpn_id in sorted(footprints):
+        config = ET.fromstring(ET.tostring(template(footprints[vpn_id])))
+        if running.find('configuration') is not None:
+            # Junos has everything under one configuration element.
+            mock_netconf.edit(running.find('configuration'), config.find('configuration'),
+                **options)
+        else:
+            mock_netconf.edit(running, config, **options)
+
+def test_xr_loopback_outside_the_vrf_is_left():
+    running = ET.fromstring(XR_RUNNING, ET.XMLParser(remove_blank_text=True))
+    footprints = delete_vpn.xr_footprints(running, [1, 2])
+    assert sorted(footprints) == ['2']
+    assert footprints['2'].interface_names() == ['Loopback2']
+    delete(running, footprints, delete_vpn.xr_delete_template)
+    names = [name.text for name in running.iter('{*}interface-name')]
+    assert names == ['Loopback1']
+
+def test_xr_loopback_is_only_removed_if_found():
+    footprint = delete_vpn.footprint(1, [], [])
+    config = delete_vpn.xr_delete_template(footprint)
+    assert [name.text for name in config.iter('{*}interface-name')] == []
+
+def test_junos_loopback_outside_the_vrf_is_left():
+    running = ET.fromstring(JUNOS_RUNNING, ET.XMLParser(remove_blank_text=True))
+    footprints = delete_vpn.junos_footprints(running, [1, 2])
+    assert sorted(footprints) == ['2']
+    delete(running, footprints, delete_vpn.junos_delete_template,
+        default_operation='none')
+    units = running.findall('configuration/interfaces/interface/unit')
+    assert [unit.findtext('name') for unit in units] == ['1']
+    assert units[0].findtext('description') == 'mgmt'
@@ -0,0 +1,75 @@
+from lxml import etree as ET
+
+import add_vpn
+
+PARSER = ET.XMLParser(remove_blank_text=True)
+
+TEMPLATE = '''<config>
+<interface-configurations>
+  <interface-configuration><active>act</active><interface-name>Loopback134</interface-name>
+    <description>VPN 134</description><vrf>VRF_134</vrf></interface-configuration>
+  <interface-configuration><active>act</active><interface-name>Gi0/0/0/2</interface-name>
+    <description>VPN 134</description><vrf>VRF_134</vrf></interface-configuration>
+</interface-configurations>
+</config>'''
+
+
+def xml(text):
+    return ET.fromstring(text, PARSER)
+
+def diff(template, running):
+    return ET.tostring(add_vpn.config_diff(xml(template), xml(running))).decode()
+
+def test_entry_that_running_has_is_left_out():
+    running = '''<data><interface-configurations>
+      <interface-configuration><active>act</active><interface-name>Loopback134</interface-name>
+        <description>VPN 134</description><vrf>VRF_134</vrf></interface-configuration>
+    </interface-configurations></data>'''
+    assert diff(TEMPLATE, running) == ('<config><interface-configurations>'
+        '<interface-configuration><active>act</active><interface-name>Gi0/0/0/2'
+        '</interface-name><description>VPN 134</description><vrf>VRF_134</vrf>'
+        '</interface-configuration></interface-configurations></config>')
+
+def test_changed_leaf_is_pushed_with_its_keys():
+    running = '''<data><interface-configurations>
+      <interface-configuration><active>act</active><interface-name>Loopback134</interface-name>
+        <description>VPN 134</description><vrf>VRF_134</vrf></interface-configuration>
+      <interface-configuration><active>act</active><interface-name>Gi0/0/0/2</interface-name>
+        <description>old</description><vrf>VRF_134</vrf></interface-configuration>
+    </interface-configurations></data>'''
+    assert diff(TEMPLATE, running) == ('<config><interface-configurations>'
+        '<interface-configuration><active>act</active><interface-name>Gi0/0/0/2'
+        '</interface-name><description>VPN 134</description></interface-configuration>'
+        '</interface-configurations></config>')
+
+def test_other_keys_are_other_entries():
+    # Same interface name, but the pre-configuration (active=pre) is another entry.
+    running = '''<data><interface-configurations>
+      <interface-configuration><active>pre</active><interface-name>Loopback134</interface-name>
+        <description>VPN 134</description><vrf>VRF_134</vrf></interface-configuration>
+    </interface-configurations></data>'''
+    assert diff(TEMPLATE, running) == ET.tostring(xml(TEMPLATE)).decode()
+
+def test_everything_is_pushed_without_the_container():
+    assert diff(TEMPLATE, '<data><vrfs/></data>') == ET.tostring(xml(TEMPLATE)).decode()
+
+def test_nothing_is_pushed_if_running_has_it_all():
+    running = TEMPLATE.replace('config>', 'data>')
+    assert diff(TEMPLATE, running) == '<config/>'
+
+def test_running_filter_matches_on_keys():
+    running_filter = add_vpn.running_filter(xml(TEMPLATE))
+    assert ET.tostring(running_filter).decode() == ('<filter type="subtree">'
+        '<interface-configurations><interface-configuration><active>act</active>'
+        '<interface-name>Loopback134</interface-name><description/><vrf/>'
+        '</interface-configuration><interface-configuration><active>act</active>'
+        '<interface-name>Gi0/0/0/2</interface-name><description/><vrf/>'
+        '</interface-configuration></interface-configurations></filter>')
+
+def test_list_keys_identify_entries():
+    route = xml('<vrf-route><prefix>10.0.0.0</prefix><prefix-length>24</prefix-length>'
+        '<description>customer</description></vrf-route>')
+    assert add_vpn.identity(route) == [('prefix', '10.0.0.0'), ('prefix-length', '24')]
+    # A route target has no keys and is identified by all of its leaves.
+    target = xml('<route-target><as>100</as><index>134</index></route-target>')
+    assert add_vpn.identity(target) == [('as', '100'), ('index', '134')]
@@ -0,0 +1,56 @@
+import pytest
+
+import add_vpn
+from inventory import SEED, Inventory
+import test_batch
+
+
+@pytest.fixture
+def inventory():
+    return Inventory(':memory:')
+
+def test_seed_routers(inventory):
+    assert list(inventory) == ['lund', 'malmo', 'oslo', 'stockholm', 'sundsvall']
+    assert len(inventory) == 5
+    assert inventory['malmo'] == dict(SEED['malmo'], port=830, site='malmo')
+
+def test_lookups(inventory):
+    assert sorted(inventory.by_type('xr')) == ['lund', 'stockholm', 'sundsvall']
+    assert list(inventory.by_site('oslo')) == ['oslo']
+    assert list(inventory.by_ip('192.168.1.133')) == ['malmo']
+    assert inventory.by_id(4) == 'stockholm'
+    assert inventory.by_type('eos') == {}
+
+def test_missing_router(inventory):
+    assert 'gothenburg' not in inventory
+    assert inventory.by_id(99) is None
+    with pytest.raises(KeyError):
+        inventory['gothenburg']
+    assert sorted(inventory.resolve(['lund', 'gothenburg', 'malmo'])) == ['lund', 'malmo']
+
+def test_resolve_many_names(inventory):
+    routers = dict(('pe{0}'.format(number), dict(SEED['lund'], id=number + 10))
+        for number in range(1000))
+    inventory.update(routers)
+    found = inventory.resolve(sorted(routers) + ['gothenburg'])
+    assert sorted(found) == sorted(routers)
+
+def test_update_replaces_the_cached_entry(inventory):
+    assert inventory['lund']['port'] == 830
+    inventory['lund'] = dict(SEED['lund'], port=8301, site='skane')
+    assert inventory['lund']['port'] == 8301
+    assert list(inventory.by_site('skane')) == ['lund']
+    del inventory['lund']
+    assert 'lund' not in inventory
+
+def test_database_is_kept(tmp_path):
+    path = str(tmp_path / 'inventory.db')
+    Inventory(path)['gothenburg'] = dict(SEED['lund'], id=6)
+    assert Inventory(path)['gothenburg']['id'] == 6
+
+def test_router_missing_from_inventory_is_left_out(capsys):
+    document = test_batch.parameters(134, [('malmo', 'ge-0/0/1', '10.0.134.2/31'),
+        ('gothenburg', 'ge-0/0/1', '10.0.134.4/31')])
+    routers = add_vpn.vpn_routers(add_vpn.ET.ElementTree(add_vpn.ET.fromstring(document)))
+    assert list(routers) == ['malmo']
+    assert 'Router "gothenburg" is not in inventory' in capsys.readouterr().out
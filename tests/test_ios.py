@@ -0,0 +1,162 @@
+import pytest
+from lxml import etree as ET
+
+import add_vpn
+import drivers
+
+PARSER = ET.XMLParser(remove_blank_text=True)
+
+# A VPN on oslo, the IOS-XE router in the seed inventory, with id 3.
+PARAMETERS = '''<nc:data xmlns:nc="urn:ietf:params:xml:ns:netconf:base:1.0">
+<vpn:layer3vpn xmlns:vpn="http://lundnet.com/ns/yang/layer3vpn">
+  <vpn:general><vpn:vpn-id>134</vpn:vpn-id><vpn:management-ip>172.16.1.1/32</vpn:management-ip>
+    <vpn:management-rt>100:999</vpn:management-rt></vpn:general>
+  <vpn:routers><vpn:router><vpn:router-name>oslo</vpn:router-name>
+    <vpn:interfaces><vpn:interface><vpn:int-name>GigabitEthernet2</vpn:int-name>
+      <vpn:address>10.0.134.0/31</vpn:address><vpn:bandwidth>100</vpn:bandwidth></vpn:interface>
+    </vpn:interfaces>
+    <vpn:routing>
+      <vpn:static><vpn:route><vpn:network>192.168.134.0/24</vpn:network>
+        <vpn:next-hop>10.0.134.1</vpn:next-hop></vpn:route></vpn:static>
+      <vpn:bgp><vpn:neighbor><vpn:address>10.0.134.1</vpn:address>
+        <vpn:remote-as>65134</vpn:remote-as></vpn:neighbor></vpn:bgp>
+    </vpn:routing>
+  </vpn:router></vpn:routers>
+</vpn:layer3vpn></nc:data>'''
+
+EXPECTED = '''<config xmlns:xc="urn:ietf:params:xml:ns:netconf:base:1.0">
+  <native xmlns="http://cisco.com/ns/yang/Cisco-IOS-XE-native">
+    <vrf>
+      <definition>
+        <name>VRF_134</name>
+        <rd>100:134</rd>
+        <address-family>
+          <ipv4>
+            <route-target>
+              <export>
+                <asn-ip>100:134</asn-ip>
+              </export>
+              <import>
+                <asn-ip>100:134</asn-ip>
+              </import>
+              <import>
+                <asn-ip>100:999</asn-ip>
+              </import>
+            </route-target>
+          </ipv4>
+        </address-family>
+      </definition>
+    </vrf>
+    <interface>
+      <GigabitEthernet>
+        <name>2</name>
+        <vrf>
+          <forwarding>VRF_134</forwarding>
+        </vrf>
+        <ip>
+          <address>
+            <primary>
+              <address>10.0.134.0</address>
+              <mask>255.255.255.254</mask>
+            </primary>
+          </address>
+        </ip>
+        <service-policy xmlns="http://cisco.com/ns/yang/Cisco-IOS-XE-policy">
+          <input>POLICE_100M</input>
+          <output>POLICE_100M</output>
+        </service-policy>
+      </GigabitEthernet>
+      <Loopback>
+        <name>134</name>
+        <vrf>
+          <forwarding>VRF_134</forwarding>
+        </vrf>
+        <ip>
+          <address>
+            <primary>
+              <address>10.0.134.253</address>
+              <mask>255.255.255.255</mask>
+            </primary>
+          </address>
+        </ip>
+      </Loopback>
+    </interface>
+    <ip>
+      <route>
+        <vrf>
+          <name>VRF_134</name>
+          <ip-route-interface-forwarding-list>
+            <prefix>192.168.134.0</prefix>
+            <mask>255.255.255.0</mask>
+            <fwd-list>
+              <fwd>10.0.134.1</fwd>
+            </fwd-list>
+          </ip-route-interface-forwarding-list>
+        </vrf>
+      </route>
+    </ip>
+    <router>
+      <bgp xmlns="http://cisco.com/ns/yang/Cisco-IOS-XE-bgp">
+        <id>100</id>
+        <address-family>
+          <with-vrf>
+            <ipv4>
+              <af-name>unicast</af-name>
+              <vrf>
+                <name>VRF_134</name>
+                <ipv4-unicast>
+                  <neighbor>
+                    <id>10.0.134.1</id>
+                    <remote-as>65134</remote-as>
+                    <activate/>
+                  </neighbor>
+                  <redistribute>
+                    <connected/>
+                    <static/>
+                  </redistribute>
+                </ipv4-unicast>
+              </vrf>
+            </ipv4>
+          </with-vrf>
+        </address-family>
+      </bgp>
+    </router>
+  </native>
+</config>'''
+
+
+def cfg_param(parameters=PARAMETERS):
+    return add_vpn.vpn_variables(ET.ElementTree(ET.fromstring(parameters)))['oslo']
+
+def canonical(element):
+    # The template as it is sent, without the whitespace of EXPECTED.
+    return ET.tostring(ET.fromstring(ET.tostring(element), PARSER))
+
+def test_ios_template():
+    assert canonical(add_vpn.ios_template(cfg_param())) == \
+        ET.tostring(ET.fromstring(EXPECTED, PARSER))
+
+def test_ios_template_without_static_routes():
+    parameters = PARAMETERS.replace('<vpn:route><vpn:network>192.168.134.0/24</vpn:network>'
+        '\n        <vpn:next-hop>10.0.134.1</vpn:next-hop></vpn:route>', '')
+    config = add_vpn.ios_template(cfg_param(parameters))
+    assert config.find('{*}native/{*}ip') is None
+    assert config.find('{*}native/{*}vrf/{*}definition/{*}name').text == 'VRF_134'
+
+def test_ios_template_is_picked_by_driver():
+    assert add_vpn.driver('oslo').template is add_vpn.ios_template
+
+@pytest.mark.parametrize('name, expected', [
+    ('GigabitEthernet2', ('GigabitEthernet', '2')),
+    ('GigabitEthernet0/0/1', ('GigabitEthernet', '0/0/1')),
+    ('TenGigabitEthernet1/0/1.100', ('TenGigabitEthernet', '1/0/1.100')),
+    ('Port-channel10', ('Port-channel', '10')),
+    ('Loopback134', ('Loopback', '134'))
+])
+def test_ios_interface_name(name, expected):
+    assert drivers.ios_interface_name(name) == expected
+
+@pytest.mark.parametrize('name', ['GigabitEthernet', '2', ''])
+def test_not_an_ios_interface_name(name):
+    with pytest.raises(ValueError):
+        drivers.ios_interface_name(name)
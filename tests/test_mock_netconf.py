@@ -0,0 +1,26 @@
+from lxml import etree as ET
+import pytest
+
+import mock_netconf
+
+NC = 'xmlns:nc="urn:ietf:params:xml:ns:netconf:base:1.0"'
+
+
+def test_remove_of_missing_entry_creates_nothing():
+    running = ET.fromstring('<data><a><name>x</name></a></data>')
+    mock_netconf.edit(running, ET.fromstring('<config {0}><vrfs><vrf nc:operation="remove">'
+        '<vrf-name>VRF_1</vrf-name></vrf></vrfs></config>'.format(NC)))
+    assert ET.tostring(running) == b'<data><a><name>x</name></a></data>'
+
+def test_delete_of_missing_entry_fails():
+    running = ET.fromstring('<data/>')
+    with pytest.raises(mock_netconf.RPCError):
+        mock_netconf.edit(running, ET.fromstring('<config {0}><vrfs><vrf nc:operation='
+            '"delete"><vrf-name>VRF_1</vrf-name></vrf></vrfs></config>'.format(NC)))
+
+def test_merge_creates_missing_entry():
+    running = ET.fromstring('<data/>')
+    mock_netconf.edit(running, ET.fromstring('<config><vrfs><vrf><vrf-name>VRF_1</vrf-name>'
+        '<create/></vrf></vrfs></config>'))
+    assert ET.tostring(running) == (b'<data><vrfs><vrf><vrf-name>VRF_1</vrf-name><create/>'
+        b'</vrf></vrfs></data>')
@@ -0,0 +1,25 @@
+import threading
+import time
+
+import orchestrator
+import sessions
+
+
+def test_queued_calls_do_not_time_out():
+    # Twice as many routers as threads, the second half waits for the first.
+    routers = list(range(2 * sessions.MAX_WORKERS))
+    outcomes = orchestrator.run(orchestrator.phase(routers, lambda router: time.sleep(0.2),
+        0.3))
+    assert list(outcomes.values()) == [None] * len(routers)
+
+def test_late_outcome_is_handed_over():
+    done = threading.Event()
+    late = []
+    def finish(router, outcome):
+        late.append((router, outcome))
+        done.set()
+    outcomes = orchestrator.run(orchestrator.phase(['pe1'], lambda router: time.sleep(0.2)
+        or 'session', 0.05, finish))
+    assert isinstance(outcomes['pe1'], orchestrator.Timeout)
+    assert done.wait(1)
+    assert late == [('pe1', 'session')]
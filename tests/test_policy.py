@@ -0,0 +1,94 @@
+import argparse
+import json
+import sys
+
+import pytest
+
+import add_vpn
+import sessions
+import test_batch
+
+# The prompts of provision and delete_vpn.py, see add_vpn.POLICY.
+PROMPTS = ['unreachable', 'commit', 'confirm']
+
+
+def parse(tmp_path, settings=None, *options):
+    parser = argparse.ArgumentParser()
+    add_vpn.policy_arguments(parser)
+    arguments = list(options)
+    if settings is not None:
+        path = tmp_path / 'policy.json'
+        path.write_text(settings if isinstance(settings, str) else json.dumps(settings))
+        arguments += ['--policy', str(path)]
+    return add_vpn.parse_policy(parser.parse_args(arguments))
+
+def answer(monkeypatch, reply):
+    """Makes input return reply and returns the questions that were asked."""
+
+    questions = []
+    monkeypatch.setattr('builtins.input', lambda question: questions.append(question)
+        or reply)
+    return questions
+
+@pytest.mark.parametrize('setting', PROMPTS)
+@pytest.mark.parametrize('value, expected', [('yes', True), ('skip', True),
+    ('no', False), ('abort', False), ('maybe', False)])
+def test_decide_from_policy(monkeypatch, setting, value, expected):
+    questions = answer(monkeypatch, 'yes')
+    assert add_vpn.decide(dict(add_vpn.POLICY, **{setting: value}), setting,
+        'Question?') is expected
+    assert questions == []
+
+@pytest.mark.parametrize('setting', PROMPTS)
+def test_decide_asks(monkeypatch, setting):
+    questions = answer(monkeypatch, 'yes')
+    assert add_vpn.decide(add_vpn.POLICY, setting, 'Question?')
+    assert questions == ['Question? (yes/[no]): ']
+    # Anything but yes is no.
+    answer(monkeypatch, 'y')
+    assert not add_vpn.decide(add_vpn.POLICY, setting, 'Question?')
+
+def test_decide_unknown_prompt():
+    with pytest.raises(KeyError):
+        add_vpn.decide(add_vpn.POLICY, 'delete', 'Delete?')
+
+def test_unlisted_prompt_is_asked(tmp_path, monkeypatch):
+    policy = parse(tmp_path, {'commit': 'yes'})
+    questions = answer(monkeypatch, '')
+    for setting in PROMPTS:
+        if setting != 'commit':
+            assert not add_vpn.decide(policy, setting, setting)
+    assert len(questions) == len(PROMPTS) - 1
+
+def test_options_override_the_file(tmp_path):
+    policy = parse(tmp_path, {'commit': 'no', 'verify': 'strict'}, '-y')
+    assert policy == dict(add_vpn.POLICY, unreachable='skip', commit='yes',
+        confirm='yes', verify='strict')
+
+@pytest.mark.parametrize('settings', [
+    '{"commit": "yes",',
+    '["commit", "yes"]',
+    {'comit': 'yes'},
+    {'commit': 'true'},
+    {'unreachable': 'yes'},
+    {'verify': True},
+    {'confirm_timeout': '600'},
+    {'confirm_timeout': 0}
+])
+def test_malformed_policy_is_refused(tmp_path, settings):
+    with pytest.raises(SystemExit):
+        parse(tmp_path, settings)
+
+def test_malformed_policy_stops_before_connecting(tmp_path, monkeypatch):
+    config = tmp_path / 'vpn.xml'
+    config.write_text(test_batch.parameters(134, [('malmo', 'ge-0/0/1', '10.0.134.2/31')]))
+    policy = tmp_path / 'policy.json'
+    policy.write_text('{"commit": "yes", "confirm": "always"}')
+    connected = []
+    monkeypatch.setattr(sessions, 'open_session', lambda router, timeout=None:
+        connected.append(router))
+    monkeypatch.setattr(sys, 'argv', ['add_vpn.py', '-c', str(config), '--policy',
+        str(policy)])
+    with pytest.raises(SystemExit, match='Setting "confirm" is "always"'):
+        add_vpn.main()
+    assert connected == []
@@ -0,0 +1,30 @@
+import add_vpn
+import netconf_pool
+
+
+def test_pool_error_counts_as_unreachable(monkeypatch, capsys):
+    def borrow(router, timeout=None):
+        if router == 'malmo':
+            raise netconf_pool.PoolError('Router "malmo" is busy')
+        return 'session'
+    monkeypatch.setattr(netconf_pool, 'address', ('127.0.0.1', 8999))
+    monkeypatch.setattr(netconf_pool, 'borrow', borrow)
+    routers = {'lund': {}, 'malmo': {}}
+    assert add_vpn.connect_sessions(routers) == ['malmo']
+    assert routers['lund']['session'] == 'session'
+    assert 'session' not in routers['malmo']
+    assert 'Router "malmo" is busy' in capsys.readouterr().out
+
+def test_health_check_leaves_borrowed_sessions():
+    class Session:
+        connected = True
+        def close_session(self):
+            self.connected = False
+    pool = netconf_pool.SessionPool(idle_timeout=0)
+    idle, busy = Session(), Session()
+    pool.sessions = {'lund': idle, 'malmo': busy}
+    pool.last_used = {'lund': 0, 'malmo': 0}
+    pool.borrowed.add('malmo')
+    pool.health_check()
+    assert pool.sessions == {'malmo': busy}
+    assert not idle.connected and busy.connected
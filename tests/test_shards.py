@@ -0,0 +1,21 @@
+import add_vpn
+import shards
+import test_batch
+
+
+def test_coordinator_without_settings():
+    coordinator = shards.Coordinator({'lund': [], 'malmo': []}, 2)
+    assert coordinator.routers() == set(['lund', 'malmo'])
+    coordinator.close()
+    assert all(not worker['process'].is_alive() for worker in coordinator.workers.values())
+
+def test_merge_conflicts_leave_vpn_out(tmp_path, monkeypatch):
+    monkeypatch.setattr(add_vpn, 'merge_conflicts', lambda target, source: ['vrfs/vrf'])
+    paths = []
+    for vpn_id, interface in [(134, 'ge-0/0/1'), (135, 'ge-0/0/2')]:
+        path = tmp_path / 'vpn{0}.xml'.format(vpn_id)
+        path.write_text(test_batch.parameters(vpn_id, [('malmo', interface,
+            '10.0.{0}.2/31'.format(vpn_id))]))
+        paths.append(str(path))
+    parameters = shards.batch_parameters(paths)
+    assert [cfg_param.vpn_id for cfg_param in parameters['malmo']] == ['134']
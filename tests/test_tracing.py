@@ -0,0 +1,73 @@
+import json
+
+import pytest
+from lxml import etree as ET
+
+import tracing
+
+
+class Reply:
+    xml = '<rpc-reply><data/></rpc-reply>'
+
+class Session:
+    timeout = 30
+
+    def get_config(self, source, filter=None):
+        return Reply()
+
+    def lock(self, target):
+        raise RuntimeError('lock denied')
+
+
+@pytest.fixture
+def trace(tmp_path, monkeypatch):
+    """Traces to a JSON lines file, and returns a function that reads its records."""
+
+    for name, value in [('path', None), ('_trace_id', None), ('_spans', [])]:
+        monkeypatch.setattr(tracing, name, value)
+    path = tmp_path / 'trace.jsonl'
+    tracing.enable(str(path))
+    return lambda: [json.loads(line) for line in path.read_text().splitlines()]
+
+def test_nested_spans(trace):
+    with tracing.span('connect', 'lund', attempt=1):
+        with tracing.span('lock', 'lund'):
+            pass
+    inner, outer = trace()
+    assert (inner['name'], outer['name']) == ('lock', 'connect')
+    assert inner['parent_id'] == outer['span_id']
+    assert outer['parent_id'] is None
+    assert inner['trace_id'] == outer['trace_id'] == tracing._trace_id
+    assert outer['router'] == 'lund' and outer['attempt'] == 1
+    assert outer['status'] == 'ok' and 'error' not in outer
+    assert 0 <= inner['duration'] <= outer['duration']
+    assert outer['start'] <= inner['start']
+
+def test_failed_span(trace):
+    with pytest.raises(ValueError):
+        with tracing.span('validate', 'malmo'):
+            raise ValueError('bad config')
+    record, = trace()
+    assert record['status'] == 'error'
+    assert record['error'] == 'bad config'
+
+def test_traced_session(trace):
+    session = tracing.TracedSession(Session(), 'oslo')
+    config_filter = ET.Element('filter')
+    reply = session.get_config('running', filter=config_filter)
+    assert reply.xml == Reply.xml
+    with pytest.raises(RuntimeError):
+        session.lock('candidate')
+    assert session.timeout == 30
+    get_config, lock = trace()
+    assert get_config['name'] == 'get_config' and get_config['router'] == 'oslo'
+    assert get_config['request_bytes'] == len('running') + len(ET.tostring(config_filter))
+    assert get_config['reply_bytes'] == len(Reply.xml)
+    assert lock['status'] == 'error' and 'reply_bytes' not in lock
+
+def test_tracing_off(monkeypatch):
+    monkeypatch.setattr(tracing, 'path', None)
+    monkeypatch.setattr(tracing, '_spans', [])
+    with tracing.span('connect', 'lund') as record:
+        assert record is None
+    assert tracing._spans == []
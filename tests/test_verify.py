@@ -0,0 +1,50 @@
+import pytest
+from lxml import etree as ET
+
+import add_vpn
+import benchmark
+import mock_netconf
+
+TYPES = {'pe1': 'junos', 'pe2': 'xr', 'pe3': 'ios'}
+POLICY = dict(add_vpn.POLICY, unreachable='abort', commit='yes', confirm='yes', verify='yes')
+
+
+@pytest.fixture(scope='module')
+def network():
+    network = mock_netconf.MockNetwork([mock_netconf.MockRouter(name, TYPES[name],
+        9970 + number) for number, name in enumerate(sorted(TYPES), 1)])
+    network.start()
+    return network
+
+def vpn_routers(network, vpn_id):
+    document = benchmark.synthetic_parameters(len(TYPES), 1, 1, 1, vpn_id, TYPES)
+    add_vpn.inventory.update(network.inventory())
+    return add_vpn.vpn_routers(ET.ElementTree(ET.fromstring(document)))
+
+def without_vrf(config):
+    """Removes the VRF itself from a config template, and leaves the rest."""
+
+    # The routing instance on Junos, the VRFs of XR and the VRF definitions of IOS-XE.
+    for path in ('configuration/routing-instances', '{*}vrfs', '{*}native/{*}vrf'):
+        for element in config.findall(path):
+            element.getparent().remove(element)
+
+def test_verified_commit_is_confirmed(network):
+    with pytest.raises(SystemExit):
+        add_vpn.provision(vpn_routers(network, 134), policy=POLICY)
+    for router in network.routers:
+        assert 'VRF_134' in ET.tostring(router.running).decode()
+
+def test_commit_without_the_vrf_is_rolled_back(network, capsys):
+    routers = vpn_routers(network, 135)
+    for router in routers:
+        without_vrf(routers[router]['config'])
+    before = [ET.tostring(router.running) for router in network.routers]
+    with pytest.raises(SystemExit):
+        add_vpn.provision(routers, policy=POLICY)
+    output = capsys.readouterr().out
+    for router in sorted(TYPES):
+        assert 'error: vrf "VRF_135" is not configured on router "{0}"'.format(router) in output
+        assert 'Rolling back the commit on router {0}'.format(router) in output
+    assert 'Commit on router' not in output
+    assert [ET.tostring(router.running) for router in network.routers] == before
@@ -0,0 +1,179 @@
+import argparse
+import atexit
+from contextlib import contextmanager
+import json
+from lxml import etree as ET
+import os
+import threading
+import time
+
+import netconf_pool # reply_to_xml()
+
+# File that the spans are written to, None when tracing is off.
+path = None
+
+_trace_id = None
+_spans = []
+_lock = threading.Lock()
+_local = threading.local()
+
+
+def enable(trace_path):
+    """Records a span for every netconf operation and every phase from now on.
+    A trace_path that ends with .json gets an OpenTelemetry trace (OTLP/JSON) when
+    the script exits, any other name gets one JSON line per span as they end."""
+
+    global path, _trace_id
+    path = trace_path
+    _trace_id = os.urandom(16).hex()
+    if not path.endswith('.json'):
+        open(path, 'w').close()
+    atexit.register(write_otel)
+
+def enabled():
+    return path is not None
+
+@contextmanager
+def span(name, router=None, **attributes):
+    """Times the code in the with block. Spans started in the block, in the same
+    thread, get this span as parent. Yields the span, a dictionary that more
+    attributes can be added to, or None when tracing is off."""
+
+    if path is None:
+        yield None
+        return
+    stack = getattr(_local, 'stack', None)
+    if stack is None:
+        stack = _local.stack = []
+    record = {
+        'trace_id': _trace_id,
+        'span_id': os.urandom(8).hex(),
+        'parent_id': stack[-1]['span_id'] if len(stack) > 0 else None,
+        'name': name,
+        'router': router,
+        'start': time.time()
+    }
+    record.update(attributes)
+    stack.append(record)
+    start = time.perf_counter()
+    try:
+        yield record
+        record['status'] = 'ok'
+    except BaseException as error:
+        record['status'] = 'error'
+        record['error'] = str(error)
+        raise
+    finally:
+        record['duration'] = time.perf_counter() - start
+        stack.pop()
+        with _lock:
+            _spans.append(record)
+            if not path.endswith('.json'):
+                with open(path, 'a') as output:
+                    output.write(json.dumps(record) + '\n')
+
+def size(value):
+    """Number of bytes that value takes on the wire, roughly."""
+
+    if value is None:
+        return 0
+    if ET.iselement(value):
+        return len(ET.tostring(value))
+    if isinstance(value, tuple):
+        return sum(size(part) for part in value)
+    if isinstance(value, (str, bytes)):
+        return len(value)
+    return 0
+
+def write_otel():
+    """Writes all spans as one OTLP/JSON document, which can be loaded into e.g.
+    Jaeger or sent on to an OpenTelemetry collector."""
+
+    if path is None or not path.endswith('.json'):
+        return
+    spans = []
+    for record in _spans:
+        attributes = []
+        for key in sorted(record):
+            if key in ('trace_id', 'span_id', 'parent_id', 'name', 'start', 'duration',
+                    'status', 'error') or record[key] is None:
+                continue
+            if isinstance(record[key], int):
+                value = {'intValue': str(record[key])}
+            else:
+                value = {'stringValue': str(record[key])}
+            attributes.append({'key': key, 'value': value})
+        start = int(record['start'] * 1e9)
+        otel_span = {
+            'traceId': record['trace_id'],
+            'spanId': record['span_id'],
+            'name': record['name'],
+            'kind': 3, # client
+            'startTimeUnixNano': str(start),
+            'endTimeUnixNano': str(start + int(record['duration'] * 1e9)),
+            'attributes': attributes,
+            'status': {'code': 1} if record['status'] == 'ok' else
+                {'code': 2, 'message': record.get('error', '')}
+        }
+        if record['parent_id'] is not None:
+            otel_span['parentSpanId'] = record['parent_id']
+        spans.append(otel_span)
+    document = {'resourceSpans': [{
+        'resource': {'attributes': [
+            {'key': 'service.name', 'value': {'stringValue': 'vpn-project'}}]},
+        'scopeSpans': [{'scope': {'name': 'vpn-project'}, 'spans': spans}]
+    }]}
+    with open(path, 'w') as output:
+        json.dump(document, output)
+
+
+class TracedSession:
+    """Wraps a netconf session so that every call on it gets a span with the size
+    of the request and of the reply."""
+
+    def __init__(self, session, router):
+        self.__dict__['session'] = session
+        self.__dict__['router'] = router
+
+    def __getattr__(self, name):
+        attribute = getattr(self.session, name)
+        if not callable(attribute):
+            return attribute
+        def call(*args, **kwargs):
+            request_bytes = sum(size(arg) for arg in args) + \
+                sum(size(kwargs[key]) for key in kwargs)
+            with span(name, self.router, request_bytes=request_bytes) as record:
+                reply = attribute(*args, **kwargs)
+                xml = netconf_pool.reply_to_xml(reply)
+                record['reply_bytes'] = 0 if xml is None else len(xml)
+                return reply
+        return call
+
+    def __setattr__(self, name, value):
+        # e.g. the rpc timeout
+        setattr(self.session, name, value)
+
+
+def summary(spans):
+    """Adds up the spans per name, e.g. per phase or netconf operation."""
+
+    names = {}
+    for record in spans:
+        names.setdefault(record['name'], []).append(record)
+    for name in sorted(names, key=lambda name: -sum(r['duration'] for r in names[name])):
+        durations = [record['duration'] for record in names[name]]
+        slowest = max(names[name], key=lambda record: record['duration'])
+        errors = len([record for record in names[name] if record['status'] != 'ok'])
+        print('{0:<20}{1:>6} spans {2:>9.3f} s total {3:>8.3f} s max ({4}) {5} errors'.format(
+            name, len(durations), sum(durations), max(durations), slowest['router'], errors))
+
+def main():
+    parser = argparse.ArgumentParser(description='Summarizes a JSON lines trace '
+        'written with --trace.')
+    parser.add_argument('trace', help='trace file')
+    args = parser.parse_args()
+    with open(args.trace) as lines:
+        summary([json.loads(line) for line in lines if line.strip()])
+
+if __name__ == "__main__":
+    main()
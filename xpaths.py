@@ -0,0 +1,73 @@
+from lxml import etree as ET
+
+# The XPath expressions that the scripts use, compiled once when the module is
+# imported. Values such as an interface name are passed as XPath variables,
+# e.g. XR_INTERFACE(reply, interface='GigabitEthernet0/0/0/0'), and not formatted
+# into the expression, so they are never parsed as XPath.
+
+NSMAP = {
+    'nc': 'urn:ietf:params:xml:ns:netconf:base:1.0',
+    'vpn': 'http://lundnet.com/ns/yang/layer3vpn',
+    'ifmgr': 'http://cisco.com/ns/yang/Cisco-IOS-XR-ifmgr-oper',
+    'ifcfg': 'http://cisco.com/ns/yang/Cisco-IOS-XR-ifmgr-cfg',
+    'ipv4': 'http://cisco.com/ns/yang/Cisco-IOS-XR-ipv4-io-oper',
+    'ipv6': 'http://cisco.com/ns/yang/Cisco-IOS-XR-ipv6-ma-oper',
+    'rsi': 'http://cisco.com/ns/yang/Cisco-IOS-XR-infra-rsi-cfg',
+    'bgp': 'http://cisco.com/ns/yang/Cisco-IOS-XR-ipv4-bgp-cfg',
+    'policymgr': 'http://cisco.com/ns/yang/Cisco-IOS-XR-infra-policymgr-cfg',
+    'if': 'urn:ietf:params:xml:ns:yang:ietf-interfaces',
+    'ios': 'http://cisco.com/ns/yang/Cisco-IOS-XE-native',
+    'ios-policy': 'http://cisco.com/ns/yang/Cisco-IOS-XE-policy',
+    'ios-bgp': 'http://cisco.com/ns/yang/Cisco-IOS-XE-bgp'
+}
+
+# vpn parameters
+ROUTER_NAMES = ET.XPath('//vpn:router-name', namespaces=NSMAP)
+
+# Junos replies, which have no namespaces. Junos pads the interface names with
+# newlines, so $interface has to be padded the same way.
+JUNOS_INTERFACE_NAMES = ET.XPath('//physical-interface/name')
+JUNOS_LOGICAL_INTERFACES = ET.XPath('//physical-interface[name=$interface]/logical-interface')
+JUNOS_ADMIN_STATUS = ET.XPath('//physical-interface[name=$interface]/admin-status')
+JUNOS_INSTANCE_NAMES = ET.XPath('//instance-name')
+JUNOS_ROUTE_DISTINGUISHERS = ET.XPath('//route-distinguisher')
+JUNOS_COMMUNITY_MEMBERS = ET.XPath('//policy-options/community/members')
+JUNOS_POLICER_NAMES = ET.XPath('//firewall/policer/name')
+JUNOS_INSTANCE = ET.XPath('//routing-instances/instance[normalize-space(name)=$vrf]')
+
+# XR replies
+XR_INTERFACE_NAMES = ET.XPath('//ifmgr:interface/ifmgr:interface-name', namespaces=NSMAP)
+XR_INTERFACE = ET.XPath('//ifmgr:interface[ifmgr:interface-name=$interface]',
+    namespaces=NSMAP)
+XR_IPV4_INTERFACE_NAMES = ET.XPath('//ipv4:interface-name', namespaces=NSMAP)
+XR_IPV6_INTERFACE_NAMES = ET.XPath('//ipv6:interface-name', namespaces=NSMAP)
+XR_VRF_NAMES = ET.XPath('//rsi:vrf-name', namespaces=NSMAP)
+XR_ROUTE_DISTINGUISHERS = ET.XPath('//bgp:route-distinguisher', namespaces=NSMAP)
+XR_IMPORT_ROUTE_TARGETS = ET.XPath('''//rsi:vrfs//bgp:import-route-targets/
+    bgp:route-targets/bgp:route-target/bgp:as-or-four-byte-as''', namespaces=NSMAP)
+XR_POLICY_MAP_NAMES = ET.XPath('//policymgr:name', namespaces=NSMAP)
+XR_VRF = ET.XPath('//rsi:vrfs/rsi:vrf[rsi:vrf-name=$vrf]', namespaces=NSMAP)
+XR_VRF_INTERFACE_NAMES = ET.XPath('//ifcfg:interface-configuration[rsi:vrf=$vrf]/'
+    'ifcfg:interface-name', namespaces=NSMAP)
+XR_BGP_VRF = ET.XPath('//bgp:four-byte-as/bgp:vrfs/bgp:vrf[bgp:vrf-name=$vrf]',
+    namespaces=NSMAP)
+
+# IOS-XE replies. The native model has one interface list per type, so an
+# interface is looked up with its $type and $number, see drivers.ios_interface_name.
+IOS_INTERFACE_NAMES = ET.XPath('//if:interfaces-state/if:interface/if:name',
+    namespaces=NSMAP)
+IOS_ADMIN_STATUS = ET.XPath('//if:interfaces-state/if:interface[if:name=$interface]/'
+    'if:admin-status', namespaces=NSMAP)
+IOS_INTERFACE = ET.XPath('//ios:native/ios:interface/*[local-name()=$type]'
+    '[ios:name=$number]', namespaces=NSMAP)
+IOS_VRF_NAMES = ET.XPath('//ios:vrf/ios:definition/ios:name', namespaces=NSMAP)
+IOS_ROUTE_DISTINGUISHERS = ET.XPath('//ios:vrf/ios:definition/ios:rd', namespaces=NSMAP)
+IOS_IMPORT_ROUTE_TARGETS = ET.XPath('//ios:vrf/ios:definition//ios:route-target/'
+    'ios:import/ios:asn-ip', namespaces=NSMAP)
+IOS_POLICY_MAP_NAMES = ET.XPath('//ios:policy/ios-policy:policy-map/ios-policy:name',
+    namespaces=NSMAP)
+IOS_VRF = ET.XPath('//ios:vrf/ios:definition[ios:name=$vrf]', namespaces=NSMAP)
+IOS_VRF_INTERFACES = ET.XPath('//ios:native/ios:interface/*[ios:vrf/ios:forwarding=$vrf]',
+    namespaces=NSMAP)
+IOS_BGP_VRF_NEIGHBORS = ET.XPath('//ios-bgp:with-vrf/ios-bgp:ipv4/ios-bgp:vrf'
+    '[ios-bgp:name=$vrf]/ios-bgp:ipv4-unicast/ios-bgp:neighbor/ios-bgp:id', namespaces=NSMAP)